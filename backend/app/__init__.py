@@ -1,19 +1,50 @@
 import os
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_cors import CORS
 from app.config import Config
+from app.utils.json_provider import FastJSONProvider
+from app.utils.db_profile import configure_engine_options, install_connection_hooks
+from app.utils.replicas import ReplicaRouter, RoutingSession
+from app.utils.schema import ensure_schema
 
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def _init_migrate(app):
+    # Flask-Migrate pulls in Alembic and every SQLAlchemy dialect, a large
+    # share of import time; only the `flask db` commands need it.
+    if click.get_current_context(silent=True) is None:
+        return
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=app.config['MIGRATIONS_DIR'])
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.json = FastJSONProvider(app)
 
+    configure_engine_options(app)
+    replica_router = ReplicaRouter()
+    replica_router.configure(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    replica_router.init_app(app, db)
+    with app.app_context():
+        for engine in db.engines.values():
+            install_connection_hooks(engine, app.config)
+    _init_migrate(app)
+
+    from app.utils.principal_cache import PrincipalCache
+    PrincipalCache().init_app(app)
+
+    from app.utils.activity import ActivityRecorder
+    ActivityRecorder().init_app(app)
+
+    from app.utils.suggest import SuggestIndex
+    SuggestIndex().init_app(app)
+
+    from app.utils.response_cache import ResponseCache
+    ResponseCache().init_app(app)
 
     if app.config.get('FLASK_ENV') == 'development':
         CORS(app, origins='*', supports_credentials=True)
@@ -22,15 +53,24 @@ def create_app(config_class=Config):
 
     os.makedirs(app.config['FILE_STORAGE_PATH'], exist_ok=True)
 
+    from app.utils.storage_backends import init_storage
+    init_storage(app)
+
     with app.app_context():
-        from app.routes import auth, folders, files, users, search
+        from app.routes import auth, folders, files, uploads, users, search, batch, activity
 
         app.register_blueprint(auth.bp)
         app.register_blueprint(folders.bp)
         app.register_blueprint(files.bp)
+        app.register_blueprint(uploads.bp)
         app.register_blueprint(users.bp)
         app.register_blueprint(search.bp)
+        app.register_blueprint(batch.bp)
+        app.register_blueprint(activity.bp)
+
+        ensure_schema(app)
 
-        db.create_all()
+    from app.commands import register_commands
+    register_commands(app)
 
     return app
@@ -0,0 +1,88 @@
+import click
+
+def register_commands(app):
+    @app.cli.command('extract-pending')
+    @click.option('--limit', default=100, show_default=True, help='Maximum number of files to process.')
+    def extract_pending(limit):
+        """Extract text and metadata from uploaded PDFs still waiting for extraction."""
+        from app.services import extraction_service
+
+        processed = extraction_service.extract_pending(limit=limit)
+        click.echo(f'Processed {processed} pending file(s)')
+
+    @app.cli.command('purge-upload-sessions')
+    def purge_upload_sessions():
+        """Remove expired resumable upload sessions and their partial files."""
+        from app.services import upload_service
+
+        purged = upload_service.purge_expired_sessions()
+        click.echo(f'Purged {purged} expired upload session(s)')
+
+    @app.cli.command('rebuild-folder-paths')
+    def rebuild_folder_paths():
+        """Recompute the materialized folder paths used for ancestor and subtree queries."""
+        from app.services import folder_service
+
+        levels = folder_service.rebuild_folder_paths()
+        click.echo(f'Rebuilt folder paths for {levels} level(s)')
+
+    @app.cli.command('rebuild-folder-totals')
+    def rebuild_folder_totals():
+        """Recompute recursive folder sizes, file counts and last-modified times to repair drift."""
+        from app.services import folder_service
+
+        folders = folder_service.rebuild_folder_totals()
+        click.echo(f'Rebuilt totals for {folders} folder(s)')
+
+    @app.cli.command('rebuild-storage-usage')
+    def rebuild_storage_usage():
+        """Recompute every user's storage usage from the files they own."""
+        from app.services import quota_service
+
+        users = quota_service.rebuild_usage()
+        click.echo(f'Rebuilt storage usage for {users} user(s)')
+
+    @app.cli.command('migrate-storage')
+    @click.option('--to', 'target', type=click.Choice(['local', 's3']), default=None,
+                  help='Also copy every blob into this storage backend.')
+    @click.option('--batch-size', type=int, default=500, show_default=True, help='Files committed per transaction.')
+    def migrate_storage(target, batch_size):
+        """Move legacy date-path files into the content-addressed blob store, optionally copying blobs to another backend."""
+        from app.services import blob_service
+        from app.utils.storage_backends import create_storage
+
+        migrated, missing = blob_service.migrate_legacy_files(batch_size=batch_size)
+        click.echo(f'Migrated {migrated} legacy file(s), {missing} missing')
+
+        if target and target != app.config['STORAGE_BACKEND']:
+            copied = blob_service.copy_blobs(create_storage(app.config, target), batch_size=batch_size)
+            click.echo(f'Copied {copied} blob(s) to {target}; set STORAGE_BACKEND={target} to switch')
+
+    @app.cli.command('purge-deleted')
+    def purge_deleted():
+        """Remove deleted folders and files and unlink blobs nothing references any more."""
+        from app.services import purge_service
+
+        files, folders = purge_service.purge_deleted()
+        blobs = purge_service.collect_blobs()
+        click.echo(f'Purged {files} file(s) and {folders} folder(s), removed {blobs} blob(s)')
+
+    @app.cli.command('prune-activity')
+    @click.option('--days', type=int, default=None, help='Retention window in days (defaults to ACTIVITY_RETENTION_DAYS).')
+    @click.option('--archive', 'archive_path', default=None, help='Append pruned rows to this gzipped JSON-lines file.')
+    @click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+    def prune_activity(days, archive_path, batch_size):
+        """Delete raw activity older than the retention window, keeping the daily rollups."""
+        from app.services import activity_service
+
+        archive_path = archive_path or app.config['ACTIVITY_ARCHIVE_PATH']
+        removed = activity_service.prune_activity(days=days, batch_size=batch_size, archive_path=archive_path)
+        click.echo(f'Pruned {removed} activity event(s)')
+
+    @app.cli.command('rebuild-activity-rollups')
+    def rebuild_activity_rollups():
+        """Recompute daily activity rollups from the raw activity still retained."""
+        from app.services import activity_service
+
+        rows = activity_service.rebuild_rollups()
+        click.echo(f'Rebuilt {rows} activity rollup row(s)')
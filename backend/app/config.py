@@ -6,6 +6,34 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///dataroom.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Alembic migrations (`flask db`). DB_CREATE_ALL: 'auto' runs create_all at startup only on an empty
+    # database and stamps it at the migration head, 'always' runs it, 'never' leaves the schema to migrations.
+    _migrations_dir = os.environ.get('MIGRATIONS_DIR') or './migrations'
+    MIGRATIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), _migrations_dir))
+    DB_CREATE_ALL = os.environ.get('DB_CREATE_ALL') or 'auto'
+
+    # Read replicas for read-only requests (comma-separated URLs). Clients stay on the
+    # primary for REPLICA_STICKY_SECONDS after a write so they read their own changes,
+    # tracked by a cookie the frontend sends with its credentialed requests. Set
+    # REPLICA_COOKIE_SAMESITE=None (HTTPS only) when the frontend is on another site.
+    SQLALCHEMY_REPLICA_URIS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    REPLICA_COOKIE_SAMESITE = os.environ.get('REPLICA_COOKIE_SAMESITE') or 'Lax'
+
+    # Engine profiles, picked from the database URI (see app.utils.db_profile).
+    # SQLite: WAL lets readers run alongside the single writer; busy_timeout makes writers wait instead of failing.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE_MB = int(os.environ.get('SQLITE_MMAP_SIZE_MB', 256))
+    SQLITE_CACHE_SIZE_MB = int(os.environ.get('SQLITE_CACHE_SIZE_MB', 64))
+    # PostgreSQL: per-process connection pool; statement_timeout 0 disables it.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
     FRONTEND_URL = os.environ.get('FRONTEND_URL') or 'http://localhost:5173'
 
     _storage_path = os.environ.get('FILE_STORAGE_PATH') or './storage'
@@ -15,5 +43,50 @@ class Config:
 
     ALLOWED_EXTENSIONS = {'pdf'}
 
+    # Where blobs live: 'local' (under FILE_STORAGE_PATH) or 's3' (any S3-compatible service, needs boto3).
+    # Uploads are staged under FILE_STORAGE_PATH either way.
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    S3_BUCKET = os.environ.get('S3_BUCKET') or None
+    S3_PREFIX = os.environ.get('S3_PREFIX') or ''
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+    S3_REGION = os.environ.get('S3_REGION') or None
+
+    # Default per-user storage quota; 0 means unlimited. Admins can override it per user.
+    STORAGE_QUOTA_MB = int(os.environ.get('STORAGE_QUOTA_MB', 0))
+
+    # 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd) hands file bodies to the proxy.
+    SENDFILE_MODE = os.environ.get('SENDFILE_MODE') or None
+    SENDFILE_ACCEL_PREFIX = os.environ.get('SENDFILE_ACCEL_PREFIX') or '/protected-storage'
+
+    UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+
+    CONTENT_EXTRACTION_WORKERS = int(os.environ.get('CONTENT_EXTRACTION_WORKERS', 2))
+
+    # Background purge of deleted folders and files; 0 leaves it to `flask purge-deleted`.
+    PURGE_WORKERS = int(os.environ.get('PURGE_WORKERS', 1))
+    PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 500))
+
+    # Activity events are buffered per process and written in bulk.
+    ACTIVITY_FLUSH_SIZE = int(os.environ.get('ACTIVITY_FLUSH_SIZE', 500))
+    ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 5))
+    ACTIVITY_BUFFER_LIMIT = int(os.environ.get('ACTIVITY_BUFFER_LIMIT', 50000))
+    # Raw events older than this are pruned by `flask prune-activity`; daily rollups are kept.
+    ACTIVITY_RETENTION_DAYS = int(os.environ.get('ACTIVITY_RETENTION_DAYS', 365))
+    ACTIVITY_ARCHIVE_PATH = os.environ.get('ACTIVITY_ARCHIVE_PATH') or None
+
+    # Each process replays the name journal for search suggestions at most this often (seconds).
+    SUGGEST_POLL_INTERVAL = float(os.environ.get('SUGGEST_POLL_INTERVAL', 1))
+    SUGGEST_JOURNAL_RETENTION_HOURS = int(os.environ.get('SUGGEST_JOURNAL_RETENTION_HOURS', 24))
+
+    # Per-process budget for cached public GET responses; 0 disables caching (ETags are still sent).
+    RESPONSE_CACHE_MB = int(os.environ.get('RESPONSE_CACHE_MB', 64))
+
+    BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 5000))
+
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or SECRET_KEY
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=7)
+
+    PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000))
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
+    # How often each process checks the database for invalidated principals (role changes).
+    PRINCIPAL_CACHE_CHECK_SECONDS = float(os.environ.get('PRINCIPAL_CACHE_CHECK_SECONDS', 1))
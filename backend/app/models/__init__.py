@@ -1,6 +1,11 @@
 from app.models.user import User
+from app.models.blob import Blob
 from app.models.folder import Folder
 from app.models.file import File
-from app.models.activity_log import ActivityLog
+from app.models.file_content import FileContent, FilePage
+from app.models.upload_session import UploadSession, UploadChunk
+from app.models.activity_log import ActivityLog, ActivityRollup
+from app.models.name_change import NameChange
+from app.models.data_version import DataVersion
 
-__all__ = ['User', 'Folder', 'File', 'ActivityLog']
+__all__ = ['User', 'Blob', 'Folder', 'File', 'FileContent', 'FilePage', 'UploadSession', 'UploadChunk', 'ActivityLog', 'ActivityRollup', 'NameChange', 'DataVersion']
@@ -14,6 +14,12 @@ class ActivityLog(db.Model):
 
     user = db.relationship('User')
 
+    __table_args__ = (
+        db.Index('ix_activity_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_activity_resource_created', 'resource_type', 'resource_id', 'created_at', 'id'),
+        db.Index('ix_activity_action_created', 'action', 'created_at', 'id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -25,3 +31,28 @@ class ActivityLog(db.Model):
             'details': self.details,
             'created_at': self.created_at.isoformat() + 'Z' if self.created_at else None,
         }
+
+class ActivityRollup(db.Model):
+    """Event counts per resource, action and UTC day, maintained as activity is flushed"""
+    __tablename__ = 'activity_daily_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    resource_type = db.Column(db.String(50), primary_key=True)
+    # 0 stands in for events without a resource, since key columns cannot be NULL.
+    resource_id = db.Column(db.Integer, primary_key=True, default=0)
+    action = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_activity_rollups_resource_day', 'resource_type', 'resource_id', 'day'),
+        db.Index('ix_activity_rollups_action_day', 'action', 'day'),
+    )
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'resource_type': self.resource_type,
+            'resource_id': self.resource_id or None,
+            'action': self.action,
+            'count': self.count,
+        }
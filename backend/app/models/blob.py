@@ -0,0 +1,11 @@
+from datetime import datetime
+from app import db
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    storage_path = db.Column(db.String(512), nullable=False)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
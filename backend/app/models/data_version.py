@@ -0,0 +1,8 @@
+from app import db
+
+class DataVersion(db.Model):
+    """Counter per cache scope ('global', 'deletions', 'folder:<id>', 'file:<id>'), bumped by every write that changes what the scope's responses show"""
+    __tablename__ = 'data_versions'
+
+    scope = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
@@ -1,29 +1,44 @@
 from datetime import datetime
-import os
 from sqlalchemy import event
+from sqlalchemy.orm import validates
 from app import db
+from app.utils import names
+from app.models.blob import Blob
 
 class File(db.Model):
     __tablename__ = 'files'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
+    # Normalized form of name that uniqueness is enforced on; set whenever name is.
+    name_key = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     storage_path = db.Column(db.String(512), nullable=False)
     size_bytes = db.Column(db.BigInteger, nullable=False)
     mime_type = db.Column(db.String(100), nullable=False)
+    sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True, index=True)
     folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True, index=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Set when the file (or a containing folder) is deleted; the row is removed later by the purger.
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
 
     folder = db.relationship('Folder', back_populates='files')
     owner = db.relationship('User', back_populates='files')
 
     __table_args__ = (
-        db.UniqueConstraint('folder_id', 'name', 'owner_id', name='unique_file_name_per_folder'),
+        # Names are unique across all live files, as the services require.
+        db.Index('uq_files_name_key', 'name_key', unique=True,
+                 sqlite_where=db.text('deleted_at IS NULL'), postgresql_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_files_folder_uploaded', 'folder_id', 'uploaded_at', 'id'),
     )
 
+    @validates('name')
+    def _set_name_key(self, key, value):
+        self.name_key = names.name_key(value)
+        return value
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -31,6 +46,7 @@ class File(db.Model):
             'original_filename': self.original_filename,
             'size_bytes': self.size_bytes,
             'mime_type': self.mime_type,
+            'sha256': self.sha256,
             'folder_id': self.folder_id,
             'owner_id': self.owner_id,
             'owner_name': self.owner.name if self.owner else None,
@@ -40,11 +56,19 @@ class File(db.Model):
 
 @event.listens_for(File, 'before_delete')
 def delete_file_from_storage(mapper, connection, target):
-    """Delete physical file from storage when database record is deleted"""
+    """Release the file's blob reference; unreferenced blobs are unlinked later by the blob sweep"""
     from flask import current_app
     try:
-        full_path = os.path.join(current_app.config['FILE_STORAGE_PATH'], target.storage_path)
-        if os.path.exists(full_path):
-            os.remove(full_path)
+        if target.sha256:
+            blobs = Blob.__table__
+            connection.execute(
+                blobs.update()
+                .where(blobs.c.sha256 == target.sha256)
+                .values(ref_count=blobs.c.ref_count - 1)
+            )
+            return
+
+        from app.utils.storage import delete_file
+        delete_file(target.storage_path)
     except Exception as e:
         current_app.logger.error(f'Failed to delete file {target.storage_path}: {str(e)}')
@@ -0,0 +1,40 @@
+from datetime import datetime
+import json
+from sqlalchemy import event
+from app import db
+from app.models.file import File
+
+class FileContent(db.Model):
+    __tablename__ = 'file_contents'
+
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)
+    page_count = db.Column(db.Integer, nullable=True)
+    doc_metadata = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    extracted_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'file_id': self.file_id,
+            'status': self.status,
+            'page_count': self.page_count,
+            'metadata': json.loads(self.doc_metadata) if self.doc_metadata else {},
+            'error': self.error,
+            'extracted_at': self.extracted_at.isoformat() + 'Z' if self.extracted_at else None,
+        }
+
+class FilePage(db.Model):
+    __tablename__ = 'file_pages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id', ondelete='CASCADE'), nullable=False, index=True)
+    page_number = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+
+@event.listens_for(File, 'before_delete')
+def delete_extracted_content(mapper, connection, target):
+    """Drop extracted pages and metadata together with the file record"""
+    connection.execute(FilePage.__table__.delete().where(FilePage.file_id == target.id))
+    connection.execute(FileContent.__table__.delete().where(FileContent.file_id == target.id))
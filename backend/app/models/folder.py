@@ -1,25 +1,49 @@
 from datetime import datetime
-from sqlalchemy.orm import backref
+from sqlalchemy import event, select
+from sqlalchemy.orm import backref, attributes, validates
 from app import db
+from app.utils import names
 
 class Folder(db.Model):
     __tablename__ = 'folders'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
+    # Normalized form of name that uniqueness is enforced on; set whenever name is.
+    name_key = db.Column(db.String(255), nullable=False)
     parent_id = db.Column(db.Integer, db.ForeignKey('folders.id', ondelete='CASCADE'), nullable=True, index=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    # Materialized path of ancestor ids including this folder, e.g. '/1/5/9/'. Subtree range
+    # scans need bytewise ordering, hence the C collation; set_folder_path fills it in right
+    # after the insert, once the id is known.
+    path = db.Column(db.String(1024).with_variant(db.String(1024, collation='C'), 'postgresql'),
+                     nullable=False, default='', index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Set when the folder (or an ancestor) is deleted; the row is removed later by the purger.
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Recursive aggregates over the live files of the whole subtree, adjusted
+    # along the ancestor chain as files change; `flask rebuild-folder-totals` repairs drift.
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    file_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_modified = db.Column(db.DateTime, nullable=True)
 
     parent = db.relationship('Folder', remote_side=[id], backref=backref('subfolders', cascade='all, delete-orphan'))
     owner = db.relationship('User', back_populates='folders')
     files = db.relationship('File', back_populates='folder', cascade='all, delete-orphan')
 
     __table_args__ = (
-        db.UniqueConstraint('parent_id', 'name', 'owner_id', name='unique_folder_name_per_parent'),
+        # Names are unique across all live folders, as the services require.
+        db.Index('uq_folders_name_key', 'name_key', unique=True,
+                 sqlite_where=db.text('deleted_at IS NULL'), postgresql_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_folders_parent_created', 'parent_id', 'created_at', 'id'),
     )
 
+    @validates('name')
+    def _set_name_key(self, key, value):
+        self.name_key = names.name_key(value)
+        return value
+
     def to_dict(self, include_contents=False):
         result = {
             'id': self.id,
@@ -29,8 +53,38 @@ class Folder(db.Model):
             'owner_name': self.owner.name if self.owner else None,
             'created_at': self.created_at.isoformat() + 'Z' if self.created_at else None,
             'updated_at': self.updated_at.isoformat() + 'Z' if self.updated_at else None,
+            'total_bytes': self.total_bytes or 0,
+            'file_count': self.file_count or 0,
+            'last_modified': self.last_modified.isoformat() + 'Z' if self.last_modified else None,
         }
         if include_contents:
-            result['subfolders'] = [f.to_dict() for f in self.subfolders]
-            result['files'] = [f.to_dict() for f in self.files]
+            from app.utils.serializers import folder_contents, serialize_folder, serialize_file
+            subfolders, files = folder_contents(self.id)
+            result['subfolders'] = [serialize_folder(f) for f in subfolders]
+            result['files'] = [serialize_file(f) for f in files]
         return result
+
+    @property
+    def ancestor_ids(self):
+        return [int(i) for i in self.path.strip('/').split('/')[:-1]] if self.path else []
+
+    def is_within(self, other):
+        """True if this folder is other or one of its descendants"""
+        return bool(self.path and other.path and self.path.startswith(other.path))
+
+def subtree_range(path):
+    """Bounds [low, high) that select every path under (and including) the given one with an index range scan"""
+    return path, path[:-1] + '0'
+
+@event.listens_for(Folder, 'after_insert')
+def set_folder_path(mapper, connection, target):
+    folders = Folder.__table__
+    parent_path = '/'
+    if target.parent_id:
+        parent_path = connection.execute(
+            select(folders.c.path).where(folders.c.id == target.parent_id)
+        ).scalar() or '/'
+
+    path = f'{parent_path}{target.id}/'
+    connection.execute(folders.update().where(folders.c.id == target.id).values(path=path))
+    attributes.set_committed_value(target, 'path', path)
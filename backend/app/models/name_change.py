@@ -0,0 +1,20 @@
+from datetime import datetime
+from app import db
+
+class NameChange(db.Model):
+    """Journal of folder and file names appearing, changing or going away.
+
+    Rows are written by database triggers in the same transaction as the
+    change, and each process replays them to keep its suggestion index in step.
+    """
+    __tablename__ = 'name_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    # The new name, or NULL when the item was deleted.
+    name = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    # Ids must never be reused after old rows are trimmed, or readers would skip changes.
+    __table_args__ = {'sqlite_autoincrement': True}
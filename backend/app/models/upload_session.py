@@ -0,0 +1,41 @@
+from datetime import datetime
+from app import db
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(32), primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)
+    name = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)
+    temp_path = db.Column(db.String(512), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    chunks = db.relationship('UploadChunk', back_populates='session', cascade='all, delete-orphan',
+                             order_by='UploadChunk.offset')
+
+    def to_dict(self, received=None):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'filename': self.filename,
+            'folder_id': self.folder_id,
+            'total_size': self.total_size,
+            'received': received if received is not None else [],
+            'created_at': self.created_at.isoformat() + 'Z' if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() + 'Z' if self.expires_at else None,
+        }
+
+class UploadChunk(db.Model):
+    __tablename__ = 'upload_chunks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), nullable=False, index=True)
+    offset = db.Column(db.BigInteger, nullable=False)
+    length = db.Column(db.BigInteger, nullable=False)
+
+    session = db.relationship('UploadSession', back_populates='chunks')
@@ -12,10 +12,18 @@ class User(db.Model):
     role = db.Column(db.String(20), default='user', nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     last_login = db.Column(db.DateTime)
+    # Bytes of live files owned, kept up to date as files are added and deleted.
+    storage_used_bytes = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    # Per-user override of STORAGE_QUOTA_MB, in bytes.
+    storage_quota_bytes = db.Column(db.BigInteger, nullable=True)
 
     folders = db.relationship('Folder', back_populates='owner', cascade='all, delete-orphan')
     files = db.relationship('File', back_populates='owner', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_users_created', 'created_at', 'id'),
+    )
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -23,6 +31,7 @@ class User(db.Model):
         return check_password_hash(self.password_hash, password)
 
     def to_dict(self):
+        from app.services.quota_service import effective_quota
         return {
             'id': self.id,
             'email': self.email,
@@ -30,4 +39,6 @@ class User(db.Model):
             'role': self.role,
             'created_at': self.created_at.isoformat() + 'Z' if self.created_at else None,
             'last_login': self.last_login.isoformat() + 'Z' if self.last_login else None,
+            'storage_used_bytes': self.storage_used_bytes or 0,
+            'storage_quota_bytes': effective_quota(self.storage_quota_bytes),
         }
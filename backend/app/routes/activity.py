@@ -0,0 +1,77 @@
+import csv
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from app.utils.decorators import require_admin
+from app.services import activity_service
+from app.utils.pagination import get_page_args, time_key
+from app.utils.listing import listing_response, parse_fields, wants_stream
+from app.utils.serializers import serialize_activity
+
+bp = Blueprint('activity', __name__, url_prefix='/api/activity')
+
+CSV_COLUMNS = ['id', 'created_at', 'user_id', 'user_name', 'action', 'resource_type', 'resource_id', 'details']
+
+class _Line:
+    def write(self, value):
+        return value
+
+def _csv_cell(value):
+    # Neutralize cells a spreadsheet would otherwise evaluate as a formula.
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+@bp.route('', methods=['GET'])
+@require_admin
+def list_activity(user):
+    # Make this process's buffered events visible before reading.
+    current_app.extensions['activity_recorder'].flush()
+    stream = wants_stream(request.args)
+
+    try:
+        filters = activity_service.build_filters(request.args)
+        limit, cursor = get_page_args(request.args, 100, 1000)
+        return listing_response([
+            ('activity',
+             lambda after, n: activity_service.list_activity(filters, limit=n, after=after, stream=stream),
+             lambda row: time_key(row.created_at, row.id)),
+        ], cursor, limit, {'activity': serialize_activity},
+            fields=parse_fields(request.args), stream=stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/rollups', methods=['GET'])
+@require_admin
+def list_rollups(user):
+    current_app.extensions['activity_recorder'].flush()
+
+    try:
+        filters = activity_service.build_rollup_filters(request.args)
+        limit, _ = get_page_args(request.args, 1000, 10000)
+        group_by = request.args.get('group_by', 'day')
+        rollups = activity_service.get_rollups(filters, group_by=group_by, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'group_by': group_by, 'rollups': rollups})
+
+@bp.route('/export', methods=['GET'])
+@require_admin
+def export_activity(user):
+    current_app.extensions['activity_recorder'].flush()
+
+    try:
+        filters = activity_service.build_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        writer = csv.writer(_Line())
+        yield writer.writerow(CSV_COLUMNS).encode('utf-8')
+        for row in activity_service.iter_activity(filters):
+            item = serialize_activity(row)
+            item['created_at'] = item['created_at'].isoformat() + 'Z'
+            yield writer.writerow([_csv_cell(item[column]) for column in CSV_COLUMNS]).encode('utf-8')
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename=activity.csv'
+    return response
@@ -1,9 +1,10 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
 from app import db
 from app.models.user import User
 from app.utils.jwt_helper import generate_token
 from app.utils.decorators import require_auth
+from app.utils.db_profile import describe
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
@@ -11,6 +12,19 @@ bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 def health():
     return {'status': 'ok'}, 200
 
+@bp.route('/ready', methods=['GET'])
+def ready():
+    try:
+        settings = describe(db.engine)
+    except Exception as e:
+        current_app.logger.warning(f'Readiness check failed: {str(e)}')
+        return jsonify({'status': 'unavailable', 'profile': current_app.config['DB_PROFILE']}), 503
+
+    result = {'status': 'ready', 'profile': current_app.config['DB_PROFILE'], 'database': settings}
+    if current_app.config.get('STARTUP_SECONDS'):
+        result['startup_seconds'] = current_app.config['STARTUP_SECONDS']
+    return jsonify(result), 200
+
 @bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -75,4 +89,9 @@ def login():
 @bp.route('/me', methods=['GET'])
 @require_auth
 def get_me(user):
-    return jsonify({'user': user.to_dict()}), 200
+    current_user = User.query.get(user.id)
+
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+
+    return jsonify({'user': current_user.to_dict()}), 200
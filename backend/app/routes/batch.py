@@ -0,0 +1,36 @@
+from flask import Blueprint, request, jsonify, current_app
+from app.utils.decorators import require_auth
+from app.services import batch_service
+from app.utils.activity import record_activity
+
+bp = Blueprint('batch', __name__, url_prefix='/api/batch')
+
+@bp.route('', methods=['POST'])
+@require_auth
+def run_batch(user):
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    operations = data.get('operations')
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'A non-empty list of operations is required'}), 400
+
+    max_operations = current_app.config['BATCH_MAX_OPERATIONS']
+    if len(operations) > max_operations:
+        return jsonify({'error': f'A batch can contain at most {max_operations} operations'}), 400
+
+    try:
+        results, committed = batch_service.run_batch(operations, user.id, atomic=bool(data.get('atomic')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+
+    if committed:
+        for operation, result in zip(operations, results):
+            if result['status'] == 200 and operation['op'] in ('delete', 'get'):
+                action = 'delete' if operation['op'] == 'delete' else 'view'
+                record_activity(action, operation['type'], operation['id'], user, {'batch': True})
+
+    return jsonify({'results': results, 'committed': committed}), 200 if committed else 409
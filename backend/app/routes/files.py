@@ -1,76 +1,117 @@
-from flask import Blueprint, request, jsonify, send_file
-from app.utils.decorators import require_auth
-from app.services import file_service
-from app.utils.storage import get_file_path
+from flask import Blueprint, request, jsonify
+from app.utils.decorators import require_auth, optional_auth
+from app.utils.activity import record_activity
+from app.services import file_service, extraction_service, quota_service, version_service
+from app.utils.file_response import send_stored_file
+from app.utils.storage import discard_staged, FileTooLargeError
+from app.utils.response_cache import cached_response
+from app.utils.serializers import serialize_file, get_file_row
 
 bp = Blueprint('files', __name__, url_prefix='/api/files')
 
+def _reject_upload(staged, message):
+    if staged:
+        discard_staged(staged[0])
+    return jsonify({'error': message}), 400
+
 @bp.route('', methods=['POST'])
 @require_auth
 def upload_file(user):
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+    try:
+        quota_service.check_request_size(user.id, request.content_length)
+        if request.mimetype == 'multipart/form-data':
+            # Read once by receive_upload instead of being spooled by request.form.
+            fields, staged = file_service.receive_upload(request.stream, request.content_type, user.id)
+        else:
+            # Upload by hash alone needs no file part.
+            fields, staged = request.form, None
+    except (quota_service.QuotaExceededError, FileTooLargeError) as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
 
-    file = request.files['file']
+    sha256 = fields.get('sha256', '').strip().lower() or None
 
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    if not staged and not sha256:
+        return jsonify({'error': 'No file provided'}), 400
 
-    name = request.form.get('name', file.filename).strip()
-    folder_id = request.form.get('folder_id')
+    filename = staged[1] if staged else fields.get('filename', '').strip()
+    name = fields.get('name', filename).strip()
+    folder_id = fields.get('folder_id')
+
+    if not name:
+        return _reject_upload(staged, 'File name is required')
 
     if folder_id:
         try:
             folder_id = int(folder_id)
         except ValueError:
-            return jsonify({'error': 'Invalid folder_id'}), 400
+            return _reject_upload(staged, 'Invalid folder_id')
 
     try:
-        file_obj = file_service.upload_file(file, name, user.id, folder_id)
+        if staged:
+            file_obj = file_service.upload_file(staged, name, user.id, folder_id, sha256=sha256)
+        else:
+            file_obj = file_service.upload_file_by_hash(sha256, name, filename, user.id, folder_id)
+            if not file_obj:
+                return jsonify({'error': 'Unknown content hash, upload the file contents instead'}), 404
+        record_activity('upload', 'file', file_obj.id, user, {'name': file_obj.name, 'size_bytes': file_obj.size_bytes})
         return jsonify({'file': file_obj.to_dict()}), 201
+    except quota_service.QuotaExceededError as e:
+        return jsonify({'error': str(e)}), 413
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except PermissionError as e:
         return jsonify({'error': str(e)}), 403
 
 @bp.route('/<int:file_id>', methods=['GET'])
-def get_file(file_id):
-    file_obj = file_service.get_file_by_id(file_id)
+@optional_auth
+def get_file(user, file_id):
+    def build():
+        row = get_file_row(file_id)
 
-    if not file_obj:
-        return jsonify({'error': 'File not found'}), 404
+        if not row:
+            return jsonify({'error': 'File not found'}), 404
+
+        return jsonify({'file': serialize_file(row)}), 200
 
-    return jsonify({'file': file_obj.to_dict()}), 200
+    response = cached_response([version_service.file_scope(file_id), version_service.DELETIONS], build)
+    if response.status_code in (200, 304):
+        record_activity('view', 'file', file_id, user)
+    return response
+
+@bp.route('/<int:file_id>/content', methods=['GET'])
+def get_file_content(file_id):
+    content = extraction_service.get_file_content(file_id)
+
+    if not content:
+        return jsonify({'error': 'File content not found'}), 404
+
+    return jsonify({'content': content.to_dict()}), 200
 
 @bp.route('/<int:file_id>/download', methods=['GET'])
-def download_file(file_id):
+@optional_auth
+def download_file(user, file_id):
     file_obj = file_service.get_file_by_id(file_id)
 
     if not file_obj:
         return jsonify({'error': 'File not found'}), 404
 
-    file_path = get_file_path(file_obj.storage_path)
-
-    return send_file(
-        file_path,
-        as_attachment=True,
-        download_name=file_obj.original_filename,
-        mimetype=file_obj.mime_type
-    )
+    record_activity('download', 'file', file_id, user)
+    return send_stored_file(file_obj, as_attachment=True)
 
 @bp.route('/<int:file_id>/preview', methods=['GET'])
-def preview_file(file_id):
+@optional_auth
+def preview_file(user, file_id):
     file_obj = file_service.get_file_by_id(file_id)
 
     if not file_obj:
         return jsonify({'error': 'File not found'}), 404
 
-    file_path = get_file_path(file_obj.storage_path)
-
-    return send_file(
-        file_path,
-        mimetype=file_obj.mime_type
-    )
+    record_activity('view', 'file', file_id, user, {'preview': True})
+    return send_stored_file(file_obj)
 
 @bp.route('/<int:file_id>', methods=['PUT'])
 @require_auth
@@ -102,6 +143,7 @@ def delete_file(user, file_id):
         success = file_service.delete_file_by_id(file_id, user.id)
         if not success:
             return jsonify({'error': 'File not found'}), 404
+        record_activity('delete', 'file', file_id, user)
         return jsonify({'message': 'File deleted successfully'}), 200
     except PermissionError as e:
         return jsonify({'error': str(e)}), 403
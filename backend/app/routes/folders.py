@@ -1,6 +1,14 @@
-from flask import Blueprint, request, jsonify
+from urllib.parse import quote
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
 from app.utils.decorators import require_auth, optional_auth
-from app.services import folder_service, file_service
+from app.utils.activity import record_activity
+from app.services import folder_service, file_service, search_service, version_service
+from app.utils.pagination import get_page_args, time_key
+from app.utils.listing import listing_response, parse_fields, wants_stream
+from app.utils.serializers import serialize_folder, serialize_file, get_folder_row
+from app.utils.response_cache import cached_response
+from app.utils.zip_stream import stream_zip
+from app.utils.storage_backends import get_storage
 
 bp = Blueprint('folders', __name__, url_prefix='/api/folders')
 
@@ -8,36 +16,112 @@ bp = Blueprint('folders', __name__, url_prefix='/api/folders')
 @optional_auth
 def list_folders(user):
     owned_only = request.args.get('owned', 'false').lower() == 'true'
-    limit = min(int(request.args.get('limit', 100)), 1000)
-    offset = int(request.args.get('offset', 0))
 
     if owned_only and not user:
         return jsonify({'error': 'Authentication required for owned filter'}), 401
 
     owner_id = user.id if owned_only and user else None
-    folders = folder_service.get_root_folders(owner_id=owner_id, limit=limit, offset=offset)
-    files = file_service.get_root_files(owner_id=owner_id, limit=limit, offset=offset)
-
-    return jsonify({
-        'folders': [f.to_dict() for f in folders],
-        'files': [f.to_dict() for f in files],
-        'limit': limit,
-        'offset': offset
-    }), 200
+    stream = wants_stream(request.args)
+
+    def build():
+        try:
+            limit, cursor = get_page_args(request.args, 100, 1000)
+            return listing_response([
+                ('folders',
+                 lambda after, n: folder_service.get_root_folders(owner_id=owner_id, limit=n, after=after, stream=stream),
+                 lambda f: time_key(f.created_at, f.id)),
+                ('files',
+                 lambda after, n: file_service.get_root_files(owner_id=owner_id, limit=n, after=after, stream=stream),
+                 lambda f: time_key(f.uploaded_at, f.id)),
+            ], cursor, limit, {'folders': serialize_folder, 'files': serialize_file},
+                fields=parse_fields(request.args), stream=stream)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    return cached_response([version_service.GLOBAL], build, vary=(owner_id,))
 
 @bp.route('/<int:folder_id>', methods=['GET'])
-def get_folder(folder_id):
-    result = folder_service.get_folder_contents(folder_id)
+@optional_auth
+def get_folder(user, folder_id):
+    def build():
+        result = folder_service.get_folder_contents(folder_id)
+
+        if not result:
+            return jsonify({'error': 'Folder not found'}), 404
+
+        return jsonify({
+            'folder': serialize_folder(result['folder']),
+            'subfolders': [serialize_folder(f) for f in result['subfolders']],
+            'files': [serialize_file(f) for f in result['files']]
+        }), 200
+
+    response = cached_response(
+        [version_service.folder_scope(folder_id), version_service.DELETIONS], build
+    )
+    if response.status_code in (200, 304):
+        record_activity('view', 'folder', folder_id, user)
+    return response
+
+@bp.route('/<int:folder_id>/ancestors', methods=['GET'])
+def get_folder_ancestors(folder_id):
+    result = folder_service.get_ancestors(folder_id)
 
     if not result:
         return jsonify({'error': 'Folder not found'}), 404
 
+    folder, ancestors = result
+
     return jsonify({
-        'folder': result['folder'].to_dict(),
-        'subfolders': [f.to_dict() for f in result['subfolders']],
-        'files': [f.to_dict() for f in result['files']]
+        'folder': serialize_folder(folder),
+        'ancestors': [serialize_folder(f) for f in ancestors]
     }), 200
 
+@bp.route('/<int:folder_id>/download', methods=['GET'])
+@optional_auth
+def download_folder(user, folder_id):
+    folder = folder_service.get_folder_by_id(folder_id)
+
+    if not folder:
+        return jsonify({'error': 'Folder not found'}), 404
+
+    record_activity('download', 'folder', folder_id, user)
+
+    response = current_app.response_class(
+        stream_with_context(stream_zip(folder_service.archive_entries(folder), get_storage().open)),
+        mimetype='application/zip'
+    )
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(folder.name)}.zip"
+    return response
+
+@bp.route('/<int:folder_id>/search', methods=['GET'])
+def search_folder(folder_id):
+    query = request.args.get('q', '').strip()
+
+    if not query or len(query) < 2:
+        return jsonify({'error': 'Search query must be at least 2 characters'}), 400
+
+    folder = get_folder_row(folder_id)
+
+    if not folder:
+        return jsonify({'error': 'Folder not found'}), 404
+
+    try:
+        limit, cursor = get_page_args(request.args, 50, 500)
+        return listing_response([
+            ('folders',
+             lambda after, n: search_service.search_folders(query, limit=n, after=after, within=folder),
+             lambda pair: pair[1]),
+            ('files',
+             lambda after, n: search_service.search_files(query, limit=n, after=after, within=folder),
+             lambda pair: pair[1]),
+        ], cursor, limit, {
+            'folders': lambda pair: serialize_folder(pair[0]),
+            'files': lambda pair: serialize_file(pair[0]),
+        }, fields=parse_fields(request.args), stream=wants_stream(request.args),
+            query=query, folder=serialize_folder(folder))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @bp.route('', methods=['POST'])
 @require_auth
 def create_folder(user):
@@ -84,6 +168,30 @@ def update_folder(user, folder_id):
     except ValueError as e:
         return jsonify({'error': str(e)}), 409
 
+@bp.route('/<int:folder_id>/move', methods=['PUT'])
+@require_auth
+def move_folder(user, folder_id):
+    data = request.get_json()
+
+    if data is None or 'parent_id' not in data:
+        return jsonify({'error': 'Destination parent_id is required'}), 400
+
+    parent_id = data['parent_id']
+    if parent_id is not None and (not isinstance(parent_id, int) or isinstance(parent_id, bool)):
+        return jsonify({'error': 'parent_id must be a folder id or null'}), 400
+
+    try:
+        folder = folder_service.move_folder(folder_id, parent_id, user.id)
+        if not folder:
+            return jsonify({'error': 'Folder not found'}), 404
+        return jsonify({'folder': folder.to_dict()}), 200
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    except folder_service.DestinationNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+
 @bp.route('/<int:folder_id>', methods=['DELETE'])
 @require_auth
 def delete_folder(user, folder_id):
@@ -91,6 +199,7 @@ def delete_folder(user, folder_id):
         success = folder_service.delete_folder(folder_id, user.id)
         if not success:
             return jsonify({'error': 'Folder not found'}), 404
+        record_activity('delete', 'folder', folder_id, user)
         return jsonify({'message': 'Folder deleted successfully'}), 200
     except PermissionError as e:
         return jsonify({'error': str(e)}), 403
@@ -1,37 +1,68 @@
-from flask import Blueprint, request, jsonify
-from app.models.folder import Folder
-from app.models.file import File
-from sqlalchemy import or_
-from sqlalchemy.orm import joinedload
+from flask import Blueprint, request, jsonify, current_app
+from app.services import search_service, version_service
+from app.utils.pagination import get_page_args
+from app.utils.listing import listing_response, parse_fields, wants_stream
+from app.utils.response_cache import cached_response
+from app.utils.serializers import serialize_folder, serialize_file
 
 bp = Blueprint('search', __name__, url_prefix='/api/search')
 
+SEARCH_SCOPES = ('name', 'content')
+
+MAX_SUGGESTIONS = 50
+
+def _key(pair):
+    return pair[-1]
+
 @bp.route('', methods=['GET'])
 def search():
     query = request.args.get('q', '').strip()
-    limit = min(int(request.args.get('limit', 50)), 500)
-    offset = int(request.args.get('offset', 0))
+    scope = request.args.get('scope', 'name').lower()
 
     if not query or len(query) < 2:
         return jsonify({'error': 'Search query must be at least 2 characters'}), 400
 
-    search_pattern = f'%{query}%'
-
-    folders = Folder.query.options(joinedload(Folder.owner)).filter(
-        Folder.name.ilike(search_pattern)
-    ).order_by(Folder.name).limit(limit).offset(offset).all()
-
-    files = File.query.options(joinedload(File.owner)).filter(
-        or_(
-            File.name.ilike(search_pattern),
-            File.original_filename.ilike(search_pattern)
-        )
-    ).order_by(File.name).limit(limit).offset(offset).all()
-
-    return jsonify({
-        'query': query,
-        'folders': [f.to_dict() for f in folders],
-        'files': [f.to_dict() for f in files],
-        'limit': limit,
-        'offset': offset
-    }), 200
+    if scope not in SEARCH_SCOPES:
+        return jsonify({'error': 'Search scope must be either "name" or "content"'}), 400
+
+    def build():
+        try:
+            limit, cursor = get_page_args(request.args, 50, 500)
+            fields, stream = parse_fields(request.args), wants_stream(request.args)
+
+            if scope == 'content':
+                return listing_response([
+                    ('files', lambda after, n: search_service.search_content(query, limit=n, after=after), _key),
+                ], cursor, limit, {
+                    'files': lambda item: dict(serialize_file(item[0]), page_hits=item[1]),
+                }, fields=fields, stream=stream, query=query, scope=scope, folders=[])
+
+            return listing_response([
+                ('folders', lambda after, n: search_service.search_folders(query, limit=n, after=after), _key),
+                ('files', lambda after, n: search_service.search_files(query, limit=n, after=after), _key),
+            ], cursor, limit, {
+                'folders': lambda pair: serialize_folder(pair[0]),
+                'files': lambda pair: serialize_file(pair[0]),
+            }, fields=fields, stream=stream, query=query, scope=scope)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    scopes = [version_service.GLOBAL]
+    if scope == 'content':
+        scopes.append(version_service.CONTENT)
+    return cached_response(scopes, build)
+
+@bp.route('/suggest', methods=['GET'])
+def suggest():
+    prefix = request.args.get('q', '').strip()
+
+    if not prefix:
+        return jsonify({'error': 'Search query is required'}), 400
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), MAX_SUGGESTIONS))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    suggestions = current_app.extensions['suggest_index'].suggest(prefix, limit)
+    return jsonify({'query': prefix, 'suggestions': suggestions})
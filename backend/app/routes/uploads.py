@@ -0,0 +1,99 @@
+from flask import Blueprint, request, jsonify
+from app.utils.decorators import require_auth
+from app.utils.activity import record_activity
+from app.services import upload_service, quota_service
+
+bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
+
+def _session_response(upload, status=200):
+    return jsonify({'upload': upload.to_dict(upload_service.received_ranges(upload))}), status
+
+@bp.route('', methods=['POST'])
+@require_auth
+def create_upload(user):
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    filename = data.get('filename', '').strip()
+    name = data.get('name', filename).strip()
+    sha256 = data.get('sha256', '').strip().lower() or None
+    folder_id = data.get('folder_id')
+
+    if not filename or not name:
+        return jsonify({'error': 'File name is required'}), 400
+
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+
+    try:
+        upload = upload_service.create_session(name, filename, size, user.id, folder_id, sha256=sha256)
+        return _session_response(upload, 201)
+    except quota_service.QuotaExceededError as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+
+@bp.route('/<session_id>', methods=['GET'])
+@require_auth
+def get_upload(user, session_id):
+    try:
+        upload = upload_service.get_session(session_id, user.id)
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        return _session_response(upload)
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+
+@bp.route('/<session_id>', methods=['PUT'])
+@require_auth
+def put_chunk(user, session_id):
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Chunk offset is required'}), 400
+
+    if request.content_length is None:
+        return jsonify({'error': 'Content-Length is required'}), 411
+
+    try:
+        upload = upload_service.write_chunk(session_id, user.id, offset, request.stream, request.content_length)
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        return _session_response(upload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+
+@bp.route('/<session_id>/commit', methods=['POST'])
+@require_auth
+def commit_upload(user, session_id):
+    try:
+        file_obj = upload_service.commit_session(session_id, user.id)
+        if not file_obj:
+            return jsonify({'error': 'Upload not found'}), 404
+        record_activity('upload', 'file', file_obj.id, user, {'name': file_obj.name, 'size_bytes': file_obj.size_bytes})
+        return jsonify({'file': file_obj.to_dict()}), 201
+    except quota_service.QuotaExceededError as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+
+@bp.route('/<session_id>', methods=['DELETE'])
+@require_auth
+def abort_upload(user, session_id):
+    try:
+        success = upload_service.abort_session(session_id, user.id)
+        if not success:
+            return jsonify({'error': 'Upload not found'}), 404
+        return jsonify({'message': 'Upload cancelled'}), 200
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
@@ -1,23 +1,36 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models.user import User
 from app.utils.decorators import require_admin
+from app.utils.pagination import get_page_args, time_key, parse_time_key
+from app.utils.listing import listing_response, parse_fields, wants_stream
+from app.utils.serializers import STREAM_BATCH_SIZE
+from sqlalchemy import tuple_
 
 bp = Blueprint('users', __name__, url_prefix='/api/users')
 
 @bp.route('', methods=['GET'])
 @require_admin
 def list_users(user):
-    limit = min(int(request.args.get('limit', 100)), 1000)
-    offset = int(request.args.get('offset', 0))
+    stream = wants_stream(request.args)
 
-    users = User.query.order_by(User.created_at.desc()).limit(limit).offset(offset).all()
+    def fetch(after, count):
+        query = db.select(User)
+        if after:
+            query = query.where(tuple_(User.created_at, User.id) < parse_time_key(after))
+        query = query.order_by(User.created_at.desc(), User.id.desc()).limit(count)
+        if stream:
+            return db.session.scalars(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        return db.session.scalars(query).all()
 
-    return jsonify({
-        'users': [u.to_dict() for u in users],
-        'limit': limit,
-        'offset': offset
-    }), 200
+    try:
+        limit, cursor = get_page_args(request.args, 100, 1000)
+        return listing_response([
+            ('users', fetch, lambda u: time_key(u.created_at, u.id)),
+        ], cursor, limit, {'users': lambda u: u.to_dict()},
+            fields=parse_fields(request.args), stream=stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @bp.route('/<int:user_id>', methods=['GET'])
 @require_admin
@@ -49,5 +62,29 @@ def update_user_role(user, user_id):
 
     target_user.role = role
     db.session.commit()
+    current_app.extensions['principal_cache'].invalidate()
+
+    return jsonify({'user': target_user.to_dict()}), 200
+
+@bp.route('/<int:user_id>/quota', methods=['PUT'])
+@require_admin
+def update_user_quota(user, user_id):
+    data = request.get_json()
+
+    if not data or 'quota_bytes' not in data:
+        return jsonify({'error': 'quota_bytes is required'}), 400
+
+    quota = data['quota_bytes']
+
+    if quota is not None and (not isinstance(quota, int) or isinstance(quota, bool) or quota < 0):
+        return jsonify({'error': 'quota_bytes must be a non-negative integer or null'}), 400
+
+    target_user = db.session.get(User, user_id)
+
+    if not target_user:
+        return jsonify({'error': 'User not found'}), 404
+
+    target_user.storage_quota_bytes = quota
+    db.session.commit()
 
     return jsonify({'user': target_user.to_dict()}), 200
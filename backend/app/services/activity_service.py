@@ -0,0 +1,249 @@
+import gzip
+import json
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from flask import current_app
+from sqlalchemy import func, tuple_
+from app import db
+from app.models.activity_log import ActivityLog, ActivityRollup
+from app.utils import serializers
+from app.utils.pagination import parse_time_key
+from app.utils.upsert import dialect_insert
+
+ACTIONS = ('view', 'download', 'upload', 'delete')
+RESOURCE_TYPES = ('folder', 'file')
+
+def _parse_time(value, name):
+    try:
+        parsed = datetime.fromisoformat(value.strip().rstrip('Z'))
+    except ValueError:
+        raise ValueError(f'Invalid {name} timestamp')
+    return parsed.replace(tzinfo=None)
+
+def _parse_id(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}')
+
+def build_filters(args):
+    """Turn user_id, resource_type, resource_id, action, since and until query arguments into conditions"""
+    filters = []
+
+    if args.get('user_id'):
+        filters.append(ActivityLog.user_id == _parse_id(args['user_id'], 'user_id'))
+
+    if args.get('resource_type'):
+        if args['resource_type'] not in RESOURCE_TYPES:
+            raise ValueError('Resource type must be either "folder" or "file"')
+        filters.append(ActivityLog.resource_type == args['resource_type'])
+
+    if args.get('resource_id'):
+        if not args.get('resource_type'):
+            raise ValueError('resource_id requires resource_type')
+        filters.append(ActivityLog.resource_id == _parse_id(args['resource_id'], 'resource_id'))
+
+    if args.get('action'):
+        if args['action'] not in ACTIONS:
+            raise ValueError('Action must be one of: ' + ', '.join(ACTIONS))
+        filters.append(ActivityLog.action == args['action'])
+
+    if args.get('since'):
+        filters.append(ActivityLog.created_at >= _parse_time(args['since'], 'since'))
+
+    if args.get('until'):
+        filters.append(ActivityLog.created_at < _parse_time(args['until'], 'until'))
+
+    return filters
+
+def list_activity(filters, limit=100, after=None, stream=False):
+    """Activity rows newest first; after is the (created_at, id) keyset cursor of the previous page"""
+    query = serializers.activity_select().where(*filters)
+
+    if after:
+        query = query.where(tuple_(ActivityLog.created_at, ActivityLog.id) < parse_time_key(after))
+
+    return serializers.fetch_rows(
+        query.order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc()).limit(limit), stream
+    )
+
+def iter_activity(filters):
+    """Every matching activity row oldest first, read through a server-side cursor"""
+    return serializers.fetch_rows(
+        serializers.activity_select().where(*filters).order_by(ActivityLog.created_at, ActivityLog.id),
+        stream=True
+    )
+
+def _parse_day(value, name):
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f'Invalid {name} date')
+
+def rollup_events(connection, events):
+    """Add event dicts to the daily rollups on connection, as part of the caller's transaction"""
+    counts = Counter(
+        (event['created_at'].date(), event['resource_type'], event['resource_id'] or 0, event['action'])
+        for event in events
+    )
+    if not counts:
+        return
+
+    insert = dialect_insert(connection.dialect.name)
+    stmt = insert(ActivityRollup)
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=['day', 'resource_type', 'resource_id', 'action'],
+            set_={'count': ActivityRollup.count + stmt.excluded['count']}
+        ),
+        [
+            {'day': day, 'resource_type': resource_type, 'resource_id': resource_id, 'action': action, 'count': count}
+            for (day, resource_type, resource_id, action), count in counts.items()
+        ]
+    )
+
+def rebuild_rollups():
+    """Recompute rollups from raw activity for every day still held in full. Returns the number of rollup rows written.
+
+    Days before the oldest remaining raw event were pruned by retention and
+    only live on in their rollups, so those are left untouched.
+    """
+    first = db.session.execute(db.select(func.min(ActivityLog.created_at))).scalar()
+    if first is None:
+        return 0
+
+    first_day = first.date()
+    day = func.date(ActivityLog.created_at)
+    db.session.execute(db.delete(ActivityRollup).where(ActivityRollup.day >= first_day))
+    result = db.session.execute(
+        db.insert(ActivityRollup).from_select(
+            ['day', 'resource_type', 'resource_id', 'action', 'count'],
+            db.select(
+                day,
+                ActivityLog.resource_type,
+                func.coalesce(ActivityLog.resource_id, 0),
+                ActivityLog.action,
+                func.count()
+            ).group_by(day, ActivityLog.resource_type, func.coalesce(ActivityLog.resource_id, 0), ActivityLog.action)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+def retention_cutoff(days):
+    """Midnight UTC `days` days ago, so pruning always removes whole days"""
+    if days <= 0:
+        raise ValueError('Retention must be at least one day')
+    today = datetime.combine(datetime.utcnow().date(), time.min)
+    return today - timedelta(days=days)
+
+def prune_activity(days=None, batch_size=None, archive_path=None):
+    """Delete raw activity older than the retention window in batches. Returns the number of rows removed.
+
+    With archive_path set, each batch is appended to that file as gzipped
+    JSON lines before it is deleted. Daily rollups are kept.
+    """
+    cutoff = retention_cutoff(days or current_app.config['ACTIVITY_RETENTION_DAYS'])
+    batch_size = batch_size or current_app.config['PURGE_BATCH_SIZE']
+    archive = gzip.open(archive_path, 'at', encoding='utf-8') if archive_path else None
+
+    # Flush buffered events first so none arrive behind the sweep.
+    current_app.extensions['activity_recorder'].flush()
+
+    removed = 0
+    try:
+        while True:
+            rows = db.session.execute(
+                db.select(ActivityLog.__table__)
+                .where(ActivityLog.created_at < cutoff)
+                .order_by(ActivityLog.id)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+
+            if archive:
+                for row in rows:
+                    archive.write(json.dumps(dict(row), default=_archive_value) + '\n')
+                archive.flush()
+
+            db.session.execute(
+                db.delete(ActivityLog).where(ActivityLog.id.in_([row['id'] for row in rows]))
+            )
+            db.session.commit()
+            removed += len(rows)
+
+            if len(rows) < batch_size:
+                break
+    finally:
+        if archive:
+            archive.close()
+
+    return removed
+
+def _archive_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    raise TypeError(f'Cannot archive {type(value).__name__}')
+
+def build_rollup_filters(args):
+    """Turn resource_type, resource_id, action, since and until (YYYY-MM-DD) query arguments into rollup conditions"""
+    filters = []
+
+    if args.get('resource_type'):
+        if args['resource_type'] not in RESOURCE_TYPES:
+            raise ValueError('Resource type must be either "folder" or "file"')
+        filters.append(ActivityRollup.resource_type == args['resource_type'])
+
+    if args.get('resource_id'):
+        if not args.get('resource_type'):
+            raise ValueError('resource_id requires resource_type')
+        filters.append(ActivityRollup.resource_id == _parse_id(args['resource_id'], 'resource_id'))
+
+    if args.get('action'):
+        if args['action'] not in ACTIONS:
+            raise ValueError('Action must be one of: ' + ', '.join(ACTIONS))
+        filters.append(ActivityRollup.action == args['action'])
+
+    if args.get('since'):
+        filters.append(ActivityRollup.day >= _parse_day(args['since'], 'since'))
+
+    if args.get('until'):
+        filters.append(ActivityRollup.day <= _parse_day(args['until'], 'until'))
+
+    return filters
+
+def get_rollups(filters, group_by='day', limit=1000):
+    """Summed counts per day and action, or per resource and action (busiest first)"""
+    total = func.sum(ActivityRollup.count).label('count')
+
+    if group_by == 'day':
+        query = (
+            db.select(ActivityRollup.day, ActivityRollup.action, total)
+            .where(*filters)
+            .group_by(ActivityRollup.day, ActivityRollup.action)
+            .order_by(ActivityRollup.day, ActivityRollup.action)
+        )
+        return [
+            {'day': row.day.isoformat(), 'action': row.action, 'count': row.count}
+            for row in db.session.execute(query.limit(limit))
+        ]
+
+    if group_by == 'resource':
+        query = (
+            db.select(ActivityRollup.resource_type, ActivityRollup.resource_id, ActivityRollup.action, total)
+            .where(*filters)
+            .group_by(ActivityRollup.resource_type, ActivityRollup.resource_id, ActivityRollup.action)
+            .order_by(total.desc(), ActivityRollup.resource_type, ActivityRollup.resource_id, ActivityRollup.action)
+        )
+        return [
+            {
+                'resource_type': row.resource_type,
+                'resource_id': row.resource_id or None,
+                'action': row.action,
+                'count': row.count,
+            }
+            for row in db.session.execute(query.limit(limit))
+        ]
+
+    raise ValueError('group_by must be either "day" or "resource"')
@@ -0,0 +1,234 @@
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.folder import Folder
+from app.models.file import File
+from app.services import folder_service, file_service, purge_service
+from app.utils import serializers
+from app.utils.names import name_key
+
+OPERATIONS = ('get', 'move', 'rename', 'delete')
+
+MODELS = {'folder': Folder, 'file': File}
+
+_PROJECTIONS = {
+    'folder': (serializers.folder_select, serializers.serialize_folder),
+    'file': (serializers.file_select, serializers.serialize_file),
+}
+
+# Per-operation status for each exception raised while applying an operation.
+_STATUSES = ((LookupError, 404), (PermissionError, 403), (ValueError, 409))
+
+def _parse(operation):
+    if not isinstance(operation, dict):
+        raise ValueError('Operation must be an object')
+
+    op, kind, item_id = operation.get('op'), operation.get('type'), operation.get('id')
+
+    if op not in OPERATIONS:
+        raise ValueError('Operation must be one of: ' + ', '.join(OPERATIONS))
+    if kind not in MODELS:
+        raise ValueError('Type must be either "folder" or "file"')
+    if not isinstance(item_id, int) or isinstance(item_id, bool):
+        raise ValueError('Operation id must be an integer')
+
+    arg = None
+    if op == 'rename':
+        arg = operation.get('name')
+        arg = arg.strip() if isinstance(arg, str) else ''
+        if not arg:
+            raise ValueError(f'{kind.capitalize()} name is required')
+    elif op == 'move':
+        key = 'parent_id' if kind == 'folder' else 'folder_id'
+        if key not in operation:
+            raise ValueError(f'Destination {key} is required')
+        arg = operation[key]
+        if arg is not None and (not isinstance(arg, int) or isinstance(arg, bool)):
+            raise ValueError(f'Destination {key} must be an integer or null')
+
+    return op, kind, item_id, arg
+
+def _load(parsed):
+    """Fetch every referenced file and folder, and the name keys that renames would collide with, in a few set-based queries"""
+    file_ids = {item_id for op, kind, item_id, _ in parsed if kind == 'file'}
+    files = {f.id: f for f in File.query.filter(File.id.in_(file_ids), File.deleted_at.is_(None))} if file_ids else {}
+
+    folder_ids = {item_id for op, kind, item_id, _ in parsed if kind == 'folder'}
+    folder_ids |= {arg for op, _, _, arg in parsed if op == 'move' and arg is not None}
+    folder_ids |= {f.folder_id for f in files.values() if f.folder_id}
+    folders = {f.id: f for f in Folder.query.filter(Folder.id.in_(folder_ids), Folder.deleted_at.is_(None))} if folder_ids else {}
+
+    taken = {}
+    for kind, model in MODELS.items():
+        keys = {name_key(arg) for op, k, _, arg in parsed if op == 'rename' and k == kind}
+        taken[kind] = {}
+        if keys:
+            for row_id, key in db.session.execute(
+                db.select(model.id, model.name_key).where(model.name_key.in_(keys), model.deleted_at.is_(None))
+            ):
+                taken[kind].setdefault(key, set()).add(row_id)
+
+    return {'folder': folders, 'file': files}, taken
+
+class _Batch:
+    def __init__(self, objects, taken, user_id):
+        self.objects = objects
+        self.taken = taken
+        self.user_id = user_id
+        self.deleted = {'folder': set(), 'file': set()}
+        self.deleted_paths = []
+        # Name keys given up by items earlier in this batch.
+        self.released = {'folder': set(), 'file': set()}
+
+    def _in_deleted_folder(self, folder):
+        return any(folder.path.startswith(path) for path in self.deleted_paths)
+
+    def _lookup(self, kind, item_id):
+        obj = self.objects[kind].get(item_id)
+        if not obj or item_id in self.deleted[kind]:
+            return None
+        folder = obj if kind == 'folder' else self.objects['folder'].get(obj.folder_id)
+        if folder and self._in_deleted_folder(folder):
+            return None
+        return obj
+
+    def _destination(self, folder_id):
+        if folder_id is None:
+            return None
+        parent = self._lookup('folder', folder_id)
+        if not parent:
+            raise ValueError('Destination folder not found')
+        if parent.owner_id != self.user_id:
+            raise PermissionError('You can only move items into your own folders')
+        return parent
+
+    def _release(self, kind, ids):
+        """Give up the name keys held by the given items, so later renames in the batch may take them"""
+        for key, holders in self.taken[kind].items():
+            if holders & ids:
+                holders -= ids
+                self.released[kind].add(key)
+
+    def _release_subtree(self, folder):
+        """Release the name keys of a folder and everything in it that a rename in the batch asks for"""
+        self._release('folder', {folder.id})
+        subtree = folder_service.subtree_filter(folder)
+        candidates = {kind: set().union(*self.taken[kind].values()) for kind in MODELS}
+        if candidates['folder']:
+            self._release('folder', set(db.session.scalars(
+                db.select(Folder.id).where(Folder.id.in_(candidates['folder']), *subtree)
+            )))
+        if candidates['file']:
+            self._release('file', set(db.session.scalars(
+                db.select(File.id).where(
+                    File.id.in_(candidates['file']),
+                    File.folder_id.in_(db.select(Folder.id).where(*subtree)),
+                )
+            )))
+
+    def apply(self, op, kind, item_id, arg):
+        obj = self._lookup(kind, item_id)
+
+        if not obj:
+            raise LookupError(f'{kind.capitalize()} not found')
+
+        if op == 'get':
+            return
+
+        if obj.owner_id != self.user_id:
+            raise PermissionError(f'You do not have permission to {op} this {kind}')
+
+        if op == 'rename':
+            key = name_key(arg)
+            if self.taken[kind].get(key, set()) - {obj.id}:
+                raise ValueError(f'A {kind} with this name already exists')
+            if key in self.released[kind]:
+                # The unit of work writes renames in primary key order, so flush the
+                # change that freed this name before the unique index sees it reused.
+                db.session.flush()
+            self.taken[kind].get(obj.name_key, set()).discard(obj.id)
+            self.released[kind].add(obj.name_key)
+            self.taken[kind].setdefault(key, set()).add(obj.id)
+            if kind == 'file':
+                file_service.rename_file(obj, arg)
+            else:
+                folder_service.rename_folder(obj, arg)
+
+        elif op == 'move' and kind == 'file':
+            file_service.move_file(obj, self._destination(arg))
+
+        elif op == 'move':
+            parent = self._destination(arg)
+            if parent and parent.is_within(obj):
+                raise ValueError('Cannot move a folder into itself or one of its subfolders')
+            folder_service.move_subtree(obj, parent)
+
+        elif op == 'delete':
+            if kind == 'folder':
+                self._release_subtree(obj)
+                self.deleted_paths.append(obj.path)
+                folder_service.remove_folder(obj)
+            else:
+                self._release('file', {obj.id})
+                file_service.remove_file(obj)
+            self.deleted[kind].add(obj.id)
+
+def _serialize_results(results, parsed_at, deleted):
+    """Attach the current state of every surviving item, one projection query per type"""
+    for kind, (select, serialize) in _PROJECTIONS.items():
+        ids = list({
+            item_id for i, (op, k, item_id, _) in parsed_at.items()
+            if k == kind and results[i]['status'] == 200 and op != 'delete'
+        })
+        rows = {row.id: serialize(row) for row in serializers.rows_by_ids(select(), MODELS[kind].id, ids)}
+        for i, (op, k, item_id, _) in parsed_at.items():
+            if k == kind and results[i]['status'] == 200 and op != 'delete':
+                if item_id in rows and item_id not in deleted[kind]:
+                    results[i][kind] = rows[item_id]
+
+def run_batch(operations, user_id, atomic=False):
+    """Apply a list of operations in one transaction and return (results, committed).
+
+    Each result carries an HTTP-style status for its operation. Failed
+    operations are skipped; with atomic set, any failure rolls back the whole
+    batch and the operations that would have succeeded report 424.
+    """
+    results = [None] * len(operations)
+    parsed_at = {}
+
+    for i, operation in enumerate(operations):
+        try:
+            parsed_at[i] = _parse(operation)
+        except ValueError as e:
+            results[i] = {'index': i, 'status': 400, 'error': str(e)}
+
+    objects, taken = _load(list(parsed_at.values()))
+    batch = _Batch(objects, taken, user_id)
+
+    for i, parsed in parsed_at.items():
+        try:
+            batch.apply(*parsed)
+            results[i] = {'index': i, 'status': 200}
+        except (LookupError, PermissionError, ValueError) as e:
+            status = next(code for error, code in _STATUSES if isinstance(e, error))
+            results[i] = {'index': i, 'status': status, 'error': str(e)}
+
+    failed = any(result['status'] != 200 for result in results)
+
+    if atomic and failed:
+        db.session.rollback()
+        for result in results:
+            if result['status'] == 200:
+                result.update(status=424, error='Not applied because another operation failed')
+        return results, False
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise ValueError('Batch conflicts with concurrent changes, nothing was applied')
+
+    if batch.deleted['folder'] or batch.deleted['file']:
+        purge_service.schedule_purge()
+
+    _serialize_results(results, parsed_at, batch.deleted)
+    return results, True
@@ -0,0 +1,131 @@
+import os
+import shutil
+from flask import current_app
+from app import db
+from app.models.blob import Blob
+from app.models.file import File
+from app.services import version_service
+from app.utils.storage import blob_storage_path, create_temp_file, delete_file, discard_staged, hash_file
+from app.utils.storage_backends import get_storage
+from app.utils.upsert import dialect_insert
+
+def acquire_blob(sha256, size_bytes):
+    """Take a reference on the blob for sha256, registering it if it is new.
+
+    The upsert locks the blob row for the rest of the transaction, so a
+    concurrent release of the last reference cannot delete it underneath us.
+    """
+    insert = dialect_insert(db.session.get_bind().dialect.name)
+    stmt = insert(Blob).values(
+        sha256=sha256,
+        storage_path=blob_storage_path(sha256),
+        size_bytes=size_bytes,
+        ref_count=1
+    ).on_conflict_do_update(
+        index_elements=['sha256'],
+        set_={'ref_count': Blob.ref_count + 1}
+    )
+    db.session.execute(stmt)
+    return db.session.get(Blob, sha256, populate_existing=True)
+
+def acquire_existing_blob(sha256):
+    result = db.session.execute(
+        db.update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count + 1)
+    )
+    if result.rowcount == 0:
+        return None
+    return db.session.get(Blob, sha256, populate_existing=True)
+
+def discard_unreferenced_blob(sha256):
+    """Delete the stored object for sha256 if no blob row refers to it, as after an upload that rolled back"""
+    if db.session.get(Blob, sha256) is None:
+        delete_file(blob_storage_path(sha256))
+
+def _save_copy(storage, key, path):
+    """Store a copy of the local file at path under key, leaving path in place"""
+    temp_path = create_temp_file()
+    try:
+        shutil.copyfile(path, temp_path)
+        storage.save(key, temp_path)
+    finally:
+        discard_staged(temp_path)
+
+def migrate_legacy_files(batch_size=500):
+    """Move files stored before content addressing into the blob store, batch by batch.
+
+    Each batch is hashed, copied to its blob key and committed with the new
+    storage paths before the old copies are deleted, so an interrupted run
+    can simply be started again. Returns (migrated, missing).
+    """
+    storage = get_storage()
+    migrated = missing = 0
+    after = 0
+
+    while True:
+        rows = (
+            File.query.filter(File.sha256.is_(None), File.id > after)
+            .order_by(File.id).limit(batch_size).all()
+        )
+        if not rows:
+            return migrated, missing
+        after = rows[-1].id
+
+        moved, ids = [], []
+        for file_obj in rows:
+            try:
+                with storage.local_copy(file_obj.storage_path) as path:
+                    digest = hash_file(path)
+                    size = os.path.getsize(path)
+                    key = blob_storage_path(digest)
+                    if not storage.exists(key):
+                        _save_copy(storage, key, path)
+            except FileNotFoundError:
+                current_app.logger.warning(f'Skipping file {file_obj.id}: {file_obj.storage_path} is missing')
+                missing += 1
+                continue
+
+            acquire_blob(digest, size)
+            moved.append(file_obj.storage_path)
+            ids.append(file_obj.id)
+            file_obj.sha256 = digest
+            file_obj.storage_path = key
+
+        if ids:
+            version_service.bump(files=ids, listings=True)
+        db.session.commit()
+
+        for old_path in moved:
+            storage.delete(old_path)
+        migrated += len(moved)
+
+def copy_blobs(target, batch_size=500):
+    """Copy every blob into another storage backend, skipping ones already there. Returns the number copied.
+
+    Run migrate_legacy_files first so every file is backed by a blob, then
+    switch STORAGE_BACKEND to the target once the copy is complete.
+    """
+    storage = get_storage()
+    copied = 0
+    after = ''
+
+    while True:
+        rows = db.session.execute(
+            db.select(Blob.sha256, Blob.storage_path, Blob.size_bytes)
+            .where(Blob.sha256 > after)
+            .order_by(Blob.sha256).limit(batch_size)
+        ).all()
+        db.session.commit()
+        if not rows:
+            return copied
+        after = rows[-1].sha256
+
+        for row in rows:
+            if target.stat(row.storage_path) == row.size_bytes:
+                continue
+            try:
+                with storage.local_copy(row.storage_path) as path:
+                    _save_copy(target, row.storage_path, path)
+            except FileNotFoundError:
+                current_app.logger.warning(f'Skipping blob {row.sha256}: content is missing')
+                continue
+            copied += 1
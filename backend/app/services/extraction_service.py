@@ -0,0 +1,152 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models.file import File
+from app.models.file_content import FileContent, FilePage
+from app.services import version_service
+from app.utils.storage_backends import get_storage
+
+METADATA_FIELDS = {
+    '/Title': 'title',
+    '/Author': 'author',
+    '/Subject': 'subject',
+    '/Keywords': 'keywords',
+    '/Creator': 'creator',
+    '/Producer': 'producer',
+    '/CreationDate': 'creation_date',
+    '/ModDate': 'modification_date',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf-extract')
+        return _executor
+
+def enqueue_extraction(file_id):
+    """Record a pending extraction job. Must be called inside the upload transaction."""
+    db.session.add(FileContent(file_id=file_id, status='pending'))
+
+def schedule_extraction(file_id):
+    """Hand a committed file to the extraction workers, or extract inline when workers are disabled."""
+    workers = current_app.config.get('CONTENT_EXTRACTION_WORKERS', 0)
+    if workers <= 0:
+        extract_file(file_id)
+        return
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            extract_file(file_id)
+
+    _get_executor(workers).submit(run)
+
+def _read_pdf(full_path):
+    from pypdf import PdfReader
+
+    reader = PdfReader(full_path)
+    metadata = {}
+    for key, field in METADATA_FIELDS.items():
+        value = (reader.metadata or {}).get(key)
+        if value:
+            metadata[field] = str(value)
+
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        text = (page.extract_text() or '').strip()
+        if text:
+            pages.append({'page_number': number, 'text': text})
+
+    return len(reader.pages), metadata, pages
+
+def _find_extracted_copy(file_obj):
+    if not file_obj.sha256:
+        return None
+
+    return db.session.execute(
+        db.select(FileContent)
+        .join(File, File.id == FileContent.file_id)
+        .where(File.sha256 == file_obj.sha256, File.id != file_obj.id, FileContent.status == 'done')
+        .limit(1)
+    ).scalar()
+
+def _copy_extraction(content, source):
+    """Reuse the pages of an identical blob that was already extracted"""
+    pages = FilePage.__table__
+    db.session.execute(pages.insert().from_select(
+        ['file_id', 'page_number', 'text'],
+        db.select(db.literal(content.file_id), pages.c.page_number, pages.c.text)
+        .where(pages.c.file_id == source.file_id)
+    ))
+    content.status = 'done'
+    content.page_count = source.page_count
+    content.doc_metadata = source.doc_metadata
+    content.extracted_at = datetime.utcnow()
+    # Content search results change once the pages are in.
+    version_service.bump(files=[content.file_id], content=True)
+    db.session.commit()
+
+def extract_file(file_id):
+    content = db.session.get(FileContent, file_id)
+    file_obj = db.session.get(File, file_id)
+
+    if not content or not file_obj or file_obj.deleted_at or content.status == 'done':
+        return
+
+    source = _find_extracted_copy(file_obj)
+    if source:
+        _copy_extraction(content, source)
+        return
+
+    try:
+        with get_storage().local_copy(file_obj.storage_path) as path:
+            page_count, metadata, pages = _read_pdf(path)
+    except Exception as e:
+        current_app.logger.warning(f'Failed to extract content from file {file_id}: {str(e)}')
+        content.status = 'failed'
+        content.error = str(e)
+        db.session.commit()
+        return
+
+    db.session.execute(FilePage.__table__.delete().where(FilePage.file_id == file_id))
+    if pages:
+        db.session.execute(
+            FilePage.__table__.insert(),
+            [{'file_id': file_id, **page} for page in pages]
+        )
+
+    content.status = 'done'
+    content.page_count = page_count
+    content.doc_metadata = json.dumps(metadata)
+    content.error = None
+    content.extracted_at = datetime.utcnow()
+    version_service.bump(files=[file_id], content=True)
+    db.session.commit()
+
+def extract_pending(limit=100):
+    file_ids = db.session.execute(
+        db.select(FileContent.file_id)
+        .join(File, File.id == FileContent.file_id)
+        .where(FileContent.status == 'pending', File.deleted_at.is_(None))
+        .limit(limit)
+    ).scalars().all()
+
+    for file_id in file_ids:
+        extract_file(file_id)
+
+    return len(file_ids)
+
+def get_file_content(file_id):
+    return db.session.execute(
+        db.select(FileContent)
+        .join(File, File.id == FileContent.file_id)
+        .where(FileContent.file_id == file_id, File.deleted_at.is_(None))
+    ).scalar()
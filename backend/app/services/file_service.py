@@ -1,57 +1,175 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from werkzeug.utils import secure_filename
 from app import db
 from app.models.file import File
 from app.models.folder import Folder
-from app.utils.storage import save_file, delete_file
-
-def upload_file(file_storage, name, owner_id, folder_id=None):
+from app.utils.storage import commit_blob, discard_staged, is_allowed_file, is_valid_sha256, FileTooLargeError
+from app.utils.ingest import read_upload
+from app.services import blob_service, extraction_service, folder_service, purge_service, quota_service, version_service
+from app.utils.names import name_key
+from app.utils.pagination import parse_time_key
+from app.utils import serializers
+
+def _name_taken(name, exclude_id=None):
+    query = File.query.filter_by(name_key=name_key(name), deleted_at=None)
+    if exclude_id:
+        query = query.filter(File.id != exclude_id)
+    return db.session.query(query.exists()).scalar()
+
+def check_upload_target(name, owner_id, folder_id=None):
+    """Reject an upload into a missing or foreign folder, or under a taken name; name None skips the name check"""
     if folder_id:
-        folder = Folder.query.get(folder_id)
+        folder = Folder.query.filter_by(id=folder_id, deleted_at=None).first()
         if not folder:
             raise ValueError('Folder not found')
         if folder.owner_id != owner_id:
             raise PermissionError('You can only upload files to your own folders')
 
-    existing = File.query.filter_by(name=name).first()
-
-    if existing:
+    if name is not None and _name_taken(name):
         raise ValueError('A file with this name already exists')
 
-    storage_path, original_filename = save_file(file_storage)
-
+def _create_file(name, original_filename, blob, owner_id, folder_id, staged=None):
+    """Insert the File row and commit, storing a staged upload as the blob only once the row is in"""
     file_obj = File(
         name=name,
         original_filename=original_filename,
-        storage_path=storage_path,
-        size_bytes=0,
+        storage_path=blob.storage_path,
+        size_bytes=blob.size_bytes,
+        sha256=blob.sha256,
         mime_type='application/pdf',
         folder_id=folder_id,
         owner_id=owner_id
     )
 
-    import os
-    from flask import current_app
-    full_path = os.path.join(current_app.config['FILE_STORAGE_PATH'], storage_path)
-    file_obj.size_bytes = os.path.getsize(full_path)
-
     db.session.add(file_obj)
-    db.session.commit()
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Another upload claimed the name after check_upload_target ran.
+        db.session.rollback()
+        raise ValueError('A file with this name already exists')
+    chain = folder_service.chain_ids(folder_id)
+    folder_service.adjust_totals(chain, file_obj.size_bytes, 1, file_obj.uploaded_at)
+    version_service.bump(folders=chain, listings=True)
+    extraction_service.enqueue_extraction(file_obj.id)
+
+    if staged is None:
+        db.session.commit()
+    else:
+        try:
+            commit_blob(staged, blob.sha256)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            blob_service.discard_unreferenced_blob(file_obj.sha256)
+            raise
+
+    extraction_service.schedule_extraction(file_obj.id)
 
     return file_obj
 
+def create_file_from_staged(temp_path, original_filename, digest, size, name, owner_id, folder_id=None, keep_staged=False):
+    """Turn a fully written temp file from the storage tmp area into a File, moving it into the blob store.
+
+    On failure the temp file is discarded, unless keep_staged is set and it
+    has not been moved yet, so the caller can retry with it.
+    """
+    try:
+        check_upload_target(name, owner_id, folder_id)
+        quota_service.charge(owner_id, size)
+        blob = blob_service.acquire_blob(digest, size)
+        return _create_file(name, original_filename, blob, owner_id, folder_id, staged=temp_path)
+    except Exception:
+        if not keep_staged:
+            discard_staged(temp_path)
+        db.session.rollback()
+        raise
+
+def receive_upload(stream, content_type, owner_id):
+    """Read an upload request body once, staging its file part within the size limit and the owner's quota.
+
+    The name and folder_id fields, when sent before the file part, are
+    checked before any of the file is read. Returns (fields, staged) as
+    read_upload does.
+    """
+    max_bytes = current_app.config['MAX_FILE_SIZE_MB'] * 1024 * 1024
+    remaining = quota_service.remaining_bytes(owner_id)
+
+    def check_fields(fields, filename):
+        name = fields['name'].strip() if 'name' in fields else None
+        folder_id = fields.get('folder_id')
+        if folder_id:
+            try:
+                folder_id = int(folder_id)
+            except ValueError:
+                raise ValueError('Invalid folder_id')
+        # An empty name is rejected once the whole request has been read.
+        check_upload_target(name or None, owner_id, folder_id)
+
+    try:
+        return read_upload(
+            stream, content_type, max_bytes if remaining is None else min(max_bytes, remaining),
+            on_file=check_fields
+        )
+    except FileTooLargeError:
+        if remaining is not None and remaining < max_bytes:
+            raise quota_service.QuotaExceededError('Storage quota exceeded')
+        raise
+
+def upload_file(staged, name, owner_id, folder_id=None, sha256=None):
+    """Create a file from an upload staged by receive_upload"""
+    temp_path, filename, digest, size = staged
+
+    if sha256 and sha256 != digest:
+        discard_staged(temp_path)
+        raise ValueError('Uploaded content does not match the provided SHA-256 digest')
+
+    return create_file_from_staged(temp_path, secure_filename(filename), digest, size, name, owner_id, folder_id)
+
+def upload_file_by_hash(sha256, name, filename, owner_id, folder_id=None):
+    """Create a file from content the server already stores, without transferring the bytes"""
+    if not is_valid_sha256(sha256):
+        raise ValueError('Invalid SHA-256 digest')
+
+    if not is_allowed_file(filename):
+        raise ValueError('Only PDF files are allowed')
+
+    check_upload_target(name, owner_id, folder_id)
+
+    blob = blob_service.acquire_existing_blob(sha256)
+
+    if not blob:
+        return None
+
+    try:
+        quota_service.charge(owner_id, blob.size_bytes)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return _create_file(name, secure_filename(filename), blob, owner_id, folder_id)
+
 def get_file_by_id(file_id):
-    return File.query.get(file_id)
+    return File.query.options(joinedload(File.owner)).filter_by(id=file_id, deleted_at=None).first()
 
-def get_root_files(owner_id=None, limit=100, offset=0):
-    from sqlalchemy.orm import joinedload
-    query = File.query.options(joinedload(File.owner)).filter_by(folder_id=None)
+def get_root_files(owner_id=None, limit=100, after=None, stream=False):
+    """Root file rows newest first; after is the (uploaded_at, id) keyset cursor of the previous page"""
+    query = serializers.file_select().where(File.folder_id.is_(None))
 
     if owner_id:
-        query = query.filter_by(owner_id=owner_id)
+        query = query.where(File.owner_id == owner_id)
+
+    if after:
+        query = query.where(tuple_(File.uploaded_at, File.id) < parse_time_key(after))
 
-    return query.order_by(File.uploaded_at.desc()).limit(limit).offset(offset).all()
+    return serializers.fetch_rows(query.order_by(File.uploaded_at.desc(), File.id.desc()).limit(limit), stream)
 
 def delete_file_by_id(file_id, user_id):
-    file_obj = File.query.get(file_id)
+    file_obj = File.query.filter_by(id=file_id, deleted_at=None).first()
 
     if not file_obj:
         return False
@@ -59,15 +177,38 @@ def delete_file_by_id(file_id, user_id):
     if file_obj.owner_id != user_id:
         raise PermissionError('You do not have permission to delete this file')
 
-    delete_file(file_obj.storage_path)
-
-    db.session.delete(file_obj)
+    remove_file(file_obj)
     db.session.commit()
+    purge_service.schedule_purge()
 
     return True
 
+def remove_file(file_obj):
+    """Tombstone a file without committing; the purger removes the row and releases its blob"""
+    file_obj.deleted_at = datetime.utcnow()
+    quota_service.release({file_obj.owner_id: file_obj.size_bytes})
+    chain = folder_service.chain_ids(file_obj.folder_id)
+    folder_service.adjust_totals(chain, -file_obj.size_bytes, -1, file_obj.deleted_at)
+    version_service.bump(folders=chain, files=[file_obj.id], listings=True)
+
+def move_file(file_obj, folder):
+    """Move a file into folder (None for the root) and carry its size along the ancestor chains, without committing"""
+    old_chain = folder_service.chain_ids(file_obj.folder_id)
+    new_chain = [int(i) for i in folder.path.strip('/').split('/')] if folder else []
+    folder_service.transfer_totals(old_chain, new_chain, file_obj.size_bytes, 1, datetime.utcnow())
+    version_service.bump(folders=set(old_chain) | set(new_chain), files=[file_obj.id], listings=True)
+    file_obj.folder_id = folder.id if folder else None
+
+def rename_file(file_obj, name):
+    """Rename a file without committing"""
+    chain = folder_service.chain_ids(file_obj.folder_id)
+    folder_service.adjust_totals(chain, modified_at=datetime.utcnow())
+    version_service.bump(folders=chain, files=[file_obj.id], listings=True)
+    # Set last so a conflicting name surfaces at commit, not in the queries above.
+    file_obj.name = name
+
 def update_file(file_id, name, user_id):
-    file_obj = File.query.get(file_id)
+    file_obj = File.query.filter_by(id=file_id, deleted_at=None).first()
 
     if not file_obj:
         return None
@@ -75,18 +216,20 @@ def update_file(file_id, name, user_id):
     if file_obj.owner_id != user_id:
         raise PermissionError('You do not have permission to edit this file')
 
-    existing = File.query.filter_by(name=name).filter(File.id != file_id).first()
-
-    if existing:
+    if _name_taken(name, exclude_id=file_id):
         raise ValueError('A file with this name already exists')
 
-    file_obj.name = name
-    db.session.commit()
+    rename_file(file_obj, name)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise ValueError('A file with this name already exists')
 
     return file_obj
 
 def check_file_ownership(file_id, user_id):
-    file_obj = File.query.get(file_id)
+    file_obj = File.query.filter_by(id=file_id, deleted_at=None).first()
     if not file_obj:
         return False
     return file_obj.owner_id == user_id
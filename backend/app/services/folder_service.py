@@ -1,39 +1,69 @@
+from datetime import datetime
+from flask import current_app
 from app import db
-from app.models.folder import Folder
+from app.models.folder import Folder, subtree_range
 from app.models.file import File
-from sqlalchemy import or_
-from sqlalchemy.orm import joinedload
+from app.services import purge_service, quota_service, version_service
+from app.utils.pagination import parse_time_key
+from app.utils import serializers
+from app.utils.names import name_key
+from app.utils.storage import get_file_extension
+from app.utils.storage_backends import get_storage
+from sqlalchemy import func, tuple_, inspect as sa_inspect
+from sqlalchemy.orm import attributes
+from sqlalchemy.exc import IntegrityError
 
-def create_folder(name, owner_id, parent_id=None):
-    existing = Folder.query.filter_by(name=name).first()
+class DestinationNotFoundError(ValueError):
+    pass
+
+def _name_taken(name, exclude_id=None):
+    query = Folder.query.filter_by(name_key=name_key(name), deleted_at=None)
+    if exclude_id:
+        query = query.filter(Folder.id != exclude_id)
+    return db.session.query(query.exists()).scalar()
 
-    if existing:
+def _commit_name():
+    """Commit, turning a lost race on the unique name index into the usual conflict error"""
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
         raise ValueError('A folder with this name already exists')
 
+def create_folder(name, owner_id, parent_id=None):
+    if _name_taken(name):
+        raise ValueError('A folder with this name already exists')
+
+    chain = chain_ids(parent_id)
     folder = Folder(name=name, owner_id=owner_id, parent_id=parent_id)
     db.session.add(folder)
-    db.session.commit()
+    version_service.bump(folders=chain, listings=True)
+    _commit_name()
 
     return folder
 
 def get_folder_by_id(folder_id):
-    return Folder.query.get(folder_id)
+    return Folder.query.filter_by(id=folder_id, deleted_at=None).first()
 
-def get_root_folders(owner_id=None, limit=100, offset=0):
-    query = Folder.query.options(joinedload(Folder.owner)).filter_by(parent_id=None)
+def get_root_folders(owner_id=None, limit=100, after=None, stream=False):
+    """Root folder rows newest first; after is the (created_at, id) keyset cursor of the previous page"""
+    query = serializers.folder_select().where(Folder.parent_id.is_(None))
 
     if owner_id:
-        query = query.filter_by(owner_id=owner_id)
+        query = query.where(Folder.owner_id == owner_id)
+
+    if after:
+        query = query.where(tuple_(Folder.created_at, Folder.id) < parse_time_key(after))
 
-    return query.order_by(Folder.created_at.desc()).limit(limit).offset(offset).all()
+    return serializers.fetch_rows(query.order_by(Folder.created_at.desc(), Folder.id.desc()).limit(limit), stream)
 
 def get_folder_contents(folder_id):
-    folder = Folder.query.options(joinedload(Folder.owner)).get(folder_id)
+    """Projection rows for a folder and its direct children"""
+    folder = serializers.get_folder_row(folder_id)
     if not folder:
         return None
 
-    subfolders = Folder.query.options(joinedload(Folder.owner)).filter_by(parent_id=folder_id).order_by(Folder.name).all()
-    files = File.query.options(joinedload(File.owner)).filter_by(folder_id=folder_id).order_by(File.name).all()
+    subfolders, files = serializers.folder_contents(folder_id)
 
     return {
         'folder': folder,
@@ -42,7 +72,7 @@ def get_folder_contents(folder_id):
     }
 
 def update_folder(folder_id, name, user_id):
-    folder = Folder.query.get(folder_id)
+    folder = get_folder_by_id(folder_id)
 
     if not folder:
         return None
@@ -50,18 +80,213 @@ def update_folder(folder_id, name, user_id):
     if folder.owner_id != user_id:
         raise PermissionError('You do not have permission to edit this folder')
 
-    existing = Folder.query.filter_by(name=name).filter(Folder.id != folder_id).first()
-
-    if existing:
+    if _name_taken(name, exclude_id=folder_id):
         raise ValueError('A folder with this name already exists')
 
+    rename_folder(folder, name)
+    _commit_name()
+
+    return folder
+
+def rename_folder(folder, name):
+    """Rename a folder without committing"""
     folder.name = name
+    version_service.bump(folders=[folder.id, folder.parent_id], listings=True)
+
+def get_ancestors(folder_id):
+    """Return (folder, ancestors root-first) rows using the materialized path: two queries at any depth"""
+    folder = serializers.get_folder_row(folder_id)
+    if not folder:
+        return None
+
+    ids = [int(i) for i in folder.path.strip('/').split('/')[:-1]] if folder.path else []
+    return folder, serializers.rows_by_ids(serializers.folder_select(), Folder.id, ids)
+
+def subtree_filter(folder):
+    low, high = subtree_range(folder.path)
+    return Folder.path >= low, Folder.path < high
+
+def move_folder(folder_id, parent_id, user_id):
+    folder = get_folder_by_id(folder_id)
+
+    if not folder:
+        return None
+
+    if folder.owner_id != user_id:
+        raise PermissionError('You do not have permission to move this folder')
+
+    parent = None
+    if parent_id:
+        parent = get_folder_by_id(parent_id)
+        if not parent:
+            raise DestinationNotFoundError('Destination folder not found')
+        if parent.owner_id != user_id:
+            raise PermissionError('You can only move folders into your own folders')
+        if parent.is_within(folder):
+            raise ValueError('Cannot move a folder into itself or one of its subfolders')
+
+    move_subtree(folder, parent)
     db.session.commit()
 
     return folder
 
+def move_subtree(folder, parent):
+    """Re-parent a folder and rewrite the path prefix of its whole subtree in one statement, without committing"""
+    old_path = folder.path
+    new_path = f"{parent.path if parent else '/'}{folder.id}/"
+    ancestors = set()
+
+    if old_path != new_path:
+        size, count = _subtree_totals(folder)
+        new_ancestors = [int(i) for i in parent.path.strip('/').split('/')] if parent else []
+        ancestors = set(folder.ancestor_ids) | set(new_ancestors)
+        transfer_totals(folder.ancestor_ids, new_ancestors, size, count, datetime.utcnow())
+        version_service.bump(folders=ancestors | {folder.id}, listings=True)
+
+        db.session.execute(
+            db.update(Folder)
+            .where(*subtree_filter(folder))
+            .values(path=db.literal(new_path, db.String) + func.substr(Folder.path, len(old_path) + 1))
+            .execution_options(synchronize_session=False)
+        )
+
+    folder.parent_id = parent.id if parent else None
+    db.session.flush()
+    if old_path != new_path:
+        _sync_moved_subtree(old_path, new_path, ancestors)
+
+def _sync_moved_subtree(old_path, new_path, ancestors):
+    """Bring loaded folders in step with a subtree move's bulk UPDATEs, leaving the rest of the session as it is"""
+    for obj in list(db.session.identity_map.values()):
+        if not isinstance(obj, Folder):
+            continue
+        path = obj.__dict__.get('path')
+        if path and path.startswith(old_path):
+            attributes.set_committed_value(obj, 'path', new_path + path[len(old_path):])
+        if sa_inspect(obj).identity[0] in ancestors:
+            db.session.expire(obj, ['total_bytes', 'file_count', 'last_modified'])
+
+def chain_ids(folder_id):
+    """Ids of a folder and all its ancestors, read from its materialized path"""
+    if folder_id is None:
+        return []
+    path = db.session.execute(db.select(Folder.path).where(Folder.id == folder_id)).scalar()
+    return [int(i) for i in path.strip('/').split('/')] if path else [folder_id]
+
+def adjust_totals(folder_ids, size_delta=0, count_delta=0, modified_at=None):
+    """Add deltas to the recursive aggregates of the given folders in one UPDATE, without committing"""
+    if not folder_ids:
+        return
+
+    values = {
+        'total_bytes': Folder.total_bytes + size_delta,
+        'file_count': Folder.file_count + count_delta,
+        # Aggregate bookkeeping is not an edit of the folder itself.
+        'updated_at': Folder.updated_at,
+    }
+    if modified_at:
+        values['last_modified'] = db.case(
+            (Folder.last_modified.is_(None) | (Folder.last_modified < modified_at), modified_at),
+            else_=Folder.last_modified
+        )
+
+    db.session.execute(
+        db.update(Folder)
+        .where(Folder.id.in_(list(folder_ids)))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+def transfer_totals(old_ids, new_ids, size, count, modified_at):
+    """Move aggregates from one ancestor chain to another, leaving the ancestors they share untouched"""
+    old_ids, new_ids = set(old_ids), set(new_ids)
+    adjust_totals(old_ids - new_ids, -size, -count, modified_at)
+    adjust_totals(new_ids - old_ids, size, count, modified_at)
+
+def _subtree_totals(folder):
+    return db.session.execute(
+        db.select(Folder.total_bytes, Folder.file_count).where(Folder.id == folder.id)
+    ).one()
+
+def rebuild_folder_totals():
+    """Recompute total_bytes, file_count and last_modified of every live folder in one pass. Returns the number of folders.
+
+    last_modified becomes the newest updated_at among the live files of the
+    subtree; the time of past deletes is not recoverable from the tables.
+    """
+    folders = db.session.execute(
+        db.select(Folder.id, Folder.path).where(Folder.deleted_at.is_(None))
+    ).all()
+    totals = {row.id: [0, 0, None] for row in folders}
+
+    direct = db.session.execute(
+        db.select(File.folder_id, func.sum(File.size_bytes), func.count(), func.max(File.updated_at))
+        .where(File.folder_id.is_not(None), File.deleted_at.is_(None))
+        .group_by(File.folder_id)
+    ).all()
+    by_folder = {row[0]: row[1:] for row in direct}
+
+    for row in folders:
+        if row.id not in by_folder or not row.path:
+            continue
+        size, count, modified = by_folder[row.id]
+        for folder_id in (int(i) for i in row.path.strip('/').split('/')):
+            if folder_id in totals:
+                entry = totals[folder_id]
+                entry[0] += size or 0
+                entry[1] += count
+                if modified and (entry[2] is None or modified > entry[2]):
+                    entry[2] = modified
+
+    if totals:
+        table = Folder.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('f_id'))
+            .values(
+                total_bytes=db.bindparam('f_total_bytes'),
+                file_count=db.bindparam('f_file_count'),
+                last_modified=db.bindparam('f_last_modified'),
+                updated_at=table.c.updated_at
+            ),
+            [
+                {'f_id': folder_id, 'f_total_bytes': size, 'f_file_count': count, 'f_last_modified': modified}
+                for folder_id, (size, count, modified) in totals.items()
+            ]
+        )
+    db.session.commit()
+    return len(totals)
+
+def rebuild_folder_paths():
+    """Recompute every materialized path level by level, e.g. after importing rows without paths"""
+    folders = Folder.__table__
+    parent = folders.alias('parent')
+
+    # '' marks a path still to be computed; the column is NOT NULL.
+    db.session.execute(folders.update().values(path=''))
+    db.session.execute(
+        folders.update()
+        .where(folders.c.parent_id.is_(None))
+        .values(path='/' + db.cast(folders.c.id, db.String) + '/')
+    )
+
+    levels = 1
+    while True:
+        parent_path = db.select(parent.c.path).where(parent.c.id == folders.c.parent_id).scalar_subquery()
+        result = db.session.execute(
+            folders.update()
+            .where(folders.c.path == '', parent_path != '')
+            .values(path=parent_path + db.cast(folders.c.id, db.String) + '/')
+        )
+        if result.rowcount == 0:
+            break
+        levels += 1
+
+    db.session.commit()
+    return levels
+
 def delete_folder(folder_id, user_id):
-    folder = Folder.query.get(folder_id)
+    folder = get_folder_by_id(folder_id)
 
     if not folder:
         return False
@@ -69,13 +294,100 @@ def delete_folder(folder_id, user_id):
     if folder.owner_id != user_id:
         raise PermissionError('You do not have permission to delete this folder')
 
-    db.session.delete(folder)
+    remove_folder(folder)
     db.session.commit()
+    purge_service.schedule_purge()
 
     return True
 
+def remove_folder(folder):
+    """Tombstone a folder, its subtree and every file in it with one UPDATE per table, without committing"""
+    now = datetime.utcnow()
+    subtree = subtree_filter(folder)
+
+    size, count = _subtree_totals(folder)
+    adjust_totals(folder.ancestor_ids, -size, -count, now)
+    version_service.bump(folders=folder.ancestor_ids + [folder.id], deletions=True, listings=True)
+    quota_service.release(dict(db.session.execute(
+        db.select(File.owner_id, func.sum(File.size_bytes))
+        .where(File.folder_id.in_(db.select(Folder.id).where(*subtree)), File.deleted_at.is_(None))
+        .group_by(File.owner_id)
+    ).all()))
+
+    db.session.execute(
+        db.update(Folder)
+        .where(*subtree, Folder.deleted_at.is_(None))
+        .values(deleted_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        db.update(File)
+        .where(File.folder_id.in_(db.select(Folder.id).where(*subtree)), File.deleted_at.is_(None))
+        .values(deleted_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    folder.deleted_at = now
+
+def _archive_name(name):
+    name = name.replace('/', '_').replace('\\', '_').strip()
+    return '_' if name in ('', '.', '..') else name
+
+def _unique_path(path, used):
+    stem, dot, ext = path.rpartition('.') if '.' in path.rsplit('/', 1)[-1] else (path, '', '')
+    candidate, n = path, 2
+    while candidate in used:
+        candidate = f'{stem} ({n}){dot}{ext}'
+        n += 1
+    used.add(candidate)
+    return candidate
+
+def archive_entries(folder):
+    """Yield (arcname, storage_path, size, modified_at) for a folder's live subtree, laid out by folder hierarchy.
+
+    Folder names come from one query over the materialized path range and
+    files are read through a server-side cursor.
+    """
+    subtree = subtree_filter(folder)
+    depth = len(folder.ancestor_ids)
+    folders = db.session.execute(
+        db.select(Folder.id, Folder.name, Folder.path, Folder.updated_at)
+        .where(*subtree, Folder.deleted_at.is_(None))
+        .order_by(Folder.path)
+    ).all()
+    names = {row.id: _archive_name(row.name) for row in folders}
+
+    used, directories = set(), {}
+    for row in folders:
+        ids = [int(i) for i in row.path.strip('/').split('/')[depth:]]
+        if all(i in names for i in ids):
+            parent = directories.get(ids[-2], '') if len(ids) > 1 else ''
+            directories[row.id] = _unique_path(f'{parent}{names[row.id]}', used) + '/'
+            yield directories[row.id], None, 0, row.updated_at
+
+    files = db.session.execute(
+        db.select(File.name, File.original_filename, File.storage_path, File.size_bytes,
+                  File.updated_at, File.folder_id)
+        .join(Folder, Folder.id == File.folder_id)
+        .where(*subtree, Folder.deleted_at.is_(None), File.deleted_at.is_(None))
+        .order_by(File.folder_id, File.name)
+        .execution_options(yield_per=serializers.STREAM_BATCH_SIZE)
+    )
+    storage = get_storage()
+    for row in files:
+        if row.folder_id not in directories:
+            # Left out with a folder above it that is not live.
+            continue
+        if not storage.exists(row.storage_path):
+            current_app.logger.warning(f'Skipping missing file {row.storage_path} in folder archive')
+            continue
+        name = _archive_name(row.name)
+        extension = get_file_extension(row.original_filename)
+        if extension and not name.lower().endswith(extension):
+            name += extension
+        yield _unique_path(directories[row.folder_id] + name, used), row.storage_path, row.size_bytes, row.updated_at
+
 def check_folder_ownership(folder_id, user_id):
-    folder = Folder.query.get(folder_id)
+    folder = get_folder_by_id(folder_id)
     if not folder:
         return False
     return folder.owner_id == user_id
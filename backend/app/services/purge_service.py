@@ -0,0 +1,226 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models.blob import Blob
+from app.models.folder import Folder
+from app.models.file import File
+from app.models.file_content import FileContent, FilePage
+from app.models.upload_session import UploadSession
+from app.services import folder_service, quota_service, version_service
+from app.utils.storage import delete_file, discard_staged
+from app.utils.storage_backends import get_storage
+
+# A failed background purge is retried with exponential backoff; whatever is
+# still left afterwards is picked up by the next purge or `flask purge-deleted`.
+MAX_ATTEMPTS = 5
+RETRY_DELAY_SECONDS = 1
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = False
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+        return _executor
+
+def schedule_purge():
+    """Purge tombstoned rows in the background after a delete commits. Runs queued while one is pending are coalesced."""
+    global _pending
+    if current_app.config.get('PURGE_WORKERS', 0) <= 0:
+        return
+
+    app = current_app._get_current_object()
+
+    with _executor_lock:
+        if _pending:
+            return
+        _pending = True
+
+    def run():
+        global _pending
+        with _executor_lock:
+            _pending = False
+        with app.app_context():
+            _purge_with_retries()
+
+    _get_executor().submit(run)
+
+def _purge_with_retries():
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            purge_deleted()
+            collect_blobs()
+            return
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f'Purge attempt {attempt + 1} failed: {str(e)}')
+            time.sleep(RETRY_DELAY_SECONDS * 2 ** attempt)
+    current_app.logger.error('Giving up on purge after repeated failures')
+
+def _tombstone_strays(now):
+    """Catch rows that raced into a folder after it was tombstoned"""
+    deleted_folders = db.select(Folder.id).where(Folder.deleted_at.is_not(None))
+    strays = 0
+    while True:
+        marked = db.session.execute(
+            db.update(Folder)
+            .where(Folder.deleted_at.is_(None), Folder.parent_id.in_(deleted_folders))
+            .values(deleted_at=now)
+        ).rowcount
+        if not marked:
+            break
+        strays += marked
+    files = db.session.execute(
+        db.select(File.id, File.folder_id, File.owner_id, File.size_bytes)
+        .where(File.deleted_at.is_(None), File.folder_id.in_(deleted_folders))
+    ).all()
+    if files:
+        db.session.execute(
+            db.update(File)
+            .where(File.id.in_([row.id for row in files]), File.deleted_at.is_(None))
+            .values(deleted_at=now)
+        )
+        # The strays were added to their ancestors and charged to their owners
+        # after the folder's own delete had settled both, so settle them here.
+        by_folder = {}
+        usage = Counter()
+        for row in files:
+            size, count = by_folder.get(row.folder_id, (0, 0))
+            by_folder[row.folder_id] = (size + row.size_bytes, count + 1)
+            usage[row.owner_id] += row.size_bytes
+        for folder_id, (size, count) in by_folder.items():
+            folder_service.adjust_totals(folder_service.chain_ids(folder_id), -size, -count, now)
+        quota_service.release(usage)
+        strays += len(files)
+    if strays:
+        version_service.bump(deletions=True, listings=True)
+
+def _purge_files(batch_size):
+    rows = db.session.execute(
+        db.select(File.id, File.sha256, File.storage_path)
+        .where(File.deleted_at.is_not(None))
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    ids = [row.id for row in rows]
+    db.session.execute(FilePage.__table__.delete().where(FilePage.file_id.in_(ids)))
+    db.session.execute(FileContent.__table__.delete().where(FileContent.file_id.in_(ids)))
+    db.session.execute(File.__table__.delete().where(File.id.in_(ids)))
+
+    releases = Counter(row.sha256 for row in rows if row.sha256)
+    if releases:
+        blobs = Blob.__table__
+        db.session.execute(
+            blobs.update()
+            .where(blobs.c.sha256 == db.bindparam('b_sha256'))
+            .values(ref_count=blobs.c.ref_count - db.bindparam('b_count')),
+            [{'b_sha256': sha, 'b_count': count} for sha, count in releases.items()]
+        )
+    db.session.commit()
+
+    # Files stored before content addressing own their storage path outright.
+    for row in rows:
+        if not row.sha256:
+            delete_file(row.storage_path)
+
+    return len(rows)
+
+def _purge_folders(batch_size):
+    ids = db.session.execute(
+        db.select(Folder.id).where(Folder.deleted_at.is_not(None)).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    for upload in UploadSession.query.filter(UploadSession.folder_id.in_(ids)).all():
+        discard_staged(upload.temp_path)
+        db.session.delete(upload)
+    db.session.flush()
+
+    db.session.execute(Folder.__table__.delete().where(Folder.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+def purge_deleted(batch_size=None):
+    """Remove tombstoned files and folders in batches, committing after each. Returns (files, folders) purged."""
+    batch_size = batch_size or current_app.config['PURGE_BATCH_SIZE']
+
+    _tombstone_strays(datetime.utcnow())
+    db.session.commit()
+
+    files = folders = 0
+    while True:
+        purged = _purge_files(batch_size)
+        files += purged
+        if purged < batch_size:
+            break
+    while True:
+        purged = _purge_folders(batch_size)
+        folders += purged
+        if purged < batch_size:
+            break
+
+    return files, folders
+
+def collect_blobs(limit=None):
+    """Unlink blobs nothing references any more. Returns the number removed.
+
+    The blob is first moved aside in the storage backend, then its row is
+    deleted only if it is still unreferenced. If an upload re-acquired the
+    blob in the meantime it is moved back, so concurrent uploads never lose
+    content.
+    Blobs that fail here keep ref_count 0 and are retried on the next sweep.
+    """
+    limit = limit or current_app.config['PURGE_BATCH_SIZE']
+    blobs = Blob.__table__
+    candidates = db.session.execute(
+        db.select(blobs.c.sha256, blobs.c.storage_path).where(blobs.c.ref_count <= 0).limit(limit)
+    ).all()
+    db.session.commit()
+
+    storage = get_storage()
+    removed = 0
+    for sha256, storage_path in candidates:
+        trash_path = f'{storage_path}.gc-{uuid.uuid4().hex}'
+        try:
+            storage.move(storage_path, trash_path)
+        except FileNotFoundError:
+            trash_path = None
+        except Exception as e:
+            current_app.logger.warning(f'Failed to collect blob {sha256}: {str(e)}')
+            continue
+
+        try:
+            result = db.session.execute(
+                blobs.delete().where(blobs.c.sha256 == sha256, blobs.c.ref_count <= 0)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if trash_path:
+                storage.move(trash_path, storage_path)
+            raise
+
+        if result.rowcount == 0:
+            if trash_path:
+                storage.move(trash_path, storage_path)
+            continue
+
+        removed += 1
+        if trash_path:
+            try:
+                storage.delete(trash_path)
+            except Exception as e:
+                current_app.logger.warning(f'Failed to unlink collected blob {trash_path}: {str(e)}')
+
+    return removed
@@ -0,0 +1,79 @@
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models.user import User
+from app.models.file import File
+
+# Allowance for multipart boundaries and form fields when a request's
+# Content-Length is compared with the remaining quota before the body is read.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+class QuotaExceededError(ValueError):
+    pass
+
+def effective_quota(storage_quota_bytes):
+    """A user's own quota, or the configured default when unset. None means unlimited."""
+    if storage_quota_bytes is not None:
+        return storage_quota_bytes
+    default_mb = current_app.config['STORAGE_QUOTA_MB']
+    return default_mb * 1024 * 1024 if default_mb > 0 else None
+
+def remaining_bytes(user_id):
+    """Bytes the user may still store, or None when unlimited"""
+    row = db.session.execute(
+        db.select(User.storage_used_bytes, User.storage_quota_bytes).where(User.id == user_id)
+    ).first()
+    if not row:
+        return None
+    quota = effective_quota(row.storage_quota_bytes)
+    return None if quota is None else max(quota - row.storage_used_bytes, 0)
+
+def check_quota(user_id, size_bytes):
+    """Raise QuotaExceededError if storing size_bytes more would put the user over quota"""
+    remaining = remaining_bytes(user_id)
+    if remaining is not None and size_bytes > remaining:
+        raise QuotaExceededError('Storage quota exceeded')
+
+def check_request_size(user_id, content_length):
+    """Reject an upload request from its Content-Length alone, before the body is parsed"""
+    if content_length:
+        check_quota(user_id, content_length - MULTIPART_OVERHEAD_BYTES)
+
+def charge(user_id, size_bytes):
+    """Add size_bytes to the user's usage in the caller's transaction, failing atomically if it would exceed the quota"""
+    default = effective_quota(None)
+    limit = User.storage_quota_bytes if default is None else func.coalesce(User.storage_quota_bytes, default)
+    stmt = (
+        db.update(User)
+        .where(User.id == user_id, limit.is_(None) | (User.storage_used_bytes + size_bytes <= limit))
+        .values(storage_used_bytes=User.storage_used_bytes + size_bytes)
+        .execution_options(synchronize_session=False)
+    )
+
+    if db.session.execute(stmt).rowcount == 0:
+        raise QuotaExceededError('Storage quota exceeded')
+
+def release(usage_by_owner):
+    """Subtract {owner_id: bytes} from usage in the caller's transaction"""
+    usage_by_owner = {owner_id: size for owner_id, size in usage_by_owner.items() if size}
+    if not usage_by_owner:
+        return
+
+    users = User.__table__
+    db.session.execute(
+        users.update()
+        .where(users.c.id == db.bindparam('u_id'))
+        .values(storage_used_bytes=users.c.storage_used_bytes - db.bindparam('u_size')),
+        [{'u_id': owner_id, 'u_size': size} for owner_id, size in usage_by_owner.items()]
+    )
+
+def rebuild_usage():
+    """Recompute every user's usage from their live files. Returns the number of users updated."""
+    used = (
+        db.select(func.coalesce(func.sum(File.size_bytes), 0))
+        .where(File.owner_id == User.id, File.deleted_at.is_(None))
+        .scalar_subquery()
+    )
+    result = db.session.execute(db.update(User).values(storage_used_bytes=used))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,319 @@
+import html
+from sqlalchemy import event, text, or_, case, func, tuple_
+from app import db
+from app.models.folder import Folder, subtree_range
+from app.models.file import File
+from app.models.file_content import FilePage
+from app.utils import serializers
+
+# Trigram FTS5 tables mirror folders.name and files.name/original_filename,
+# and a word-level FTS5 table indexes extracted PDF page text. They are
+# external-content tables kept in sync by triggers, so every insert, rename
+# and delete (including ORM cascades) updates the index in the same
+# transaction as the row change.
+_SQLITE_INDEXES = {
+    'folders_fts': {
+        'create': "CREATE VIRTUAL TABLE folders_fts USING fts5("
+                  "name, content='folders', content_rowid='id', tokenize='trigram')",
+        'triggers': [
+            "CREATE TRIGGER IF NOT EXISTS folders_fts_ai AFTER INSERT ON folders BEGIN "
+            "INSERT INTO folders_fts(rowid, name) VALUES (new.id, new.name); END",
+            "CREATE TRIGGER IF NOT EXISTS folders_fts_ad AFTER DELETE ON folders BEGIN "
+            "INSERT INTO folders_fts(folders_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+            "CREATE TRIGGER IF NOT EXISTS folders_fts_au AFTER UPDATE OF name ON folders BEGIN "
+            "INSERT INTO folders_fts(folders_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+            "INSERT INTO folders_fts(rowid, name) VALUES (new.id, new.name); END",
+        ],
+    },
+    'files_fts': {
+        'create': "CREATE VIRTUAL TABLE files_fts USING fts5("
+                  "name, original_filename, content='files', content_rowid='id', tokenize='trigram')",
+        'triggers': [
+            "CREATE TRIGGER IF NOT EXISTS files_fts_ai AFTER INSERT ON files BEGIN "
+            "INSERT INTO files_fts(rowid, name, original_filename) "
+            "VALUES (new.id, new.name, new.original_filename); END",
+            "CREATE TRIGGER IF NOT EXISTS files_fts_ad AFTER DELETE ON files BEGIN "
+            "INSERT INTO files_fts(files_fts, rowid, name, original_filename) "
+            "VALUES ('delete', old.id, old.name, old.original_filename); END",
+            "CREATE TRIGGER IF NOT EXISTS files_fts_au AFTER UPDATE OF name, original_filename ON files BEGIN "
+            "INSERT INTO files_fts(files_fts, rowid, name, original_filename) "
+            "VALUES ('delete', old.id, old.name, old.original_filename); "
+            "INSERT INTO files_fts(rowid, name, original_filename) "
+            "VALUES (new.id, new.name, new.original_filename); END",
+        ],
+    },
+    'file_pages_fts': {
+        'create': "CREATE VIRTUAL TABLE file_pages_fts USING fts5("
+                  "text, content='file_pages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        'triggers': [
+            "CREATE TRIGGER IF NOT EXISTS file_pages_fts_ai AFTER INSERT ON file_pages BEGIN "
+            "INSERT INTO file_pages_fts(rowid, text) VALUES (new.id, new.text); END",
+            "CREATE TRIGGER IF NOT EXISTS file_pages_fts_ad AFTER DELETE ON file_pages BEGIN "
+            "INSERT INTO file_pages_fts(file_pages_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+            "CREATE TRIGGER IF NOT EXISTS file_pages_fts_au AFTER UPDATE OF text ON file_pages BEGIN "
+            "INSERT INTO file_pages_fts(file_pages_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+            "INSERT INTO file_pages_fts(rowid, text) VALUES (new.id, new.text); END",
+        ],
+    },
+}
+
+_POSTGRES_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_folders_name_trgm ON folders USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_files_name_trgm ON files USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_files_original_filename_trgm ON files USING gin (original_filename gin_trgm_ops)',
+    "CREATE INDEX IF NOT EXISTS ix_file_pages_text_tsv ON file_pages USING gin (to_tsvector('simple', text))",
+]
+
+# The trigram tokenizer cannot match queries shorter than one trigram.
+MIN_INDEXED_QUERY_LENGTH = 3
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+SNIPPET_TOKENS = 16
+
+# The database delimits matches with control characters, which HTML escaping
+# leaves alone; they become the <mark> tags once the page text is escaped.
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for table, ddl in _SQLITE_INDEXES.items():
+            exists = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).first()
+            if not exists:
+                connection.exec_driver_sql(ddl['create'])
+                connection.exec_driver_sql(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            for trigger in ddl['triggers']:
+                connection.exec_driver_sql(trigger)
+    elif connection.dialect.name == 'postgresql':
+        for statement in _POSTGRES_DDL:
+            connection.exec_driver_sql(statement)
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for table in _SQLITE_INDEXES:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS {table}')
+
+def _render_snippet(snippet):
+    """HTML-escape a snippet of page text, then mark its matches"""
+    return html.escape(snippet).replace(_MATCH_START, SNIPPET_START).replace(_MATCH_END, SNIPPET_END)
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _match_phrase(query):
+    return '"' + query.replace('"', '""') + '"'
+
+def _uses_fts(query):
+    return db.session.get_bind().dialect.name == 'sqlite' and len(query) >= MIN_INDEXED_QUERY_LENGTH
+
+_PROJECTIONS = {
+    Folder: serializers.folder_select,
+    File: serializers.file_select,
+}
+
+def _load_in_order(model, ids):
+    return serializers.rows_by_ids(_PROJECTIONS[model](), model.id, ids)
+
+def _relevance(column, query):
+    # Exact name matches first, then prefix matches, then everything else.
+    return case(
+        (func.lower(column) == query.lower(), 0),
+        (func.lower(column).like(_escape_like(query.lower()) + '%', escape='\\'), 1),
+        else_=2,
+    )
+
+def _parse_after(after):
+    try:
+        boost, name, row_id = after
+        return int(boost), str(name), int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def _fts_name_search(model, fts_table, scope_sql, query, limit, after, params):
+    """Run a trigram MATCH ordered by (boost, name, id) and return [(row, key)] after the keyset cursor.
+
+    bm25 is left out of the order: it changes as rows are added and removed,
+    so a cursor holding it would skip or repeat rows between pages.
+    """
+    rows = db.session.execute(text(
+        "SELECT id, boost, name FROM ("
+        "SELECT f.id, f.name, "
+        "CASE WHEN lower(f.name) = :lowered THEN 0 "
+        "WHEN lower(f.name) LIKE :prefix ESCAPE '\\' THEN 1 ELSE 2 END AS boost "
+        f"FROM {fts_table} JOIN {model.__tablename__} f ON f.id = {fts_table}.rowid "
+        f"WHERE {fts_table} MATCH :match AND f.deleted_at IS NULL {scope_sql}"
+        ") m "
+        + ("WHERE (boost, name, id) > (:after_boost, :after_name, :after_id) " if after else "") +
+        "ORDER BY boost, name, id LIMIT :limit"
+    ), {
+        'match': _match_phrase(query),
+        'lowered': query.lower(),
+        'prefix': _escape_like(query.lower()) + '%',
+        'limit': limit,
+        **params,
+        **(dict(zip(('after_boost', 'after_name', 'after_id'), _parse_after(after))) if after else {}),
+    }).all()
+
+    keys = {row.id: [row.boost, row.name, row.id] for row in rows}
+    return [(obj, keys[obj.id]) for obj in _load_in_order(model, [row.id for row in rows])]
+
+def _like_name_search(query, base_query, name_column, id_column, limit, after):
+    boost = _relevance(name_column, query)
+    if after:
+        after_boost, after_name, after_id = _parse_after(after)
+        base_query = base_query.where(tuple_(boost, name_column, id_column) > (after_boost, after_name, after_id))
+
+    rows = serializers.fetch_rows(base_query.add_columns(boost.label('boost')).order_by(boost, name_column, id_column).limit(limit))
+    return [(row, [row.boost, row.name, row.id]) for row in rows]
+
+def search_folders(query, limit=50, after=None, within=None):
+    """Search folder names, returning [(folder_row, cursor_key)] in relevance order.
+
+    within restricts results to a folder's subtree; after is the cursor key
+    of the last row of the previous page.
+    """
+    low, high = subtree_range(within.path) if within else (None, None)
+
+    if _uses_fts(query):
+        return _fts_name_search(
+            Folder, 'folders_fts',
+            'AND f.path >= :low AND f.path < :high' if within else '',
+            query, limit, after, {'low': low, 'high': high} if within else {}
+        )
+
+    pattern = f'%{_escape_like(query)}%'
+    folders = serializers.folder_select().where(
+        Folder.name.ilike(pattern, escape='\\')
+    )
+    if within:
+        folders = folders.where(Folder.path >= low, Folder.path < high)
+    return _like_name_search(query, folders, Folder.name, Folder.id, limit, after)
+
+def search_files(query, limit=50, after=None, within=None):
+    """Search file names, returning [(file_row, cursor_key)] in relevance order.
+
+    within restricts results to files inside a folder's subtree; after is
+    the cursor key of the last row of the previous page.
+    """
+    low, high = subtree_range(within.path) if within else (None, None)
+
+    if _uses_fts(query):
+        return _fts_name_search(
+            File, 'files_fts',
+            'AND f.folder_id IN (SELECT id FROM folders WHERE path >= :low AND path < :high)' if within else '',
+            query, limit, after, {'low': low, 'high': high} if within else {}
+        )
+
+    pattern = f'%{_escape_like(query)}%'
+    files = serializers.file_select().where(
+        or_(
+            File.name.ilike(pattern, escape='\\'),
+            File.original_filename.ilike(pattern, escape='\\')
+        )
+    )
+    if within:
+        files = files.where(File.folder_id.in_(
+            db.select(Folder.id).where(Folder.path >= low, Folder.path < high)
+        ))
+    return _like_name_search(query, files, File.name, File.id, limit, after)
+
+def _match_terms(query):
+    return ' '.join(_match_phrase(term) for term in query.split())
+
+def _parse_content_after(after):
+    try:
+        score, file_id = after
+        return float(score), int(file_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def _content_hits_sqlite(query, limit, after, hits_per_file):
+    params = {'match': _match_terms(query), 'limit': limit}
+    if after:
+        params['after_score'], params['after_id'] = _parse_content_after(after)
+    ranked = db.session.execute(text(
+        "SELECT file_id, score FROM ("
+        "SELECT p.file_id, min(m.score) AS score "
+        "FROM (SELECT rowid, rank AS score FROM file_pages_fts WHERE file_pages_fts MATCH :match) m "
+        "JOIN file_pages p ON p.id = m.rowid "
+        "JOIN files f ON f.id = p.file_id AND f.deleted_at IS NULL "
+        "GROUP BY p.file_id) r "
+        + ("WHERE (score, file_id) > (:after_score, :after_id) " if after else "") +
+        "ORDER BY score, file_id LIMIT :limit"
+    ), params).all()
+    file_ids = [row.file_id for row in ranked]
+    if not file_ids:
+        return [], {}, {}
+
+    rows = db.session.execute(text(
+        "SELECT p.file_id, p.page_number, "
+        "snippet(file_pages_fts, 0, :start, :end, '…', :tokens) AS snippet "
+        "FROM file_pages_fts JOIN file_pages p ON p.id = file_pages_fts.rowid "
+        "WHERE file_pages_fts MATCH :match AND p.file_id IN ({}) "
+        "ORDER BY rank".format(', '.join(str(int(i)) for i in file_ids))
+    ), {
+        'match': params['match'],
+        'start': _MATCH_START,
+        'end': _MATCH_END,
+        'tokens': SNIPPET_TOKENS,
+    }).all()
+
+    hits = {}
+    for row in rows:
+        file_hits = hits.setdefault(row.file_id, [])
+        if len(file_hits) < hits_per_file:
+            file_hits.append({'page': row.page_number, 'snippet': _render_snippet(row.snippet)})
+    return file_ids, hits, {row.file_id: [row.score, row.file_id] for row in ranked}
+
+def _content_hits_postgres(query, limit, after, hits_per_file):
+    tsquery = func.plainto_tsquery('simple', query)
+    document = func.to_tsvector('simple', FilePage.text)
+    # Negated so that, like bm25 on SQLite, lower scores rank first.
+    score = (-func.max(func.ts_rank(document, tsquery))).label('score')
+
+    ranked_query = (
+        db.select(FilePage.file_id, score)
+        .join(File, File.id == FilePage.file_id)
+        .where(document.op('@@')(tsquery), File.deleted_at.is_(None))
+        .group_by(FilePage.file_id)
+    )
+    if after:
+        ranked_query = ranked_query.having(tuple_(score, FilePage.file_id) > _parse_content_after(after))
+    ranked = db.session.execute(
+        ranked_query.order_by(score, FilePage.file_id).limit(limit)
+    ).all()
+    file_ids = [row.file_id for row in ranked]
+    if not file_ids:
+        return [], {}, {}
+
+    headline = func.ts_headline(
+        'simple', FilePage.text, tsquery,
+        f'StartSel={_MATCH_START}, StopSel={_MATCH_END}, MaxWords={SNIPPET_TOKENS}'
+    )
+    rows = db.session.execute(
+        db.select(FilePage.file_id, FilePage.page_number, headline.label('snippet'))
+        .where(document.op('@@')(tsquery), FilePage.file_id.in_(file_ids))
+        .order_by(func.ts_rank(document, tsquery).desc())
+    ).all()
+
+    hits = {}
+    for row in rows:
+        file_hits = hits.setdefault(row.file_id, [])
+        if len(file_hits) < hits_per_file:
+            file_hits.append({'page': row.page_number, 'snippet': _render_snippet(row.snippet)})
+    return file_ids, hits, {row.file_id: [float(row.score), row.file_id] for row in ranked}
+
+def search_content(query, limit=50, after=None, hits_per_file=3):
+    """Return (file_row, page_hits, cursor_key) for files whose extracted text matches every query term"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        file_ids, hits, keys = _content_hits_postgres(query, limit, after, hits_per_file)
+    else:
+        file_ids, hits, keys = _content_hits_sqlite(query, limit, after, hits_per_file)
+
+    return [(f, hits.get(f.id, []), keys[f.id]) for f in _load_in_order(File, file_ids)]
@@ -0,0 +1,104 @@
+from datetime import datetime
+from sqlalchemy import event, func, or_
+from app import db
+from app.models.folder import Folder
+from app.models.file import File
+from app.models.name_change import NameChange
+
+# Triggers journal every insert, rename, tombstone and delete of a folder or
+# file, including bulk UPDATEs that never pass through the ORM, in the same
+# transaction as the change itself.
+_SQLITE_TIMESTAMP = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+def _sqlite_triggers(table, kind):
+    live_name = "CASE WHEN new.deleted_at IS NULL THEN new.name END"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_names_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO name_changes(kind, item_id, name, created_at) "
+        f"VALUES ('{kind}', new.id, {live_name}, {_SQLITE_TIMESTAMP}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_names_au AFTER UPDATE OF name, deleted_at ON {table} "
+        f"WHEN old.name IS NOT new.name OR old.deleted_at IS NOT new.deleted_at BEGIN "
+        f"INSERT INTO name_changes(kind, item_id, name, created_at) "
+        f"VALUES ('{kind}', new.id, {live_name}, {_SQLITE_TIMESTAMP}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_names_ad AFTER DELETE ON {table} "
+        f"WHEN old.deleted_at IS NULL BEGIN "
+        f"INSERT INTO name_changes(kind, item_id, name, created_at) "
+        f"VALUES ('{kind}', old.id, NULL, {_SQLITE_TIMESTAMP}); END",
+    ]
+
+_POSTGRES_FUNCTION = """
+CREATE OR REPLACE FUNCTION record_name_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF OLD.deleted_at IS NULL THEN
+            INSERT INTO name_changes(kind, item_id, name, created_at)
+            VALUES (TG_ARGV[0], OLD.id, NULL, clock_timestamp() AT TIME ZONE 'utc');
+        END IF;
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'INSERT' OR OLD.name IS DISTINCT FROM NEW.name OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at THEN
+        INSERT INTO name_changes(kind, item_id, name, created_at)
+        VALUES (TG_ARGV[0], NEW.id, CASE WHEN NEW.deleted_at IS NULL THEN NEW.name END,
+                clock_timestamp() AT TIME ZONE 'utc');
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+def _postgres_triggers(table, kind):
+    return [
+        f'DROP TRIGGER IF EXISTS {table}_names ON {table}',
+        f"CREATE TRIGGER {table}_names AFTER INSERT OR UPDATE OF name, deleted_at OR DELETE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION record_name_change('{kind}')",
+    ]
+
+_TABLES = (('folders', 'folder'), ('files', 'file'))
+
+@event.listens_for(db.metadata, 'after_create')
+def create_name_triggers(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for table, kind in _TABLES:
+            for trigger in _sqlite_triggers(table, kind):
+                connection.exec_driver_sql(trigger)
+    elif connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(_POSTGRES_FUNCTION)
+        for table, kind in _TABLES:
+            for statement in _postgres_triggers(table, kind):
+                connection.exec_driver_sql(statement)
+
+def latest_change_id():
+    return db.session.execute(db.select(func.max(NameChange.id))).scalar() or 0
+
+def live_names():
+    """(kind, id, name) for every live folder and file, read through a server-side cursor"""
+    for kind, model in (('folder', Folder), ('file', File)):
+        yield from (
+            (kind, row.id, row.name)
+            for row in db.session.execute(
+                db.select(model.id, model.name)
+                .where(model.deleted_at.is_(None))
+                .execution_options(yield_per=5000)
+            )
+        )
+
+def changes_since(after_id, settled_before):
+    """Journal rows after after_id, plus any written since settled_before.
+
+    Concurrent transactions can commit journal ids out of order, so rows
+    from the recent past are read again; replaying them is harmless.
+    """
+    return db.session.execute(
+        db.select(NameChange.id, NameChange.kind, NameChange.item_id, NameChange.name)
+        .where(or_(NameChange.id > after_id, NameChange.created_at >= settled_before))
+        .order_by(NameChange.id)
+    ).all()
+
+def trim_changes(retention):
+    """Drop journal rows older than retention (a timedelta) in a transaction of its own. Returns the number removed."""
+    journal = NameChange.__table__
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            journal.delete().where(journal.c.created_at < datetime.utcnow() - retention)
+        )
+    return result.rowcount
@@ -0,0 +1,173 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app import db
+from app.models.upload_session import UploadSession, UploadChunk
+from app.services import file_service, quota_service
+from app.utils.storage import create_temp_file, discard_staged, scan_file, is_allowed_file, is_valid_sha256, CHUNK_SIZE
+
+def _get_owned_session(session_id, user_id):
+    upload = db.session.get(UploadSession, session_id)
+
+    if not upload or upload.expires_at < datetime.utcnow():
+        return None
+
+    if upload.owner_id != user_id:
+        raise PermissionError('You do not have permission to access this upload')
+
+    return upload
+
+def received_ranges(upload):
+    """Merge the recorded chunks into sorted, non-overlapping [start, end) ranges"""
+    rows = db.session.execute(
+        db.select(UploadChunk.offset, UploadChunk.length)
+        .filter_by(session_id=upload.id)
+        .order_by(UploadChunk.offset)
+    ).all()
+
+    ranges = []
+    for offset, length in rows:
+        end = offset + length
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([offset, end])
+    return ranges
+
+def create_session(name, filename, total_size, owner_id, folder_id=None, sha256=None):
+    if not is_allowed_file(filename):
+        raise ValueError('Only PDF files are allowed')
+
+    if total_size <= 0:
+        raise ValueError('File size must be greater than zero')
+
+    if total_size > current_app.config['MAX_FILE_SIZE_MB'] * 1024 * 1024:
+        raise ValueError(f"File exceeds the maximum size of {current_app.config['MAX_FILE_SIZE_MB']} MB")
+
+    if sha256 and not is_valid_sha256(sha256):
+        raise ValueError('Invalid SHA-256 digest')
+
+    file_service.check_upload_target(name, owner_id, folder_id)
+    quota_service.check_quota(owner_id, total_size)
+
+    temp_path = create_temp_file()
+    with open(temp_path, 'wb') as f:
+        f.truncate(total_size)
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        owner_id=owner_id,
+        folder_id=folder_id,
+        name=name,
+        filename=secure_filename(filename),
+        total_size=total_size,
+        sha256=sha256,
+        temp_path=temp_path,
+        expires_at=datetime.utcnow() + timedelta(hours=current_app.config['UPLOAD_SESSION_TTL_HOURS'])
+    )
+    db.session.add(upload)
+    db.session.commit()
+
+    return upload
+
+def get_session(session_id, user_id):
+    return _get_owned_session(session_id, user_id)
+
+def write_chunk(session_id, user_id, offset, stream, length):
+    """Write a chunk from the request stream directly at its offset in the session file"""
+    upload = _get_owned_session(session_id, user_id)
+
+    if not upload:
+        return None
+
+    if offset < 0 or length <= 0 or offset + length > upload.total_size:
+        raise ValueError('Chunk lies outside the declared file size')
+
+    fd = os.open(upload.temp_path, os.O_WRONLY)
+    written = 0
+    try:
+        while written < length:
+            data = stream.read(min(CHUNK_SIZE, length - written))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + written)
+            written += len(data)
+    finally:
+        os.close(fd)
+
+    if written != length:
+        raise ValueError('Chunk body is shorter than its declared length')
+
+    db.session.add(UploadChunk(session_id=upload.id, offset=offset, length=length))
+    db.session.commit()
+
+    return upload
+
+def commit_session(session_id, user_id):
+    upload = _get_owned_session(session_id, user_id)
+
+    if not upload:
+        return None
+
+    if received_ranges(upload) != [[0, upload.total_size]]:
+        raise ValueError('Upload is incomplete')
+
+    file_service.check_upload_target(upload.name, upload.owner_id, upload.folder_id)
+    quota_service.check_quota(upload.owner_id, upload.total_size)
+
+    try:
+        digest = scan_file(upload.temp_path)
+    except FileNotFoundError:
+        _drop_session(upload.id)
+        raise ValueError('Upload data is no longer available, start a new upload')
+
+    if upload.sha256 and upload.sha256 != digest:
+        raise ValueError('Uploaded content does not match the provided SHA-256 digest')
+
+    temp_path = upload.temp_path
+    try:
+        file_obj = file_service.create_file_from_staged(
+            temp_path, upload.filename, digest, upload.total_size, upload.name,
+            upload.owner_id, upload.folder_id, keep_staged=True
+        )
+    except Exception:
+        # A name or quota conflict leaves the staged file in place, so the
+        # session can be committed again; once it is gone there is nothing to retry.
+        if not os.path.exists(temp_path):
+            _drop_session(session_id)
+        raise
+
+    _drop_session(session_id)
+    return file_obj
+
+def _drop_session(session_id):
+    db.session.rollback()
+    upload = db.session.get(UploadSession, session_id)
+    if upload:
+        discard_staged(upload.temp_path)
+        db.session.delete(upload)
+        db.session.commit()
+
+def abort_session(session_id, user_id):
+    upload = _get_owned_session(session_id, user_id)
+
+    if not upload:
+        return False
+
+    discard_staged(upload.temp_path)
+    db.session.delete(upload)
+    db.session.commit()
+
+    return True
+
+def purge_expired_sessions():
+    expired = UploadSession.query.filter(UploadSession.expires_at < datetime.utcnow()).all()
+
+    for upload in expired:
+        discard_staged(upload.temp_path)
+        db.session.delete(upload)
+    db.session.commit()
+
+    return len(expired)
@@ -0,0 +1,68 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models.data_version import DataVersion
+from app.utils.upsert import dialect_insert
+
+# Depended on by the root listing and search by name: bumped for items created,
+# renamed, moved or deleted, which is what those responses show.
+GLOBAL = 'global'
+# Depended on by content search: bumped when extracted pages change.
+CONTENT = 'content'
+# Bumped when users' roles change, so every process drops its cached principals.
+PRINCIPALS = 'principals'
+# Bumped when a delete removes rows whose own scopes were not bumped (folder subtrees).
+DELETIONS = 'deletions'
+
+def folder_scope(folder_id):
+    return f'folder:{folder_id}'
+
+def file_scope(file_id):
+    return f'file:{file_id}'
+
+def bump(folders=(), files=(), deletions=False, listings=False, content=False, principals=False):
+    """Mark the given scopes to be advanced when the current transaction commits.
+
+    listings marks GLOBAL and content marks CONTENT; pass them only when the
+    change shows in those responses, so other writes leave them alone.
+    """
+    scopes = db.session.info.setdefault('version_scopes', set())
+    scopes.update(folder_scope(folder_id) for folder_id in folders if folder_id)
+    scopes.update(file_scope(file_id) for file_id in files if file_id)
+    if deletions:
+        scopes.add(DELETIONS)
+    if listings:
+        scopes.add(GLOBAL)
+    if content:
+        scopes.add(CONTENT)
+    if principals:
+        scopes.add(PRINCIPALS)
+
+@event.listens_for(Session, 'before_commit')
+def _write_versions(session):
+    """Advance every scope marked during the transaction with a single upsert as part of the commit"""
+    scopes = session.info.pop('version_scopes', None)
+    if not scopes:
+        return
+
+    insert = dialect_insert(session.get_bind().dialect.name)
+    stmt = insert(DataVersion)
+    # Sorted so concurrent writers lock the rows in the same order.
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=['scope'],
+            set_={'version': DataVersion.version + 1}
+        ),
+        [{'scope': scope, 'version': 1} for scope in sorted(scopes)]
+    )
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_versions(session, previous_transaction):
+    session.info.pop('version_scopes', None)
+
+def current(scopes):
+    """Versions of the given scopes in order, 0 for scopes never bumped, in one query"""
+    rows = dict(db.session.execute(
+        db.select(DataVersion.scope, DataVersion.version).where(DataVersion.scope.in_(scopes))
+    ).all())
+    return tuple(rows.get(scope, 0) for scope in scopes)
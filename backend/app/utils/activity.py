@@ -0,0 +1,117 @@
+import atexit
+import json
+import os
+import threading
+import weakref
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models.activity_log import ActivityLog
+
+# Recorders of every app created in this process, flushed by one exit hook.
+_recorders = weakref.WeakSet()
+
+@atexit.register
+def _flush_all():
+    for recorder in list(_recorders):
+        recorder.flush()
+
+class ActivityRecorder:
+    """In-process buffer of activity events written to activity_logs with bulk inserts.
+
+    A background thread flushes every `interval` seconds, or as soon as
+    `batch_size` events are queued, and whatever is left is flushed at exit.
+    With an interval of 0 there is no thread and full batches flush inline.
+    The buffer is bounded: if the database stays unavailable the oldest
+    events are dropped first.
+    """
+
+    def __init__(self, batch_size=500, interval=5.0, max_buffer=50000):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.app = None
+        self._events = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread_pid = None
+
+    def init_app(self, app):
+        self.batch_size = app.config['ACTIVITY_FLUSH_SIZE']
+        self.interval = app.config['ACTIVITY_FLUSH_INTERVAL']
+        self._events = deque(maxlen=app.config['ACTIVITY_BUFFER_LIMIT'])
+        self.app = app
+        app.extensions['activity_recorder'] = self
+        _recorders.add(self)
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so each worker process starts its own.
+        if self.interval <= 0 or self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='activity-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def record(self, action, resource_type, resource_id=None, user_id=None, details=None):
+        event = {
+            'user_id': user_id,
+            'action': action,
+            'resource_type': resource_type,
+            'resource_id': resource_id,
+            'details': json.dumps(details) if details is not None else None,
+            'created_at': datetime.utcnow(),
+        }
+        with self._lock:
+            self._events.append(event)
+            full = len(self._events) >= self.batch_size
+
+        self._ensure_thread()
+        if full:
+            if self.interval > 0:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """Write every queued event in one INSERT on a connection of its own, updating the daily rollups in the same transaction. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._events)
+                self._events.clear()
+            if not events or self.app is None:
+                return 0
+
+            from app.services import activity_service
+
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        connection.execute(ActivityLog.__table__.insert(), events)
+                        activity_service.rollup_events(connection, events)
+            except Exception as e:
+                with self._lock:
+                    # Put the batch back in front of newer events for the next attempt,
+                    # dropping the oldest if that overflows the buffer.
+                    self._events = deque(events + list(self._events), maxlen=self._events.maxlen)
+                self.app.logger.error(f'Failed to write {len(events)} activity event(s): {str(e)}')
+                return 0
+
+            return len(events)
+
+def record_activity(action, resource_type, resource_id=None, user=None, details=None):
+    current_app.extensions['activity_recorder'].record(
+        action, resource_type, resource_id, user.id if user else None, details
+    )
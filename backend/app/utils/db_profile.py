@@ -0,0 +1,78 @@
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+def profile_name(uri):
+    """The engine profile for a database URI: 'sqlite', 'postgresql' or 'default'"""
+    backend = make_url(uri).get_backend_name()
+    return backend if backend in ('sqlite', 'postgresql') else 'default'
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database, with explicit settings taking precedence"""
+    profile = profile_name(config['SQLALCHEMY_DATABASE_URI'])
+    options = {}
+
+    if profile == 'sqlite':
+        # The driver's own lock wait, on top of PRAGMA busy_timeout.
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    elif profile == 'postgresql':
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=True,
+        )
+        if config['DB_STATEMENT_TIMEOUT_MS']:
+            options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+def sqlite_pragmas(config):
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE_MB'] * 1024 * 1024),
+        # Negative cache_size is in KiB.
+        ('cache_size', -config['SQLITE_CACHE_SIZE_MB'] * 1024),
+        ('temp_store', 'MEMORY'),
+    ]
+
+def configure_engine_options(app):
+    """Resolve the engine profile into the app config; call before db.init_app"""
+    app.config['DB_PROFILE'] = profile_name(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+def install_connection_hooks(engine, config):
+    """Apply the per-connection SQLite PRAGMAs to every connection the engine opens"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+def describe(engine):
+    """Settings in effect on a live connection, for the readiness check"""
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            return {
+                name: connection.execute(text(f'PRAGMA {name}')).scalar()
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size')
+            }
+        if engine.dialect.name == 'postgresql':
+            status = engine.pool.status() if hasattr(engine.pool, 'status') else None
+            return {
+                'statement_timeout': connection.execute(text('SHOW statement_timeout')).scalar(),
+                'pool': status,
+            }
+        connection.execute(text('SELECT 1'))
+        return {}
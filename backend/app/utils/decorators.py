@@ -1,20 +1,40 @@
 from functools import wraps
-from flask import request, jsonify
-from app.utils.jwt_helper import decode_token
+from flask import request, jsonify, current_app
+from app import db
+from app.utils.jwt_helper import decode_token_claims
+from app.utils.principal_cache import Principal
 from app.models.user import User
 
 def get_current_user():
+    """Return the authenticated Principal (id, email, name, role), served from the principal cache when possible"""
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
         return None
 
     token = auth_header.split(' ')[1]
-    user_id = decode_token(token)
+    cache = current_app.extensions['principal_cache']
 
-    if not user_id:
+    principal = cache.get(token)
+    if principal:
+        return principal
+
+    epoch = cache.current_epoch()
+    claims = decode_token_claims(token)
+
+    if not claims:
+        return None
+
+    row = db.session.execute(
+        db.select(User.id, User.email, User.name, User.role).filter_by(id=claims['user_id'])
+    ).first()
+
+    if not row:
         return None
 
-    return User.query.get(user_id)
+    principal = Principal(*row)
+    cache.put(token, principal, claims['exp'], epoch)
+
+    return principal
 
 def require_auth(f):
     @wraps(f)
@@ -0,0 +1,163 @@
+import uuid
+from datetime import timezone
+from urllib.parse import quote
+from flask import current_app, request, Response
+from werkzeug.http import is_resource_modified, http_date
+from werkzeug.wsgi import wrap_file
+from app.utils.storage import CHUNK_SIZE
+from app.utils.storage_backends import get_storage
+
+# Requests asking for more ranges than this get the whole file instead,
+# which RFC 9110 allows and which keeps pathological Range headers cheap.
+MAX_RANGES = 32
+# Ranges are coalesced before serving; a request with more overlaps than this
+# is not a real client's, so it gets the whole file once (RFC 9110 §14.2).
+MAX_OVERLAPPING_RANGES = 2
+
+def file_etag(file_obj):
+    """Strong validator derived from stored identity: the content digest when known"""
+    if file_obj.sha256:
+        return file_obj.sha256
+    return f'{file_obj.id}-{file_obj.size_bytes}-{int(file_obj.updated_at.timestamp())}'
+
+def _last_modified(file_obj):
+    return file_obj.updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+
+def _content_disposition(file_obj, as_attachment):
+    kind = 'attachment' if as_attachment else 'inline'
+    return f"{kind}; filename*=UTF-8''{quote(file_obj.original_filename)}"
+
+def _multipart_ranges(storage, key, ranges, size, mime_type, boundary):
+    """Build a streamed multipart/byteranges body and its exact length"""
+    parts = [
+        (
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {mime_type}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+        ).encode('ascii')
+        for start, stop in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    length = sum(len(p) for p in parts) + sum(stop - start for start, stop in ranges) + len(closing)
+
+    def generate():
+        for header, (start, stop) in zip(parts, ranges):
+            yield header
+            yield from storage.read_range(key, start, stop - start)
+        yield closing
+
+    return generate(), length
+
+def _coalesce(ranges):
+    """Sort ranges and merge those that overlap or touch. Returns the merged ranges and how many overlapped."""
+    merged = []
+    overlaps = 0
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if start < merged[-1][1]:
+                overlaps += 1
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged, overlaps
+
+def _resolve_ranges(size):
+    """Return satisfiable [start, stop) ranges, None to serve the full body, or [] when unsatisfiable"""
+    parsed = request.range
+    if parsed is None or parsed.units != 'bytes' or len(parsed.ranges) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for start, stop in parsed.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        elif stop is None or stop > size:
+            stop = size
+        if start < stop:
+            ranges.append((start, stop))
+
+    ranges, overlaps = _coalesce(ranges)
+    if overlaps > MAX_OVERLAPPING_RANGES:
+        return None
+    return ranges
+
+def _if_range_matches(etag, last_modified):
+    if 'If-Range' not in request.headers:
+        return True
+
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        # RFC 9110 only lets a date validate the range when it is the exact Last-Modified.
+        return last_modified == if_range.date
+    return False
+
+def _offload(response, file_obj, full_path):
+    if full_path is None:
+        # Only files on local disk can be handed to the proxy.
+        return False
+    mode = current_app.config.get('SENDFILE_MODE')
+    if mode == 'x-accel-redirect':
+        prefix = current_app.config['SENDFILE_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f'{prefix}/{quote(file_obj.storage_path)}'
+        return True
+    if mode == 'x-sendfile':
+        response.headers['X-Sendfile'] = full_path
+        return True
+    return False
+
+def send_stored_file(file_obj, as_attachment=False):
+    """Serve a stored file with strong ETags, conditional GET, multi-range support and optional proxy offload"""
+    storage = get_storage()
+    full_path = storage.local_path(file_obj.storage_path)
+    etag = file_etag(file_obj)
+    last_modified = _last_modified(file_obj)
+
+    response = Response(mimetype=file_obj.mime_type)
+    response.set_etag(etag)
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Content-Disposition'] = _content_disposition(file_obj, as_attachment)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    if _offload(response, file_obj, full_path):
+        return response
+
+    size = storage.stat(file_obj.storage_path)
+    if size is None:
+        raise FileNotFoundError(file_obj.storage_path)
+    ranges = None
+    if 'Range' in request.headers and _if_range_matches(etag, last_modified):
+        ranges = _resolve_ranges(size)
+
+    if ranges == []:
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if ranges and len(ranges) == 1:
+        start, stop = ranges[0]
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.response = storage.read_range(file_obj.storage_path, start, stop - start)
+        response.content_length = stop - start
+        return response
+
+    if ranges:
+        boundary = uuid.uuid4().hex
+        body, length = _multipart_ranges(storage, file_obj.storage_path, ranges, size, file_obj.mime_type, boundary)
+        response.status_code = 206
+        response.headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+        response.response = body
+        response.content_length = length
+        return response
+
+    response.response = wrap_file(request.environ, storage.open(file_obj.storage_path), CHUNK_SIZE)
+    response.direct_passthrough = True
+    response.content_length = size
+    return response
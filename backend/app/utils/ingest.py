@@ -0,0 +1,78 @@
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from app.utils.storage import ContentCheck, create_temp_file, discard_staged, is_allowed_file
+
+# The decoder copies and shifts its buffer for every read, so moderate
+# reads parse faster than the 1 MiB CHUNK_SIZE used for file copies.
+READ_SIZE = 256 * 1024
+
+# The other form fields are short (name, folder_id, sha256, filename).
+MAX_FIELD_BYTES = 64 * 1024
+
+def read_upload(stream, content_type, max_bytes=None, on_file=None):
+    """Parse a multipart/form-data upload straight off the request stream.
+
+    The body is read once: the 'file' part is written to a staged temp file
+    as it arrives while ContentCheck sizes, hashes and validates it, and
+    reading stops at the first oversized or non-PDF chunk. Other fields are
+    collected as strings. on_file(fields, filename), if given, is called as
+    the file part begins, with the fields sent before it, and may raise to
+    reject the upload before its bytes are read. Returns (fields, staged)
+    where staged is (temp_path, filename, sha256, size), or None when no
+    file was sent.
+    """
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('Expected a multipart/form-data upload')
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    fields, staged = {}, None
+    part = value = out = check = temp_path = None
+
+    try:
+        event = None
+        while not isinstance(event, Epilogue):
+            chunk = stream.read(READ_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File) and event.name == 'file' and staged is None:
+                    if not event.filename:
+                        raise ValueError('No file selected')
+                    if not is_allowed_file(event.filename):
+                        raise ValueError('Only PDF files are allowed')
+                    if on_file:
+                        on_file(fields, event.filename)
+                    part, temp_path = event, create_temp_file()
+                    out, check = open(temp_path, 'wb'), ContentCheck(max_bytes)
+                elif isinstance(event, (Field, File)):
+                    part, value = event, bytearray()
+                elif isinstance(event, Data):
+                    if out:
+                        check.update(event.data)
+                        out.write(event.data)
+                    else:
+                        value += event.data
+                        if len(value) > MAX_FIELD_BYTES:
+                            raise ValueError('Form field is too large')
+
+                    if not event.more_data:
+                        if out:
+                            out.close()
+                            out = None
+                            staged = (temp_path, part.filename, check.finish(), check.size)
+                        elif isinstance(part, Field):
+                            fields[part.name] = value.decode('utf-8', 'replace')
+                event = decoder.next_event()
+
+            if not chunk and not isinstance(event, Epilogue):
+                raise ValueError('Upload ended before the multipart body was complete')
+    except Exception:
+        if out:
+            out.close()
+        discard_staged(temp_path)
+        raise
+
+    return fields, staged
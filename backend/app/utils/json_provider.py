@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+def _iso_utc(value):
+    """Naive datetimes in this app are UTC; render them the way to_dict() does"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat() + 'Z'
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson when it is installed, falling back to the stdlib encoder.
+
+    Datetimes are encoded natively as ISO 8601 UTC with a trailing Z.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return _iso_utc(o)
+        return DefaultJSONProvider.default(o)
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def encode(self, obj):
+        """Encode obj to compact UTF-8 bytes"""
+        if orjson is None:
+            return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+        return orjson.dumps(obj, default=self.default, option=self._options())
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
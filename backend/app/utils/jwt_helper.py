@@ -10,11 +10,14 @@ def generate_token(user_id):
     }
     return jwt.encode(payload, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
 
-def decode_token(token):
+def decode_token_claims(token):
     try:
-        payload = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-        return payload['user_id']
+        return jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+
+def decode_token(token):
+    payload = decode_token_claims(token)
+    return payload['user_id'] if payload else None
@@ -0,0 +1,68 @@
+from flask import current_app, jsonify, stream_with_context
+from app.utils.pagination import iter_keyset
+
+def parse_fields(args):
+    """Parse the fields= sparse fieldset into a set of keys, or None for every field"""
+    raw = args.get('fields', '').strip()
+    if not raw:
+        return None
+    fields = {f.strip() for f in raw.split(',') if f.strip()}
+    if not fields:
+        raise ValueError('Invalid fields')
+    return fields
+
+def wants_stream(args):
+    return args.get('stream', 'false').lower() == 'true'
+
+def _pick(item, fields):
+    if fields is None:
+        return item
+    return {k: v for k, v in item.items() if k in fields}
+
+def listing_response(sections, cursor, limit, serialize, fields=None, stream=False, **extra):
+    """Respond with a keyset page, either buffered through jsonify or streamed row by row.
+
+    sections are iter_keyset sections and serialize maps each kind to a
+    function turning a fetched item into a response dict. extra keys are
+    included alongside the sections, limit and next_cursor. Raises
+    ValueError for a bad cursor before any output is produced.
+    """
+    kinds = [kind for kind, _, _ in sections]
+    rows = iter_keyset(sections, cursor, limit)
+    first = next(rows)
+
+    if not stream:
+        body = dict(extra, **{kind: [] for kind in kinds}, limit=limit, next_cursor=None)
+        for kind, item in _chain(first, rows):
+            if kind is None:
+                body['next_cursor'] = item
+            else:
+                body[kind].append(_pick(serialize[kind](item), fields))
+        return jsonify(body)
+
+    encode = current_app.json.encode
+
+    def open_section(index):
+        return (b'],' if index else b'') + encode(kinds[index]) + b':['
+
+    def generate():
+        yield b'{' + b''.join(encode(k) + b':' + encode(v) + b',' for k, v in extra.items())
+        opened, count = 0, 0
+        for kind, item in _chain(first, rows):
+            if kind is None:
+                while opened < len(kinds):
+                    yield open_section(opened)
+                    opened += 1
+                yield b'],"limit":' + encode(limit) + b',"next_cursor":' + encode(item) + b'}\n'
+                return
+            while opened <= kinds.index(kind):
+                yield open_section(opened)
+                opened, count = opened + 1, 0
+            yield (b',' if count else b'') + encode(_pick(serialize[kind](item), fields))
+            count += 1
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+def _chain(first, rest):
+    yield first
+    yield from rest
@@ -0,0 +1,5 @@
+import unicodedata
+
+def name_key(name):
+    """Comparison key under which two names count as the same: NFC-normalized, trimmed and case-folded"""
+    return unicodedata.normalize('NFC', unicodedata.normalize('NFC', name).strip().casefold())
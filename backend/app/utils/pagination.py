@@ -0,0 +1,96 @@
+import base64
+import json
+from datetime import datetime
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def decode_cursor(token):
+    """Decode an opaque cursor token, raising ValueError if it was not produced by encode_cursor"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(data, dict):
+        raise ValueError('Invalid cursor')
+    return data
+
+def time_key(timestamp, row_id):
+    return [timestamp.isoformat(), row_id]
+
+def parse_time_key(after):
+    """Turn a [iso_timestamp, id] cursor key back into comparable values"""
+    try:
+        timestamp, row_id = after
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def iter_keyset(sections, cursor, limit):
+    """Walk several keyset-ordered result sets as one stable sequence.
+
+    sections is an ordered list of (kind, fetch, key): fetch(after, count)
+    returns an iterable of up to count rows sorted strictly after the key
+    list `after` (None for the start of the section) and key(row) returns a
+    row's JSON-safe sort key. Yields (kind, row) pairs, then a final
+    (None, next_cursor_token_or_None).
+    """
+    kinds = [kind for kind, _, _ in sections]
+    start, after = 0, None
+    if cursor:
+        if cursor.get('k') not in kinds:
+            raise ValueError('Invalid cursor')
+        start, after = kinds.index(cursor['k']), cursor.get('after')
+
+    remaining = limit
+    next_cursor = None
+
+    for position in range(start, len(sections)):
+        kind, fetch, key = sections[position]
+        rows = fetch(after if position == start else None, remaining + 1)
+        taken, last = 0, None
+        try:
+            for row in rows:
+                if taken == remaining:
+                    next_cursor = {'k': kind, 'after': key(last)}
+                    break
+                yield kind, row
+                taken, last = taken + 1, row
+        finally:
+            if hasattr(rows, 'close'):
+                rows.close()
+
+        if next_cursor:
+            break
+
+        remaining -= taken
+
+        if remaining == 0:
+            if position + 1 < len(sections):
+                next_cursor = {'k': kinds[position + 1], 'after': None}
+            break
+
+    yield None, encode_cursor(next_cursor) if next_cursor else None
+
+def keyset_page(sections, cursor, limit):
+    """Collect iter_keyset into ({kind: rows}, next_cursor_token_or_None)"""
+    page = {kind: [] for kind, _, _ in sections}
+    next_cursor = None
+    for kind, row in iter_keyset(sections, cursor, limit):
+        if kind is None:
+            next_cursor = row
+        else:
+            page[kind].append(row)
+    return page, next_cursor
+
+def get_page_args(args, default_limit, max_limit):
+    """Parse limit and cursor query arguments, raising ValueError on malformed input"""
+    try:
+        limit = int(args.get('limit', default_limit))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    return max(1, min(limit, max_limit)), decode_cursor(args.get('cursor'))
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from app import db
+from app.services import version_service
+
+Principal = namedtuple('Principal', ['id', 'email', 'name', 'role'])
+
+class PrincipalCache:
+    """Bounded, thread-safe TTL cache from verified bearer tokens to principals.
+
+    Invalidation is shared between worker processes, on any host, through
+    the principals data version: bumping it (e.g. after a role change) makes
+    every process drop its entries. Each process reads the version at most
+    once per check_interval seconds, so lookups in between cost no database
+    round trip.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60, check_interval=1):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._epoch = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config['PRINCIPAL_CACHE_SIZE']
+        self.ttl = app.config['PRINCIPAL_CACHE_TTL']
+        self.check_interval = app.config['PRINCIPAL_CACHE_CHECK_SECONDS']
+        app.extensions['principal_cache'] = self
+
+    def current_epoch(self):
+        """The principals data version, read from the database at most once per check_interval"""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._epoch
+        epoch = version_service.current([version_service.PRINCIPALS])[0]
+        with self._lock:
+            self._checked_at = now
+            self._sync_epoch(epoch)
+        return epoch
+
+    def _sync_epoch(self, epoch):
+        if epoch != self._epoch:
+            self._entries.clear()
+            self._epoch = epoch
+
+    def get(self, token):
+        self.current_epoch()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if not entry:
+                return None
+            principal, expires_at = entry
+            if expires_at <= now:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token, principal, token_expires_at, epoch):
+        """Cache a principal loaded while `epoch` was current; stale loads are dropped"""
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop cached principals in this process now and in every other one at its next version check. Commits."""
+        version_service.bump(principals=True)
+        db.session.commit()
+        with self._lock:
+            self._entries.clear()
+            self._checked_at = None
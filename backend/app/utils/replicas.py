@@ -0,0 +1,96 @@
+import random
+import time
+from flask import request
+from flask_sqlalchemy.session import Session
+
+# Requests that change data. Everything else may read from a replica.
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+def _is_plain_select(clause):
+    return (
+        clause is not None
+        and getattr(clause, 'is_select', False)
+        and getattr(clause, '_for_update_arg', None) is None
+    )
+
+class RoutingSession(Session):
+    """Session that sends the plain SELECTs of a read-only request to the replica chosen for it.
+
+    Everything else goes to the primary: writes, SELECT ... FOR UPDATE,
+    statements issued while flushing and all statements outside requests
+    marked read-only by ReplicaRouter.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica_bind')
+        if bind is None and replica is not None and not self._flushing and _is_plain_select(clause):
+            return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class ReplicaRouter:
+    """Routes read-only requests to read replicas, with read-your-writes stickiness.
+
+    Replica URIs become extra Flask-SQLAlchemy binds. A request whose
+    method does not write picks one replica for all of its reads. After a
+    write the response sets a short-lived cookie that keeps the client on
+    the primary until replicas have had time to catch up. The API is called
+    cross-origin, so the frontend sends credentials for the cookie to come back.
+    """
+
+    def __init__(self, sticky_seconds=5, cookie_name='db_primary_until', cookie_samesite='Lax'):
+        self.sticky_seconds = sticky_seconds
+        self.cookie_name = cookie_name
+        self.cookie_samesite = cookie_samesite
+        self.bind_keys = []
+        self._db = None
+
+    def configure(self, app):
+        """Add the replica binds to the app config; call before db.init_app"""
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        self.cookie_samesite = app.config['REPLICA_COOKIE_SAMESITE']
+        uris = app.config['SQLALCHEMY_REPLICA_URIS']
+        self.bind_keys = [f'replica_{i}' for i in range(len(uris))]
+        if uris:
+            # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS, so replicas get the primary's profile explicitly.
+            options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+            app.config['SQLALCHEMY_BINDS'] = {
+                **(app.config.get('SQLALCHEMY_BINDS') or {}),
+                **{key: {**options, 'url': uri} for key, uri in zip(self.bind_keys, uris)},
+            }
+
+    def init_app(self, app, db):
+        self._db = db
+        app.extensions['replica_router'] = self
+        if not self.bind_keys:
+            return
+
+        # Replicas mirror the primary's tables; no models are bound to them, so
+        # create_all and drop_all must not visit them.
+        for key in self.bind_keys:
+            db.metadatas.pop(key, None)
+
+        app.before_request(self._route_request)
+        app.after_request(self._mark_write)
+        app.teardown_request(self._clear)
+
+    def _sticky(self):
+        try:
+            return float(request.cookies.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _route_request(self):
+        if request.method not in WRITE_METHODS and not self._sticky():
+            self._db.session.info['replica_bind'] = random.choice(self.bind_keys)
+
+    def _mark_write(self, response):
+        if request.method in WRITE_METHODS and response.status_code < 500:
+            until = time.time() + self.sticky_seconds
+            response.set_cookie(
+                self.cookie_name, f'{until:.3f}', max_age=self.sticky_seconds,
+                httponly=True, samesite=self.cookie_samesite, secure=self.cookie_samesite == 'None'
+            )
+        return response
+
+    def _clear(self, exc):
+        self._db.session.info.pop('replica_bind', None)
@@ -0,0 +1,92 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app, request
+from app.services import version_service
+
+class ResponseCache:
+    """Bounded in-process LRU of rendered JSON responses, keyed by data version.
+
+    Keys combine the endpoint, its arguments and the current versions of the
+    scopes the response depends on, so writes invalidate entries simply by
+    bumping a version; stale entries are never served and age out of the
+    LRU. The byte budget counts response bodies.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_bytes = app.config['RESPONSE_CACHE_MB'] * 1024 * 1024
+        app.extensions['response_cache'] = self
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype):
+        # One response may use at most a quarter of the budget.
+        if len(body) * 4 > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (body, mimetype)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def size(self):
+        with self._lock:
+            return self._size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+def _etag(key):
+    return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+
+def cached_response(scopes, build, vary=()):
+    """Serve build() for the current request through the response cache.
+
+    scopes name the data versions the response depends on and vary adds any
+    other inputs (such as the caller's id) that change it. Versions are read
+    before building, so a cached body is never older than its key. A
+    matching If-None-Match is answered with 304 from the versions alone;
+    only 200 responses with a buffered body are stored.
+    """
+    key = (
+        request.endpoint,
+        tuple(sorted((request.view_args or {}).items())),
+        tuple(sorted(request.args.items(multi=True))),
+        tuple(vary),
+        version_service.current(scopes),
+    )
+    etag = _etag(key)
+    cache = current_app.extensions['response_cache']
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        entry = cache.get(key) if cache.max_bytes > 0 else None
+        if entry:
+            response = current_app.response_class(entry[0], mimetype=entry[1])
+        else:
+            response = current_app.make_response(build())
+            if response.status_code != 200:
+                return response
+            if cache.max_bytes > 0 and not response.is_streamed:
+                cache.put(key, response.get_data(), response.mimetype)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,69 @@
+import os
+from sqlalchemy import inspect
+
+def _script_directory(directory):
+    from alembic.config import Config as AlembicConfig
+    from alembic.script import ScriptDirectory
+
+    config = AlembicConfig()
+    config.set_main_option('script_location', directory)
+    return ScriptDirectory.from_config(config)
+
+def migration_heads(directory):
+    """Head revisions of the migration scripts in directory, or None when there are none"""
+    if not os.path.isdir(directory):
+        return None
+    return set(_script_directory(directory).get_heads()) or None
+
+def current_revisions(engine):
+    """Revisions the database is stamped at; empty when it has never been stamped"""
+    from alembic.runtime.migration import MigrationContext
+
+    with engine.connect() as connection:
+        return set(MigrationContext.configure(connection).get_current_heads())
+
+def schema_is_current(engine, directory):
+    """True when the database is stamped at the head revision of the migrations in directory"""
+    heads = migration_heads(directory)
+    return heads is not None and current_revisions(engine) == heads
+
+def stamp_heads(engine, directory):
+    """Record the database as being at the migration heads, as `flask db stamp` does"""
+    from alembic.runtime.migration import MigrationContext
+
+    with engine.begin() as connection:
+        MigrationContext.configure(connection).stamp(_script_directory(directory), 'heads')
+
+def ensure_schema(app):
+    """Create missing tables, unless DB_CREATE_ALL says otherwise or migrations manage the database.
+
+    In 'auto' mode an empty database is built with create_all and stamped at
+    the migration head, so `flask db upgrade` has nothing left to do. A
+    database that is already stamped, or that has tables but predates the
+    migrations, is left to `flask db upgrade`.
+    """
+    from app import db
+
+    mode = app.config['DB_CREATE_ALL']
+    if mode == 'never':
+        return
+    if mode == 'always':
+        db.create_all()
+        return
+
+    directory = app.config['MIGRATIONS_DIR']
+    heads = migration_heads(directory)
+    if heads is None:
+        db.create_all()
+        return
+
+    current = current_revisions(db.engine)
+    if current == heads:
+        app.logger.info('Database is at the migration head, skipping create_all')
+    elif current:
+        app.logger.warning('Database is behind the migration head, run `flask db upgrade`')
+    elif inspect(db.engine).get_table_names():
+        app.logger.warning('Database predates the migrations, stamp it at the baseline and run `flask db upgrade`')
+    else:
+        db.create_all()
+        stamp_heads(db.engine, directory)
@@ -0,0 +1,123 @@
+from sqlalchemy import select
+from app import db
+from app.models.user import User
+from app.models.folder import Folder
+from app.models.file import File
+from app.models.activity_log import ActivityLog
+
+# Column-only projections with the owner's name joined in. Rows come back as
+# plain tuples, so listings never hydrate ORM objects or trigger lazy loads.
+# Folder and file projections skip deleted rows awaiting purge.
+# Timestamps stay native datetimes; the app's JSON provider renders them.
+
+# Rows fetched per round trip when a listing streams from a server-side cursor.
+STREAM_BATCH_SIZE = 500
+
+def folder_select():
+    return select(
+        Folder.id,
+        Folder.name,
+        Folder.parent_id,
+        Folder.owner_id,
+        Folder.path,
+        User.name.label('owner_name'),
+        Folder.created_at,
+        Folder.updated_at,
+        Folder.total_bytes,
+        Folder.file_count,
+        Folder.last_modified,
+    ).outerjoin(User, User.id == Folder.owner_id).where(Folder.deleted_at.is_(None))
+
+def file_select():
+    return select(
+        File.id,
+        File.name,
+        File.original_filename,
+        File.size_bytes,
+        File.mime_type,
+        File.sha256,
+        File.folder_id,
+        File.owner_id,
+        User.name.label('owner_name'),
+        File.uploaded_at,
+        File.updated_at,
+    ).outerjoin(User, User.id == File.owner_id).where(File.deleted_at.is_(None))
+
+def activity_select():
+    return select(
+        ActivityLog.id,
+        ActivityLog.user_id,
+        User.name.label('user_name'),
+        ActivityLog.action,
+        ActivityLog.resource_type,
+        ActivityLog.resource_id,
+        ActivityLog.details,
+        ActivityLog.created_at,
+    ).outerjoin(User, User.id == ActivityLog.user_id)
+
+def serialize_folder(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'parent_id': row.parent_id,
+        'owner_id': row.owner_id,
+        'owner_name': row.owner_name,
+        'created_at': row.created_at,
+        'updated_at': row.updated_at,
+        'total_bytes': row.total_bytes,
+        'file_count': row.file_count,
+        'last_modified': row.last_modified,
+    }
+
+def serialize_file(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'original_filename': row.original_filename,
+        'size_bytes': row.size_bytes,
+        'mime_type': row.mime_type,
+        'sha256': row.sha256,
+        'folder_id': row.folder_id,
+        'owner_id': row.owner_id,
+        'owner_name': row.owner_name,
+        'uploaded_at': row.uploaded_at,
+        'updated_at': row.updated_at,
+    }
+
+def serialize_activity(row):
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'user_name': row.user_name or 'Anonymous',
+        'action': row.action,
+        'resource_type': row.resource_type,
+        'resource_id': row.resource_id,
+        'details': row.details,
+        'created_at': row.created_at,
+    }
+
+def fetch_rows(stmt, stream=False):
+    """All rows of stmt, or a lazily fetched result over a server-side cursor when streaming"""
+    if stream:
+        return db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+    return db.session.execute(stmt).all()
+
+def rows_by_ids(stmt, id_column, ids):
+    """Fetch projection rows for ids in one query, preserving the order of ids"""
+    if not ids:
+        return []
+    rows = db.session.execute(stmt.where(id_column.in_(ids))).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+def get_folder_row(folder_id):
+    return db.session.execute(folder_select().where(Folder.id == folder_id)).first()
+
+def get_file_row(file_id):
+    return db.session.execute(file_select().where(File.id == file_id)).first()
+
+def folder_contents(folder_id):
+    """Subfolder and file rows of a folder, one query each"""
+    subfolders = fetch_rows(folder_select().where(Folder.parent_id == folder_id).order_by(Folder.name))
+    files = fetch_rows(file_select().where(File.folder_id == folder_id).order_by(File.name))
+    return subfolders, files
@@ -1,8 +1,22 @@
+import hashlib
 import os
+import re
 import uuid
-from datetime import datetime
 from flask import current_app
-from werkzeug.utils import secure_filename
+from app.utils.storage_backends import get_storage
+
+BLOB_DIR = 'blobs'
+TMP_DIR = 'tmp'
+CHUNK_SIZE = 1024 * 1024
+
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Readers accept a PDF header anywhere in the first KiB and look for the
+# end-of-file marker in the last KiB, so uploads are checked the same way.
+PDF_HEADER = b'%PDF-'
+PDF_TRAILER = b'%%EOF'
+PDF_HEADER_WINDOW = 1024
+PDF_TRAILER_WINDOW = 1024
 
 def get_file_extension(filename):
     return os.path.splitext(filename)[1].lower()
@@ -11,49 +25,93 @@ def is_allowed_file(filename):
     ext = get_file_extension(filename)
     return ext in ['.pdf']
 
-def generate_unique_filename(original_filename):
-    ext = get_file_extension(original_filename)
-    unique_name = f"{uuid.uuid4().hex}{ext}"
-    return unique_name
-
-def get_storage_path(filename):
-    now = datetime.utcnow()
-    date_path = os.path.join(str(now.year), f"{now.month:02d}", f"{now.day:02d}")
-
-    full_path = os.path.join(
-        current_app.config['FILE_STORAGE_PATH'],
-        date_path
-    )
-
-    os.makedirs(full_path, exist_ok=True)
-
-    return os.path.join(date_path, filename)
-
-def save_file(file_storage):
-    if not file_storage:
-        raise ValueError('No file provided')
-
-    if not is_allowed_file(file_storage.filename):
-        raise ValueError('Only PDF files are allowed')
-
-    original_filename = secure_filename(file_storage.filename)
-    unique_filename = generate_unique_filename(original_filename)
-    storage_path = get_storage_path(unique_filename)
-
-    full_path = os.path.join(current_app.config['FILE_STORAGE_PATH'], storage_path)
-
-    file_storage.save(full_path)
-
-    return storage_path, original_filename
+def is_valid_sha256(digest):
+    return bool(digest) and bool(SHA256_PATTERN.match(digest))
+
+def blob_storage_path(sha256):
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+def create_temp_file():
+    tmp_dir = os.path.join(current_app.config['FILE_STORAGE_PATH'], TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    return os.path.join(tmp_dir, f'{uuid.uuid4().hex}.part')
+
+class FileTooLargeError(ValueError):
+    pass
+
+class ContentCheck:
+    """Running size, SHA-256 and PDF structure check over a file's bytes as they arrive.
+
+    update() fails as soon as the size limit is passed or the first
+    PDF_HEADER_WINDOW bytes hold no PDF header, so a bad upload is refused
+    without reading the rest of it. finish() checks for the end-of-file
+    marker and returns the hex digest.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self._tail = b''
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise FileTooLargeError('File exceeds the maximum upload size')
+
+        if len(self._head) < PDF_HEADER_WINDOW:
+            self._head += chunk[:PDF_HEADER_WINDOW - len(self._head)]
+            if len(self._head) == PDF_HEADER_WINDOW and PDF_HEADER not in self._head:
+                raise ValueError('File is not a valid PDF')
+
+        if len(chunk) >= PDF_TRAILER_WINDOW:
+            self._tail = chunk[-PDF_TRAILER_WINDOW:]
+        else:
+            self._tail = (self._tail + chunk)[-PDF_TRAILER_WINDOW:]
+        self._digest.update(chunk)
+
+    def finish(self):
+        if PDF_HEADER not in self._head or PDF_TRAILER not in self._tail:
+            raise ValueError('File is not a valid PDF')
+        return self._digest.hexdigest()
+
+def scan_file(path, max_bytes=None):
+    """Hash and validate a PDF on disk in one pass, returning its SHA-256"""
+    check = ContentCheck(max_bytes)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            check.update(chunk)
+    return check.finish()
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def commit_blob(temp_path, sha256):
+    """Hand a staged file to the storage backend as a blob, dropping it if the content is already stored"""
+    storage_path = blob_storage_path(sha256)
+    storage = get_storage()
+
+    if storage.exists(storage_path):
+        discard_staged(temp_path)
+    else:
+        storage.save(storage_path, temp_path)
+
+    return storage_path
+
+def discard_staged(temp_path):
+    if temp_path and os.path.exists(temp_path):
+        os.remove(temp_path)
 
 def delete_file(storage_path):
-    full_path = os.path.join(current_app.config['FILE_STORAGE_PATH'], storage_path)
-
-    if os.path.exists(full_path):
-        os.remove(full_path)
-        return True
-
-    return False
-
-def get_file_path(storage_path):
-    return os.path.join(current_app.config['FILE_STORAGE_PATH'], storage_path)
+    return get_storage().delete(storage_path)
@@ -0,0 +1,221 @@
+import os
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from flask import current_app
+
+CHUNK_SIZE = 1024 * 1024
+
+class StorageBackend(ABC):
+    """Where stored file contents live, addressed by the storage_path keys kept on blobs and files.
+
+    Uploads are always staged on local disk first (see app.utils.storage);
+    save() then hands the staged file over to the backend.
+    """
+
+    @abstractmethod
+    def save(self, key, source_path):
+        """Store the local file at source_path under key, consuming the source file"""
+
+    @abstractmethod
+    def stat(self, key):
+        """Size in bytes of the object at key, or None if there is none"""
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def open(self, key):
+        """A readable binary file object for the whole object"""
+
+    @abstractmethod
+    def read_range(self, key, start, length):
+        """Yield the bytes [start, start + length) in chunks of at most CHUNK_SIZE"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove the object, returning False if there was nothing to remove"""
+
+    @abstractmethod
+    def move(self, key, new_key):
+        """Move an object to a new key, raising FileNotFoundError if it does not exist"""
+
+    def local_path(self, key):
+        """Filesystem path of the object when the backend is local disk, else None"""
+        return None
+
+    @abstractmethod
+    def local_copy(self, key):
+        """Context manager yielding a filesystem path holding the object's bytes, for readers that need one"""
+
+class LocalStorage(StorageBackend):
+    """Objects as files under a root directory.
+
+    Content-addressed keys ('blobs/ab/cd/<sha256>') already spread files
+    evenly over 65536 leaf directories, so no directory grows large.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        return os.path.join(self.root, key)
+
+    def save(self, key, source_path):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def stat(self, key):
+        try:
+            return os.path.getsize(self.local_path(key))
+        except FileNotFoundError:
+            return None
+
+    def open(self, key):
+        return open(self.local_path(key), 'rb')
+
+    def read_range(self, key, start, length):
+        with self.open(key) as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def move(self, key, new_key):
+        new_path = self.local_path(new_key)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(self.local_path(key), new_path)
+
+    @contextmanager
+    def local_copy(self, key):
+        path = self.local_path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(key)
+        yield path
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket, optionally under a key prefix.
+
+    endpoint_url points the client at any S3-compatible service, such as
+    MinIO running locally. Requires boto3.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, temp_dir=None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError('The s3 storage backend requires boto3 (pip install boto3)')
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.temp_dir = temp_dir
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def _missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def save(self, key, source_path):
+        self.client.upload_file(source_path, self.bucket, self._key(key))
+        os.remove(source_path)
+
+    def stat(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+        except self.client.exceptions.ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self.client.exceptions.ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def read_range(self, key, start, length):
+        if length <= 0:
+            return
+        body = self.client.get_object(
+            Bucket=self.bucket, Key=self._key(key), Range=f'bytes={start}-{start + length - 1}'
+        )['Body']
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, key):
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def move(self, key, new_key):
+        if not self.exists(key):
+            raise FileNotFoundError(key)
+        # Server-side copy; objects here are bounded by MAX_FILE_SIZE_MB, well under the 5 GB copy limit.
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self._key(new_key),
+            CopySource={'Bucket': self.bucket, 'Key': self._key(key)}
+        )
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    @contextmanager
+    def local_copy(self, key):
+        if self.temp_dir:
+            os.makedirs(self.temp_dir, exist_ok=True)
+        path = os.path.join(self.temp_dir or '/tmp', f'{uuid.uuid4().hex}.download')
+        try:
+            self.client.download_file(self.bucket, self._key(key), path)
+        except self.client.exceptions.ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key)
+            raise
+        try:
+            yield path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+BACKENDS = ('local', 's3')
+
+def create_storage(config, kind=None):
+    """Build the storage backend named by kind, or by STORAGE_BACKEND"""
+    kind = kind or config['STORAGE_BACKEND']
+    if kind == 'local':
+        return LocalStorage(config['FILE_STORAGE_PATH'])
+    if kind == 's3':
+        if not config.get('S3_BUCKET'):
+            raise RuntimeError('S3_BUCKET must be set for the s3 storage backend')
+        return S3Storage(
+            config['S3_BUCKET'],
+            prefix=config.get('S3_PREFIX') or '',
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            temp_dir=os.path.join(config['FILE_STORAGE_PATH'], 'tmp'),
+        )
+    raise RuntimeError('STORAGE_BACKEND must be one of: ' + ', '.join(BACKENDS))
+
+def init_storage(app):
+    app.extensions['storage'] = create_storage(app.config)
+
+def get_storage():
+    return current_app.extensions['storage']
@@ -0,0 +1,141 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from app.services import suggest_service
+from app.utils.names import name_key
+
+# Words inside a name can be completed too, e.g. "rep" finds "Q3 Reports".
+_WORD_START = re.compile(r'(?<=[\s_\-.()\[\]])(?=\w)')
+
+# Journal rows this recent are read again on each refresh, see changes_since.
+SETTLE_SECONDS = 5
+
+# How often each process trims expired journal rows.
+TRIM_INTERVAL_SECONDS = 3600
+
+def _keys(name):
+    key = name_key(name)
+    return {key} | {key[m.start():] for m in _WORD_START.finditer(key)}
+
+class SuggestIndex:
+    """Per-process prefix index over live folder and file names for autocomplete.
+
+    Names are kept as one sorted array of (key, kind, id) entries, the full
+    name key plus one per word, so a prefix lookup is a binary search
+    followed by a short forward scan. The index is built once (in the
+    background when warmed at worker start) and then replays the
+    name_changes journal at most every `interval` seconds, so every worker
+    process converges on the same contents. One thread at a time reads the
+    database while the others keep answering from the current arrays.
+    """
+
+    def __init__(self, interval=1.0, retention_hours=24):
+        self.interval = interval
+        self.retention = timedelta(hours=retention_hours)
+        self._entries = []
+        self._items = {}
+        self._last_id = None
+        self._last_poll = 0.0
+        self._last_poll_at = None
+        self._last_trim = 0.0
+        # _lock guards the arrays and is never held across a query; _refresh_lock
+        # lets a single thread at a time bring them up to date.
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.interval = app.config['SUGGEST_POLL_INTERVAL']
+        self.retention = timedelta(hours=app.config['SUGGEST_JOURNAL_RETENTION_HOURS'])
+        app.extensions['suggest_index'] = self
+
+    def warm(self, app):
+        """Build the index in a background thread, so the first suggestions do not wait for it"""
+        def build():
+            with app.app_context():
+                self._refresh(wait=True)
+
+        threading.Thread(target=build, name='suggest-build', daemon=True).start()
+
+    def _set(self, kind, item_id, name, version):
+        """Apply one change unless a newer one for the same item was already applied"""
+        key = (kind, item_id)
+        current = self._items.get(key)
+        if current and current[0] >= version:
+            return
+
+        if current and current[1] is not None:
+            for text in _keys(current[1]):
+                entry = (text, kind, item_id)
+                i = bisect_left(self._entries, entry)
+                if i < len(self._entries) and self._entries[i] == entry:
+                    del self._entries[i]
+
+        if name is not None:
+            for text in _keys(name):
+                insort(self._entries, (text, kind, item_id))
+        self._items[key] = (version, name)
+
+    def _build(self):
+        started_at = datetime.utcnow()
+        last_id = suggest_service.latest_change_id()
+        entries, items = [], {}
+        for kind, item_id, name in suggest_service.live_names():
+            entries.extend((text, kind, item_id) for text in _keys(name))
+            items[(kind, item_id)] = (0, name)
+        entries.sort()
+
+        with self._lock:
+            self._entries, self._items = entries, items
+        self._last_id, self._last_poll_at = last_id, started_at
+        self._last_poll = time.monotonic()
+
+    def _refresh(self, wait=False):
+        """Bring the index up to date, or leave that to the thread already doing it unless wait is set"""
+        if not self._refresh_lock.acquire(blocking=wait):
+            return
+        try:
+            now = time.monotonic()
+            if self._last_id is None or now - self._last_poll > self.retention.total_seconds():
+                # First use, or idle for so long that the journal may have been trimmed.
+                self._build()
+                return
+            if now - self._last_poll < self.interval:
+                return
+
+            polled_at = datetime.utcnow()
+            settled_before = self._last_poll_at - timedelta(seconds=SETTLE_SECONDS)
+            changes = suggest_service.changes_since(self._last_id, settled_before)
+            with self._lock:
+                for change in changes:
+                    self._set(change.kind, change.item_id, change.name, change.id)
+            self._last_id = max([self._last_id] + [change.id for change in changes])
+            self._last_poll, self._last_poll_at = now, polled_at
+
+            if now - self._last_trim >= TRIM_INTERVAL_SECONDS:
+                self._last_trim = now
+                suggest_service.trim_changes(self.retention)
+        finally:
+            self._refresh_lock.release()
+
+    def suggest(self, prefix, limit=10):
+        """Up to limit {type, id, name} items whose name, or a word in it, starts with prefix, in key order"""
+        key = name_key(prefix)
+        if not key:
+            return []
+
+        # Only a process without any index yet waits for the refresh in progress.
+        self._refresh(wait=self._last_id is None)
+        with self._lock:
+            results, seen = [], set()
+            i = bisect_left(self._entries, (key,))
+            while i < len(self._entries) and len(results) < limit:
+                text, kind, item_id = self._entries[i]
+                if not text.startswith(key):
+                    break
+                if (kind, item_id) not in seen:
+                    seen.add((kind, item_id))
+                    results.append({'type': kind, 'id': item_id, 'name': self._items[(kind, item_id)][1]})
+                i += 1
+            return results
@@ -0,0 +1,7 @@
+def dialect_insert(dialect_name):
+    """The insert() construct with ON CONFLICT support for the given dialect"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
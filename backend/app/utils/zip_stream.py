@@ -0,0 +1,74 @@
+import time
+import zipfile
+from app.utils.storage import CHUNK_SIZE
+
+class _ChunkBuffer:
+    """Write-only, non-seekable sink that zipfile writes into and the response drains.
+
+    Because tell() works but seek() does not, zipfile writes entry sizes in
+    data descriptors after each entry instead of seeking back to patch them.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Hand over everything written since the last drain"""
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def _open_path(path):
+    return open(path, 'rb')
+
+def stream_zip(entries, open_source=_open_path):
+    """Yield a ZIP archive piece by piece from (arcname, source, size, modified_at) entries.
+
+    Entries with source None become directories; for the others
+    open_source(source) returns a readable binary file. Files are stored
+    uncompressed and read in CHUNK_SIZE pieces, so memory use stays at about
+    one chunk per archive no matter how large it gets.
+    """
+    buffer = _ChunkBuffer()
+
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, source_key, size, modified_at in entries:
+            info = zipfile.ZipInfo(arcname, date_time=_zip_time(modified_at))
+            info.compress_type = zipfile.ZIP_STORED
+
+            if source_key is None:
+                info.external_attr = 0o40775 << 16 | 0x10
+                archive.writestr(info, b'')
+            else:
+                info.external_attr = 0o644 << 16
+                info.file_size = size
+                with open_source(source_key) as source, archive.open(info, 'w') as target:
+                    while True:
+                        chunk = source.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        yield from buffer.drain()
+            yield from buffer.drain()
+
+    yield from buffer.drain()
+
+def _zip_time(value):
+    # ZIP timestamps cannot predate 1980.
+    if value is None or value.year < 1980:
+        return time.localtime()[:6]
+    return value.timetuple()[:6]
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import time
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Import and build the app once in the master; workers are forked from it
+# and boot without repeating imports or create_app.
+preload_app = True
+
+workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() * 2 + 1)
+# 'gthread' suits this mostly I/O-bound API. 'gevent' also works but needs gevent installed.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Large uploads and folder ZIPs stream for a while; keep this above the slowest expected transfer.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+
+if worker_class == 'gevent':
+    # With preload the app is imported in the master, so patch before that happens.
+    from gevent import monkey
+    monkey.patch_all()
+
+_fork_times = {}
+
+def when_ready(server):
+    from wsgi import app
+    startup = app.config['STARTUP_SECONDS']
+    server.log.info(
+        f"App loaded in {startup['total']:.3f}s "
+        f"(imports {startup['imports']:.3f}s, create_app {startup['create_app']:.3f}s)"
+    )
+
+def post_fork(server, worker):
+    _fork_times[worker.pid] = time.perf_counter()
+
+    # Pooled connections and storage clients made while preloading belong to
+    # the master; each worker opens its own.
+    from app import db
+    from app.utils.storage_backends import init_storage
+    from wsgi import app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    init_storage(app)
+
+def post_worker_init(worker):
+    # Build this worker's autocomplete index while it starts taking requests.
+    from wsgi import app
+    app.extensions['suggest_index'].warm(app)
+
+    started = _fork_times.pop(worker.pid, None)
+    if started is not None:
+        worker.log.info(f'Worker {worker.pid} booted in {(time.perf_counter() - started) * 1000:.1f}ms')
@@ -0,0 +1,108 @@
+"""baseline schema
+
+The tables as the application created them before it shipped migrations.
+Databases that predate this directory are already at this revision; mark
+them with `flask db stamp 5d1c2a7e9b04` before running `flask db upgrade`.
+
+Revision ID: 5d1c2a7e9b04
+Revises:
+Create Date: 2026-10-17 09:12:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1c2a7e9b04'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=255), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('password_hash', sa.String(length=255), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_login', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+
+    op.create_table('activity_logs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.String(length=50), nullable=False),
+    sa.Column('resource_type', sa.String(length=50), nullable=False),
+    sa.Column('resource_id', sa.Integer(), nullable=True),
+    sa.Column('details', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('activity_logs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_activity_logs_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_activity_logs_user_id'), ['user_id'], unique=False)
+
+    op.create_table('folders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['parent_id'], ['folders.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('parent_id', 'name', 'owner_id', name='unique_folder_name_per_parent')
+    )
+    with op.batch_alter_table('folders', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_folders_owner_id'), ['owner_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_folders_parent_id'), ['parent_id'], unique=False)
+
+    op.create_table('files',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('original_filename', sa.String(length=255), nullable=False),
+    sa.Column('storage_path', sa.String(length=512), nullable=False),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('mime_type', sa.String(length=100), nullable=False),
+    sa.Column('folder_id', sa.Integer(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('uploaded_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['folder_id'], ['folders.id'], ),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('folder_id', 'name', 'owner_id', name='unique_file_name_per_folder')
+    )
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_files_folder_id'), ['folder_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_files_owner_id'), ['owner_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_files_owner_id'))
+        batch_op.drop_index(batch_op.f('ix_files_folder_id'))
+
+    op.drop_table('files')
+    with op.batch_alter_table('folders', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_folders_parent_id'))
+        batch_op.drop_index(batch_op.f('ix_folders_owner_id'))
+
+    op.drop_table('folders')
+    with op.batch_alter_table('activity_logs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_activity_logs_user_id'))
+        batch_op.drop_index(batch_op.f('ix_activity_logs_created_at'))
+
+    op.drop_table('activity_logs')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
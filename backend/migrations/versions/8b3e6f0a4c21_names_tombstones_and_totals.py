@@ -0,0 +1,335 @@
+"""name keys, tombstones, folder paths and totals, blobs and the new tables
+
+Brings a baseline database up to the models: adds the columns introduced
+since, backfills them from the existing rows and creates the tables and
+indexes that create_all would have made. Names must now be unique across
+all live folders (and all live files) after normalization, where the
+baseline only kept them unique per parent and owner; the oldest item keeps
+each name and the others are renamed 'Name (2)', 'Name (3)', ... with a
+warning logged for every rename, before the unique indexes are created.
+
+Revision ID: 8b3e6f0a4c21
+Revises: 5d1c2a7e9b04
+Create Date: 2026-10-17 09:40:05.527164
+
+"""
+import logging
+from alembic import op
+import sqlalchemy as sa
+from app.utils.names import name_key
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e6f0a4c21'
+down_revision = '5d1c2a7e9b04'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+NAME_LENGTH = 255
+
+users = sa.table('users',
+    sa.column('id', sa.Integer), sa.column('storage_used_bytes', sa.BigInteger))
+folders = sa.table('folders',
+    sa.column('id', sa.Integer), sa.column('name', sa.String), sa.column('name_key', sa.String),
+    sa.column('parent_id', sa.Integer), sa.column('path', sa.String),
+    sa.column('total_bytes', sa.BigInteger), sa.column('file_count', sa.Integer),
+    sa.column('last_modified', sa.DateTime))
+files = sa.table('files',
+    sa.column('id', sa.Integer), sa.column('name', sa.String), sa.column('name_key', sa.String),
+    sa.column('folder_id', sa.Integer), sa.column('owner_id', sa.Integer),
+    sa.column('size_bytes', sa.BigInteger), sa.column('updated_at', sa.DateTime))
+
+
+def _deduplicated_name(name, n, used):
+    while True:
+        suffix = f' ({n})'
+        candidate = name[:NAME_LENGTH - len(suffix)] + suffix
+        if name_key(candidate) not in used:
+            return candidate
+        n += 1
+
+
+def backfill_name_keys(connection, table, kind):
+    """Set name_key on every row, renaming the later holders of a name that normalizes the same as an earlier one"""
+    rows = connection.execute(sa.select(table.c.id, table.c.name).order_by(table.c.id)).all()
+    keys = {row.id: name_key(row.name) for row in rows}
+    used = set(keys.values())
+    seen = set()
+    updates = []
+
+    for row in rows:
+        key = keys[row.id]
+        name = row.name
+        if key in seen:
+            name = _deduplicated_name(row.name, 2, used)
+            key = name_key(name)
+            used.add(key)
+            logger.warning('Renamed %s %s from %r to %r: names must be unique after normalization',
+                           kind, row.id, row.name, name)
+        seen.add(key)
+        updates.append({'r_id': row.id, 'r_name': name, 'r_key': key})
+
+    if updates:
+        connection.execute(
+            table.update().where(table.c.id == sa.bindparam('r_id'))
+            .values(name=sa.bindparam('r_name'), name_key=sa.bindparam('r_key')),
+            updates
+        )
+
+
+def backfill_folder_paths(connection):
+    parents = dict(connection.execute(sa.select(folders.c.id, folders.c.parent_id)).all())
+    paths = {}
+
+    def path_of(folder_id):
+        # Walk up to the nearest folder with a known path, then fill in on the way back down.
+        chain = []
+        while folder_id is not None and folder_id not in paths:
+            chain.append(folder_id)
+            folder_id = parents.get(folder_id)
+        prefix = paths.get(folder_id, '/')
+        for item in reversed(chain):
+            prefix = paths[item] = f'{prefix}{item}/'
+        return prefix
+
+    for folder_id in parents:
+        path_of(folder_id)
+
+    if paths:
+        connection.execute(
+            folders.update().where(folders.c.id == sa.bindparam('f_id')).values(path=sa.bindparam('f_path')),
+            [{'f_id': folder_id, 'f_path': path} for folder_id, path in paths.items()]
+        )
+    return paths
+
+
+def backfill_folder_totals(connection, paths):
+    """Recursive size, file count and newest file change per folder, as `flask rebuild-folder-totals` computes them"""
+    totals = {folder_id: [0, 0, None] for folder_id in paths}
+    direct = connection.execute(
+        sa.select(files.c.folder_id, sa.func.sum(files.c.size_bytes), sa.func.count(), sa.func.max(files.c.updated_at))
+        .where(files.c.folder_id.is_not(None))
+        .group_by(files.c.folder_id)
+    ).all()
+
+    for folder_id, size, count, modified in direct:
+        for ancestor in (int(i) for i in paths.get(folder_id, '').strip('/').split('/') if i):
+            entry = totals[ancestor]
+            entry[0] += size or 0
+            entry[1] += count
+            if modified and (entry[2] is None or modified > entry[2]):
+                entry[2] = modified
+
+    touched = [
+        {'f_id': folder_id, 'f_total_bytes': size, 'f_file_count': count, 'f_last_modified': modified}
+        for folder_id, (size, count, modified) in totals.items() if count
+    ]
+    if touched:
+        connection.execute(
+            folders.update().where(folders.c.id == sa.bindparam('f_id')).values(
+                total_bytes=sa.bindparam('f_total_bytes'),
+                file_count=sa.bindparam('f_file_count'),
+                last_modified=sa.bindparam('f_last_modified'),
+            ),
+            touched
+        )
+
+
+def backfill_storage_usage(connection):
+    used = (
+        sa.select(sa.func.coalesce(sa.func.sum(files.c.size_bytes), 0))
+        .where(files.c.owner_id == users.c.id)
+        .scalar_subquery()
+    )
+    connection.execute(users.update().values(storage_used_bytes=used))
+
+
+def upgrade():
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('storage_path', sa.String(length=512), nullable=False),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.create_table('data_versions',
+    sa.Column('scope', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('scope')
+    )
+    op.create_table('name_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('name_changes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_name_changes_created_at'), ['created_at'], unique=False)
+
+    op.create_table('activity_daily_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('resource_type', sa.String(length=50), nullable=False),
+    sa.Column('resource_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'resource_type', 'resource_id', 'action')
+    )
+    with op.batch_alter_table('activity_daily_rollups', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_rollups_action_day', ['action', 'day'], unique=False)
+        batch_op.create_index('ix_activity_rollups_resource_day', ['resource_type', 'resource_id', 'day'], unique=False)
+
+    with op.batch_alter_table('activity_logs', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_action_created', ['action', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_activity_resource_created', ['resource_type', 'resource_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_activity_user_created', ['user_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_used_bytes', sa.BigInteger(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('storage_quota_bytes', sa.BigInteger(), nullable=True))
+        batch_op.create_index('ix_users_created', ['created_at', 'id'], unique=False)
+
+    # name_key starts out nullable and is tightened once every row has one.
+    with op.batch_alter_table('folders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_key', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('path', sa.String(length=1024), nullable=True))
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('total_bytes', sa.BigInteger(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('file_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_modified', sa.DateTime(), nullable=True))
+        batch_op.drop_constraint('unique_folder_name_per_parent', type_='unique')
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_key', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('sha256', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_files_sha256_blobs', 'blobs', ['sha256'], ['sha256'])
+        batch_op.drop_constraint('unique_file_name_per_folder', type_='unique')
+
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('folder_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('total_size', sa.BigInteger(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=True),
+    sa.Column('temp_path', sa.String(length=512), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['folder_id'], ['folders.id'], ),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_sessions_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_upload_sessions_owner_id'), ['owner_id'], unique=False)
+
+    op.create_table('upload_chunks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.String(length=32), nullable=False),
+    sa.Column('offset', sa.BigInteger(), nullable=False),
+    sa.Column('length', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['upload_sessions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_chunks', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_chunks_session_id'), ['session_id'], unique=False)
+
+    op.create_table('file_contents',
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('page_count', sa.Integer(), nullable=True),
+    sa.Column('doc_metadata', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('extracted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('file_id')
+    )
+    with op.batch_alter_table('file_contents', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_file_contents_status'), ['status'], unique=False)
+
+    op.create_table('file_pages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('page_number', sa.Integer(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('file_pages', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_file_pages_file_id'), ['file_id'], unique=False)
+
+    connection = op.get_bind()
+    backfill_name_keys(connection, folders, 'folder')
+    backfill_name_keys(connection, files, 'file')
+    backfill_folder_totals(connection, backfill_folder_paths(connection))
+    backfill_storage_usage(connection)
+
+    with op.batch_alter_table('folders', schema=None) as batch_op:
+        batch_op.alter_column('name_key', existing_type=sa.String(length=255), nullable=False)
+        batch_op.create_index(batch_op.f('ix_folders_deleted_at'), ['deleted_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_folders_path'), ['path'], unique=False)
+        batch_op.create_index('ix_folders_parent_created', ['parent_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('uq_folders_name_key', ['name_key'], unique=True,
+                              sqlite_where=sa.text('deleted_at IS NULL'), postgresql_where=sa.text('deleted_at IS NULL'))
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.alter_column('name_key', existing_type=sa.String(length=255), nullable=False)
+        batch_op.create_index(batch_op.f('ix_files_deleted_at'), ['deleted_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_files_sha256'), ['sha256'], unique=False)
+        batch_op.create_index('ix_files_folder_uploaded', ['folder_id', 'uploaded_at', 'id'], unique=False)
+        batch_op.create_index('uq_files_name_key', ['name_key'], unique=True,
+                              sqlite_where=sa.text('deleted_at IS NULL'), postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    # Renames made to deduplicate names are kept.
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index('uq_files_name_key')
+        batch_op.drop_index('ix_files_folder_uploaded')
+        batch_op.drop_index(batch_op.f('ix_files_sha256'))
+        batch_op.drop_index(batch_op.f('ix_files_deleted_at'))
+        batch_op.drop_constraint('fk_files_sha256_blobs', type_='foreignkey')
+        batch_op.drop_column('deleted_at')
+        batch_op.drop_column('sha256')
+        batch_op.drop_column('name_key')
+        batch_op.create_unique_constraint('unique_file_name_per_folder', ['folder_id', 'name', 'owner_id'])
+
+    with op.batch_alter_table('folders', schema=None) as batch_op:
+        batch_op.drop_index('uq_folders_name_key')
+        batch_op.drop_index('ix_folders_parent_created')
+        batch_op.drop_index(batch_op.f('ix_folders_path'))
+        batch_op.drop_index(batch_op.f('ix_folders_deleted_at'))
+        batch_op.drop_column('last_modified')
+        batch_op.drop_column('file_count')
+        batch_op.drop_column('total_bytes')
+        batch_op.drop_column('deleted_at')
+        batch_op.drop_column('path')
+        batch_op.drop_column('name_key')
+        batch_op.create_unique_constraint('unique_folder_name_per_parent', ['parent_id', 'name', 'owner_id'])
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_created')
+        batch_op.drop_column('storage_quota_bytes')
+        batch_op.drop_column('storage_used_bytes')
+
+    with op.batch_alter_table('activity_logs', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_user_created')
+        batch_op.drop_index('ix_activity_resource_created')
+        batch_op.drop_index('ix_activity_action_created')
+
+    op.drop_table('file_pages')
+    op.drop_table('file_contents')
+    op.drop_table('upload_chunks')
+    op.drop_table('upload_sessions')
+    op.drop_table('activity_daily_rollups')
+    op.drop_table('name_changes')
+    op.drop_table('data_versions')
+    op.drop_table('blobs')
@@ -0,0 +1,45 @@
+"""search index and name journal triggers
+
+The FTS5 tables (trigram indexes on PostgreSQL) behind search, and the
+triggers that journal name changes for suggestions. create_all installs
+them through metadata after_create hooks, which never run for a database
+built by migrations, so this revision runs the same hooks.
+
+Revision ID: c47d09e2f5b6
+Revises: 8b3e6f0a4c21
+Create Date: 2026-10-17 11:02:51.804417
+
+"""
+from alembic import op
+from app.services import search_service, suggest_service
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47d09e2f5b6'
+down_revision = '8b3e6f0a4c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    search_service.create_search_index(None, connection)
+    suggest_service.create_name_triggers(None, connection)
+
+
+def downgrade():
+    connection = op.get_bind()
+    if connection.dialect.name == 'sqlite':
+        for table in ('folders', 'files'):
+            for suffix in ('ai', 'au', 'ad'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_names_{suffix}')
+        for table in search_service._SQLITE_INDEXES:
+            for suffix in ('ai', 'au', 'ad'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_{suffix}')
+        search_service.drop_search_index(None, connection)
+    elif connection.dialect.name == 'postgresql':
+        for table in ('folders', 'files'):
+            op.execute(f'DROP TRIGGER IF EXISTS {table}_names ON {table}')
+        op.execute('DROP FUNCTION IF EXISTS record_name_change()')
+        for index in ('ix_folders_name_trgm', 'ix_files_name_trgm', 'ix_files_original_filename_trgm', 'ix_file_pages_text_tsv'):
+            op.execute(f'DROP INDEX IF EXISTS {index}')
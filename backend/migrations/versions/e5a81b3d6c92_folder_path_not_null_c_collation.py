@@ -0,0 +1,81 @@
+"""folder paths NOT NULL, compared bytewise
+
+Subtree queries scan the path index over [path, path[:-1] + '0'), which
+only selects a subtree when paths sort bytewise: the C collation on
+PostgreSQL (SQLite's default BINARY collation already does). Paths missing
+from rows written outside the application are filled in first.
+
+Revision ID: e5a81b3d6c92
+Revises: c47d09e2f5b6
+Create Date: 2026-10-17 13:25:17.340958
+
+"""
+import logging
+from alembic import op
+import sqlalchemy as sa
+from app.services import search_service, suggest_service
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a81b3d6c92'
+down_revision = 'c47d09e2f5b6'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+folders = sa.table('folders',
+    sa.column('id', sa.Integer), sa.column('parent_id', sa.Integer), sa.column('path', sa.String))
+
+PATH_TYPE = sa.String(length=1024).with_variant(sa.String(length=1024, collation='C'), 'postgresql')
+
+
+def backfill_missing_paths(connection):
+    rows = connection.execute(sa.select(folders.c.id, folders.c.parent_id, folders.c.path)).all()
+    parents = {row.id: row.parent_id for row in rows}
+    paths = {row.id: row.path for row in rows if row.path}
+    missing = [row.id for row in rows if not row.path]
+
+    def path_of(folder_id):
+        chain = []
+        while folder_id is not None and folder_id not in paths and folder_id in parents and folder_id not in chain:
+            chain.append(folder_id)
+            folder_id = parents[folder_id]
+        if folder_id is not None and folder_id not in paths:
+            # A parent that no longer exists, or a cycle: start again from the root.
+            logger.warning('Folder %s has no reachable parent, giving it a root path', chain[-1])
+            folder_id = None
+        prefix = paths.get(folder_id, '/')
+        for item in reversed(chain):
+            prefix = paths[item] = f'{prefix}{item}/'
+        return prefix
+
+    updates = [{'f_id': folder_id, 'f_path': path_of(folder_id)} for folder_id in missing]
+    if updates:
+        connection.execute(
+            folders.update().where(folders.c.id == sa.bindparam('f_id')).values(path=sa.bindparam('f_path')),
+            updates
+        )
+
+
+def upgrade():
+    connection = op.get_bind()
+    backfill_missing_paths(connection)
+
+    with op.batch_alter_table('folders', schema=None) as batch_op:
+        batch_op.alter_column('path', existing_type=sa.String(length=1024), type_=PATH_TYPE, nullable=False)
+
+    if connection.dialect.name == 'sqlite':
+        # Rebuilding the table in batch mode dropped its triggers.
+        search_service.create_search_index(None, connection)
+        suggest_service.create_name_triggers(None, connection)
+
+
+def downgrade():
+    connection = op.get_bind()
+    with op.batch_alter_table('folders', schema=None) as batch_op:
+        batch_op.alter_column('path', existing_type=PATH_TYPE, type_=sa.String(length=1024), nullable=True)
+
+    if connection.dialect.name == 'sqlite':
+        search_service.create_search_index(None, connection)
+        suggest_service.create_name_triggers(None, connection)
@@ -1,3 +1,4 @@
+import os
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -6,4 +7,5 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # Development server only; production runs gunicorn with gunicorn.conf.py.
+    app.run(host='0.0.0.0', port=5001, debug=os.environ.get('FLASK_ENV') == 'development')
@@ -6,6 +6,10 @@ class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     FILE_STORAGE_PATH = '/tmp/test_storage'
+    CONTENT_EXTRACTION_WORKERS = 0
+    PURGE_WORKERS = 0
+    ACTIVITY_FLUSH_INTERVAL = 0
+    SUGGEST_POLL_INTERVAL = 0
 
 @pytest.fixture
 def app():
@@ -13,6 +17,7 @@ def app():
     with app.app_context():
         db.create_all()
         yield app
+        app.extensions['activity_recorder'].flush()
         db.session.remove()
         db.drop_all()
 
@@ -23,3 +28,35 @@ def client(app):
 @pytest.fixture
 def runner(app):
     return app.test_cli_runner()
+
+def build_pdf(pages, title=None):
+    """Build a minimal single-font PDF whose pages contain the given text lines"""
+    objects = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append('<< /Type /Catalog /Pages 2 0 R >>')
+    objects.append('<< /Type /Pages /Kids [{}] /Count {} >>'.format(
+        ' '.join(f'{i} 0 R' for i in page_ids), len(pages)))
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    for i, text in enumerate(pages):
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[i] + 1} 0 R >>')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+    if title:
+        objects.append(f'<< /Title ({title}) >>')
+
+    body = '%PDF-1.4\n'
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f'{number} 0 obj\n{obj}\nendobj\n'
+    xref = len(body)
+    body += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'
+    body += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets)
+    info = f' /Info {len(objects)} 0 R' if title else ''
+    body += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R{info} >>\nstartxref\n{xref}\n%%EOF\n'
+    return body.encode('latin-1')
+
+@pytest.fixture
+def make_pdf():
+    return build_pdf
@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+from app.models.user import User
+from app.models.activity_log import ActivityLog
+from app import db
+from tests.test_files import create_user_and_login, upload
+
+
+def login_admin(client, app):
+    token = create_user_and_login(client, app, email='admin@example.com', name='Admin')
+    user = User.query.filter_by(email='admin@example.com').first()
+    user.role = 'admin'
+    db.session.commit()
+    app.extensions['principal_cache'].invalidate()
+    return token, user.id
+
+
+def test_activity_is_buffered_and_flushed_in_bulk(client, app, make_pdf):
+    """Test that events queue in memory and reach the table in one flush"""
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    file_id = json.loads(upload(client, token, make_pdf(['Term sheet']), 'Term Sheet').data)['file']['id']
+    client.get(f'/api/files/{file_id}', headers=headers)
+    client.get(f'/api/files/{file_id}/download')
+    client.delete(f'/api/files/{file_id}', headers=headers)
+
+    recorder = app.extensions['activity_recorder']
+    assert ActivityLog.query.count() == 0
+    assert recorder.pending() == 4
+
+    assert recorder.flush() == 4
+    rows = ActivityLog.query.order_by(ActivityLog.id).all()
+    assert [(r.action, r.resource_type, r.resource_id) for r in rows] == [
+        ('upload', 'file', file_id), ('view', 'file', file_id),
+        ('download', 'file', file_id), ('delete', 'file', file_id),
+    ]
+    assert rows[1].user_id == rows[0].user_id
+    assert rows[2].user_id is None
+
+
+def test_activity_flushes_when_batch_is_full(client, app):
+    """Test that reaching the batch size writes the queued events"""
+    recorder = app.extensions['activity_recorder']
+    recorder.batch_size = 3
+
+    for folder_id in range(3):
+        recorder.record('view', 'folder', folder_id)
+
+    assert recorder.pending() == 0
+    assert ActivityLog.query.count() == 3
+
+
+def test_failed_flush_keeps_the_newest_events(client, app, monkeypatch):
+    """Test that a failed batch is requeued ahead of newer events, dropping the oldest when the buffer overflows"""
+    from collections import deque
+    from app.services import activity_service
+    recorder = app.extensions['activity_recorder']
+    recorder._events = deque(maxlen=3)
+    recorder.record('view', 'file', 1)
+    recorder.record('view', 'file', 2)
+
+    def fail_midway(connection, events):
+        recorder.record('view', 'file', 3)
+        recorder.record('view', 'file', 4)
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(activity_service, 'rollup_events', fail_midway)
+    assert recorder.flush() == 0
+
+    assert [event['resource_id'] for event in recorder._events] == [2, 3, 4]
+
+
+def test_activity_api_filters_and_exports(client, app):
+    """Test that admins can filter activity and export it as CSV"""
+    token, admin_id = login_admin(client, app)
+    recorder = app.extensions['activity_recorder']
+    recorder.record('view', 'file', 1, admin_id)
+    recorder.record('download', 'file', 1, admin_id)
+    recorder.record('download', 'file', 2)
+    recorder.record('view', 'folder', 1, admin_id, {'name': 'Board'})
+    headers = {'Authorization': f'Bearer {token}'}
+
+    data = json.loads(client.get('/api/activity?action=download', headers=headers).data)
+    assert [(a['resource_id'], a['user_name']) for a in data['activity']] == [(2, 'Anonymous'), (1, 'Admin')]
+
+    data = json.loads(client.get('/api/activity?resource_type=file&resource_id=1&limit=1', headers=headers).data)
+    assert [a['action'] for a in data['activity']] == ['download']
+    data = json.loads(client.get(f"/api/activity?resource_type=file&resource_id=1&cursor={data['next_cursor']}", headers=headers).data)
+    assert [a['action'] for a in data['activity']] == ['view']
+
+    assert client.get('/api/activity?since=yesterday', headers=headers).status_code == 400
+    assert client.get('/api/activity?since=2000-01-01T00:00:00Z&until=2000-01-02', headers=headers).json['activity'] == []
+
+    response = client.get(f'/api/activity/export?user_id={admin_id}', headers=headers)
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.data.decode('utf-8'))))
+    assert [r['action'] for r in rows] == ['view', 'download', 'view']
+    assert json.loads(rows[2]['details']) == {'name': 'Board'}
+
+    prankster = User(email='prank@example.com', name='=SUM(1)')
+    prankster.set_password('password123')
+    db.session.add(prankster)
+    db.session.commit()
+    recorder.record('view', 'file', 1, prankster.id)
+    response = client.get(f'/api/activity/export?user_id={prankster.id}', headers=headers)
+    assert list(csv.DictReader(io.StringIO(response.data.decode('utf-8'))))[0]['user_name'] == "'=SUM(1)"
+
+
+def test_activity_api_requires_admin(client, app):
+    """Test that regular users cannot read the activity log"""
+    token = create_user_and_login(client, app)
+
+    response = client.get('/api/activity', headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 403
+
+
+def test_rollups_track_flushes_and_survive_pruning(client, app, tmp_path):
+    """Test that flushes maintain daily rollups and pruning keeps them while removing raw rows"""
+    from datetime import datetime, timedelta
+    import gzip
+    from app.models.activity_log import ActivityRollup
+    from app.services import activity_service
+
+    token, admin_id = login_admin(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    recorder = app.extensions['activity_recorder']
+    old = datetime.utcnow() - timedelta(days=400)
+    for _ in range(3):
+        recorder.record('download', 'file', 7, admin_id)
+    recorder.record('view', 'file', 7)
+    recorder.record('download', 'file', 8)
+    recorder.flush()
+    recorder.record('download', 'file', 7)
+    recorder._events[-1]['created_at'] = old
+    recorder.flush()
+
+    today = datetime.utcnow().date().isoformat()
+    response = client.get('/api/activity/rollups?resource_type=file&resource_id=7', headers=headers)
+    assert json.loads(response.data)['rollups'] == [
+        {'day': old.date().isoformat(), 'action': 'download', 'count': 1},
+        {'day': today, 'action': 'download', 'count': 3},
+        {'day': today, 'action': 'view', 'count': 1},
+    ]
+
+    response = client.get(f'/api/activity/rollups?group_by=resource&action=download&since={today}', headers=headers)
+    assert json.loads(response.data)['rollups'] == [
+        {'resource_type': 'file', 'resource_id': 7, 'action': 'download', 'count': 3},
+        {'resource_type': 'file', 'resource_id': 8, 'action': 'download', 'count': 1},
+    ]
+    assert client.get('/api/activity/rollups?group_by=user', headers=headers).status_code == 400
+
+    archive = tmp_path / 'activity.jsonl.gz'
+    with app.app_context():
+        assert activity_service.prune_activity(days=30, batch_size=2, archive_path=str(archive)) == 1
+        assert ActivityLog.query.count() == 5
+        rollups_before = ActivityRollup.query.count()
+        activity_service.rebuild_rollups()
+        assert ActivityRollup.query.count() == rollups_before
+        assert sum(r.count for r in ActivityRollup.query.filter_by(resource_id=7, action='download')) == 4
+
+    with gzip.open(archive, 'rt') as handle:
+        archived = [json.loads(line) for line in handle]
+    assert [(row['action'], row['resource_id']) for row in archived] == [('download', 7)]
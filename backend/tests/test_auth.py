@@ -1,6 +1,11 @@
 import json
+import time
+from app.config import Config
 from app.models.user import User
-from app import db
+from app.utils.db_profile import engine_options
+from app.utils.principal_cache import PrincipalCache, Principal
+from app import create_app, db
+from tests.conftest import TestConfig
 
 
 def test_register_success(client, app):
@@ -145,3 +150,82 @@ def test_get_current_user_unauthenticated(client, app):
     response = client.get('/api/auth/me')
 
     assert response.status_code == 401
+
+
+def test_role_change_invalidates_cached_principal(client, app):
+    """Test that promoting a user takes effect even though their principal was cached"""
+    with app.app_context():
+        admin = User(email='admin@example.com', name='Admin', role='admin')
+        admin.set_password('password123')
+        member = User(email='member@example.com', name='Member')
+        member.set_password('password123')
+        db.session.add_all([admin, member])
+        db.session.commit()
+        member_id = member.id
+
+    def login(email):
+        response = client.post('/api/auth/login',
+            data=json.dumps({'email': email, 'password': 'password123'}),
+            content_type='application/json'
+        )
+        return json.loads(response.data)['token']
+
+    admin_token = login('admin@example.com')
+    member_token = login('member@example.com')
+
+    assert client.get('/api/users', headers={'Authorization': f'Bearer {member_token}'}).status_code == 403
+
+    response = client.put(f'/api/users/{member_id}/role',
+        data=json.dumps({'role': 'admin'}),
+        content_type='application/json',
+        headers={'Authorization': f'Bearer {admin_token}'}
+    )
+    assert response.status_code == 200
+
+    assert client.get('/api/users', headers={'Authorization': f'Bearer {member_token}'}).status_code == 200
+
+
+def test_principal_cache_invalidation_is_shared(app):
+    """Test that invalidating one cache clears another through the principals data version, checked at most once per interval"""
+    from tests.test_folders import count_queries
+    first = PrincipalCache(check_interval=60)
+    second = PrincipalCache(check_interval=60)
+    principal = Principal(1, 'a@example.com', 'A', 'user')
+
+    with app.app_context():
+        assert second.get('token') is None
+        second.put('token', principal, time.time() + 3600, second.current_epoch())
+        _, statements = count_queries(app, lambda: [second.get('token') for _ in range(5)])
+        assert second.get('token') == principal
+        assert statements == []
+
+        first.invalidate()
+        assert first.get('token') is None
+        # The other process keeps its entries until its next check.
+        assert second.get('token') == principal
+        second.check_interval = 0
+        assert second.get('token') is None
+
+
+def test_readiness_reports_engine_profile(tmp_path):
+    """Test that a file SQLite database runs in WAL mode and the readiness check reports it"""
+    class FileConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'ready.db'}"
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        response = app.test_client().get('/api/auth/ready')
+        db.session.remove()
+        db.engine.dispose()
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['profile'] == 'sqlite'
+    assert data['database']['journal_mode'] == 'wal'
+    assert data['database']['synchronous'] == 1
+    assert data['database']['busy_timeout'] == 5000
+
+    options = engine_options({**vars(Config), 'SQLALCHEMY_DATABASE_URI': 'postgresql://db/dataroom'})
+    assert options['pool_size'] == Config.DB_POOL_SIZE
+    assert options['pool_pre_ping'] is True
+    assert options['connect_args'] == {'options': f'-c statement_timeout={Config.DB_STATEMENT_TIMEOUT_MS}'}
@@ -0,0 +1,186 @@
+import json
+from app.models.user import User
+from app.models.folder import Folder
+from app.models.file import File
+from app import db
+from tests.test_folders import create_user_and_login, create_folder, count_queries
+
+
+def add_file(name, owner_id, folder_id=None):
+    file_obj = File(name=name, original_filename=f'{name}.pdf', storage_path=f'{name}.pdf',
+                    size_bytes=1, mime_type='application/pdf', owner_id=owner_id, folder_id=folder_id)
+    db.session.add(file_obj)
+    db.session.commit()
+    return file_obj.id
+
+
+def batch(client, token, operations, **extra):
+    return client.post('/api/batch',
+        data=json.dumps({'operations': operations, **extra}),
+        content_type='application/json',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+
+def test_batch_applies_operations_with_per_item_results(client, app):
+    """Test that a mixed batch is applied in one request and reports each operation"""
+    token = create_user_and_login(client, app)
+    owner_id = User.query.first().id
+    archive = create_folder(client, token, 'Archive')
+    drafts = create_folder(client, token, 'Drafts')
+    old = create_folder(client, token, 'Old')
+    files = [add_file(f'Doc {i}', owner_id) for i in range(3)]
+
+    response = batch(client, token, [
+        {'op': 'move', 'type': 'file', 'id': files[0], 'folder_id': archive},
+        {'op': 'rename', 'type': 'file', 'id': files[1], 'name': 'Signed'},
+        {'op': 'move', 'type': 'folder', 'id': drafts, 'parent_id': archive},
+        {'op': 'delete', 'type': 'folder', 'id': old},
+        {'op': 'rename', 'type': 'file', 'id': files[2], 'name': 'Signed'},
+        {'op': 'get', 'type': 'file', 'id': 999},
+        {'op': 'explode', 'type': 'file', 'id': files[2]},
+    ])
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['committed'] is True
+    assert [r['status'] for r in data['results']] == [200, 200, 200, 200, 409, 404, 400]
+    assert data['results'][0]['file']['folder_id'] == archive
+    assert data['results'][1]['file']['name'] == 'Signed'
+    assert data['results'][2]['folder']['parent_id'] == archive
+
+    assert db.session.get(Folder, drafts).path == f'/{archive}/{drafts}/'
+    assert db.session.get(Folder, old).deleted_at is not None
+    assert db.session.get(File, files[2]).name == 'Doc 2'
+
+
+def test_batch_checks_ownership(client, app):
+    """Test that operations on other users' items fail without blocking the rest"""
+    owner_token = create_user_and_login(client, app)
+    other_token = create_user_and_login(client, app, email='other@example.com')
+    folder_id = create_folder(client, owner_token, 'Mine')
+    own_folder = create_folder(client, other_token, 'Theirs')
+
+    response = batch(client, other_token, [
+        {'op': 'delete', 'type': 'folder', 'id': folder_id},
+        {'op': 'rename', 'type': 'folder', 'id': own_folder, 'name': 'Renamed'},
+        {'op': 'get', 'type': 'folder', 'id': folder_id},
+    ])
+
+    data = json.loads(response.data)
+    assert [r['status'] for r in data['results']] == [403, 200, 200]
+    assert data['results'][2]['folder']['name'] == 'Mine'
+    assert db.session.get(Folder, folder_id) is not None
+
+
+def test_batch_atomic_rolls_back_on_failure(client, app):
+    """Test that an atomic batch applies nothing when one operation fails"""
+    token = create_user_and_login(client, app)
+    parent = create_folder(client, token, 'Parent')
+    child = create_folder(client, token, 'Child', parent)
+
+    response = batch(client, token, [
+        {'op': 'rename', 'type': 'folder', 'id': child, 'name': 'Renamed'},
+        {'op': 'move', 'type': 'folder', 'id': parent, 'parent_id': child},
+    ], atomic=True)
+
+    assert response.status_code == 409
+    data = json.loads(response.data)
+    assert data['committed'] is False
+    assert [r['status'] for r in data['results']] == [424, 409]
+    assert db.session.get(Folder, child).name == 'Child'
+
+
+def test_batch_skips_items_under_deleted_folders(client, app):
+    """Test that items removed by an earlier folder delete report 404"""
+    token = create_user_and_login(client, app)
+    owner_id = User.query.first().id
+    parent = create_folder(client, token, 'Parent')
+    child = create_folder(client, token, 'Child', parent)
+    file_id = add_file('Nested', owner_id, child)
+
+    response = batch(client, token, [
+        {'op': 'delete', 'type': 'folder', 'id': parent},
+        {'op': 'rename', 'type': 'file', 'id': file_id, 'name': 'Survivor'},
+        {'op': 'move', 'type': 'folder', 'id': child, 'parent_id': None},
+    ])
+
+    data = json.loads(response.data)
+    assert [r['status'] for r in data['results']] == [200, 404, 404]
+    assert db.session.get(File, file_id).deleted_at is not None
+    assert db.session.get(File, file_id).name == 'Nested'
+
+
+def test_batch_uses_set_based_queries(client, app):
+    """Test that renaming many files costs a constant number of queries"""
+    token = create_user_and_login(client, app)
+    owner_id = User.query.first().id
+    file_ids = [add_file(f'File {i}', owner_id) for i in range(200)]
+    operations = [{'op': 'rename', 'type': 'file', 'id': i, 'name': f'Renamed {i}'} for i in file_ids]
+
+    response, statements = count_queries(app, lambda: batch(client, token, operations))
+
+    assert response.status_code == 200
+    assert all(r['status'] == 200 for r in json.loads(response.data)['results'])
+    assert len(statements) < 10
+
+
+def test_batch_renames_can_reuse_names_freed_earlier(client, app):
+    """Test that a rename may take a name another item gave up earlier in the same batch"""
+    token = create_user_and_login(client, app)
+    owner_id = User.query.first().id
+    d1 = create_folder(client, token, 'D1')
+    c1 = create_folder(client, token, 'C1')
+    first = add_file('Report', owner_id)
+    second = add_file('Draft', owner_id)
+
+    response = batch(client, token, [
+        {'op': 'rename', 'type': 'folder', 'id': d1, 'name': 'tmp'},
+        {'op': 'rename', 'type': 'folder', 'id': c1, 'name': 'D1'},
+        {'op': 'rename', 'type': 'folder', 'id': d1, 'name': 'C1'},
+        {'op': 'rename', 'type': 'file', 'id': second, 'name': 'Spare'},
+        {'op': 'rename', 'type': 'file', 'id': first, 'name': 'Draft'},
+    ])
+
+    assert response.status_code == 200
+    assert [r['status'] for r in json.loads(response.data)['results']] == [200] * 5
+    assert db.session.get(Folder, c1).name == 'D1'
+    assert db.session.get(Folder, d1).name == 'C1'
+    assert db.session.get(File, first).name == 'Draft'
+
+
+def test_batch_renames_can_reuse_names_of_deleted_items(client, app):
+    """Test that deleting a folder frees its own name and those of everything inside it for the rest of the batch"""
+    token = create_user_and_login(client, app)
+    owner_id = User.query.first().id
+    alpha = create_folder(client, token, 'Alpha')
+    inner = create_folder(client, token, 'Inner', alpha)
+    beta = create_folder(client, token, 'Beta')
+    add_file('Nested', owner_id, inner)
+    loose = add_file('Loose', owner_id)
+
+    response = batch(client, token, [
+        {'op': 'delete', 'type': 'folder', 'id': alpha},
+        {'op': 'rename', 'type': 'folder', 'id': beta, 'name': 'Alpha'},
+        {'op': 'rename', 'type': 'file', 'id': loose, 'name': 'Nested'},
+    ])
+
+    assert response.status_code == 200
+    assert [r['status'] for r in json.loads(response.data)['results']] == [200] * 3
+    assert db.session.get(Folder, beta).name == 'Alpha'
+    assert db.session.get(File, loose).name == 'Nested'
+
+
+def test_batch_folder_moves_do_not_reload_preloaded_items(client, app):
+    """Test that moving folders keeps the batch's preloaded items instead of reloading them one by one"""
+    token = create_user_and_login(client, app)
+    target = create_folder(client, token, 'Target')
+    folder_ids = [create_folder(client, token, f'Folder {i}') for i in range(30)]
+    operations = [{'op': 'move', 'type': 'folder', 'id': i, 'parent_id': target} for i in folder_ids]
+
+    response, statements = count_queries(app, lambda: batch(client, token, operations))
+
+    assert response.status_code == 200
+    assert all(r['status'] == 200 for r in json.loads(response.data)['results'])
+    assert db.session.get(Folder, folder_ids[-1]).path == f'/{target}/{folder_ids[-1]}/'
+    assert len(statements) < 5 * len(folder_ids)
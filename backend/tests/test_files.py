@@ -0,0 +1,700 @@
+import hashlib
+import io
+import json
+import os
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+from werkzeug.http import http_date
+import pytest
+from app.models.user import User
+from app.models.blob import Blob
+from app.models.folder import Folder
+from app.models.file import File
+from app.models.file_content import FilePage
+from app.utils.storage import blob_storage_path
+from app.utils.storage_backends import LocalStorage, S3Storage, StorageBackend, get_storage
+from app.services import blob_service, folder_service, purge_service
+from app import db
+
+
+def create_user_and_login(client, app, email='test@example.com', name='Test User', password='password123'):
+    """Helper function to create a user and get auth token"""
+    with app.app_context():
+        user = User(email=email, name=name)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+
+    response = client.post('/api/auth/login',
+        data=json.dumps({'email': email, 'password': password}),
+        content_type='application/json'
+    )
+    return json.loads(response.data)['token']
+
+
+def upload(client, token, content, name, filename='document.pdf', folder_id=None):
+    data = {'file': (io.BytesIO(content), filename), 'name': name}
+    if folder_id:
+        data['folder_id'] = str(folder_id)
+    return client.post('/api/files',
+        data=data,
+        content_type='multipart/form-data',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+
+def test_upload_file(client, app, make_pdf):
+    """Test uploading a PDF"""
+    token = create_user_and_login(client, app)
+    content = make_pdf(['Hello'])
+
+    response = upload(client, token, content, 'Hello')
+
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['file']['name'] == 'Hello'
+    assert data['file']['size_bytes'] == len(content)
+
+
+def test_upload_extracts_content(client, app, make_pdf):
+    """Test that uploaded PDFs get their page count, metadata and text extracted"""
+    token = create_user_and_login(client, app)
+    content = make_pdf(['Share purchase agreement', 'Indemnification escrow'], title='SPA')
+
+    file_id = json.loads(upload(client, token, content, 'SPA').data)['file']['id']
+
+    response = client.get(f'/api/files/{file_id}/content')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)['content']
+    assert data['status'] == 'done'
+    assert data['page_count'] == 2
+    assert data['metadata']['title'] == 'SPA'
+
+
+def test_deleted_files_have_no_content(client, app, make_pdf):
+    """Test that a tombstoned file's extracted text is not served and its queued extraction does not run"""
+    from app.models.file_content import FileContent
+    from app.services import extraction_service
+    token = create_user_and_login(client, app)
+    file_id = json.loads(upload(client, token, make_pdf(['Disclosure letter']), 'Disclosure').data)['file']['id']
+    content = db.session.get(FileContent, file_id)
+    content.status = 'pending'
+    db.session.commit()
+
+    client.delete(f'/api/files/{file_id}', headers={'Authorization': f'Bearer {token}'})
+
+    assert client.get(f'/api/files/{file_id}/content').status_code == 404
+    assert extraction_service.extract_pending() == 0
+    extraction_service.extract_file(file_id)
+    assert db.session.get(FileContent, file_id).status == 'pending'
+
+
+def test_content_search_returns_page_hits(client, app, make_pdf):
+    """Test searching extracted text returns files with matching pages and snippets"""
+    token = create_user_and_login(client, app)
+    upload(client, token, make_pdf(['Share purchase agreement', 'Indemnification escrow']), 'SPA')
+    upload(client, token, make_pdf(['Board minutes']), 'Minutes')
+
+    response = client.get('/api/search?q=escrow&scope=content')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [f['name'] for f in data['files']] == ['SPA']
+    hits = data['files'][0]['page_hits']
+    assert hits[0]['page'] == 2
+    assert '<mark>escrow</mark>' in hits[0]['snippet'].lower()
+
+
+def test_content_search_snippets_are_html_escaped(client, app, make_pdf):
+    """Test that page text in snippets is escaped, so only the match markers are markup"""
+    token = create_user_and_login(client, app)
+    upload(client, token, make_pdf(['<img src=x onerror=alert> escrow & co']), 'Tricky')
+
+    data = json.loads(client.get('/api/search?q=escrow&scope=content').data)
+
+    snippet = data['files'][0]['page_hits'][0]['snippet']
+    assert '&lt;img src=x onerror=alert&gt;' in snippet
+    assert '<mark>escrow</mark> &amp; co' in snippet
+
+
+def test_content_extraction_failure_is_recorded(client, app):
+    """Test that unparsable uploads are marked as failed instead of failing the upload"""
+    token = create_user_and_login(client, app)
+
+    response = upload(client, token, b'%PDF-1.4\nnot really a pdf\n%%EOF\n', 'Broken')
+
+    assert response.status_code == 201
+    file_id = json.loads(response.data)['file']['id']
+    data = json.loads(client.get(f'/api/files/{file_id}/content').data)['content']
+    assert data['status'] == 'failed'
+
+
+def test_identical_uploads_share_one_blob(client, app, make_pdf):
+    """Test that uploading the same bytes twice stores a single reference-counted blob"""
+    token = create_user_and_login(client, app)
+    content = make_pdf(['Data room index'])
+
+    first = json.loads(upload(client, token, content, 'Index A').data)['file']
+    second = json.loads(upload(client, token, content, 'Index B').data)['file']
+
+    assert first['sha256'] == second['sha256']
+    blob = db.session.get(Blob, first['sha256'])
+    assert blob.ref_count == 2
+    path = get_storage().local_path(blob.storage_path)
+
+    client.delete(f"/api/files/{first['id']}", headers={'Authorization': f'Bearer {token}'})
+    purge_service.purge_deleted()
+    db.session.expire_all()
+    assert db.session.get(Blob, first['sha256']).ref_count == 1
+    assert os.path.exists(path)
+
+    client.delete(f"/api/files/{second['id']}", headers={'Authorization': f'Bearer {token}'})
+    assert os.path.exists(path)
+    purge_service.purge_deleted()
+    db.session.expire_all()
+    assert db.session.get(Blob, first['sha256']).ref_count == 0
+    assert purge_service.collect_blobs() == 1
+
+    assert db.session.get(Blob, first['sha256']) is None
+    assert not os.path.exists(path)
+
+
+def test_upload_by_hash(client, app, make_pdf):
+    """Test that a known digest creates a file without sending its bytes"""
+    token = create_user_and_login(client, app)
+    content = make_pdf(['Cap table'])
+    digest = json.loads(upload(client, token, content, 'Cap Table').data)['file']['sha256']
+
+    response = client.post('/api/files',
+        data={'sha256': digest, 'name': 'Cap Table Copy', 'filename': 'cap-table.pdf'},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == 201
+    data = json.loads(response.data)['file']
+    assert data['sha256'] == digest
+    assert data['size_bytes'] == len(content)
+
+    response = client.post('/api/files',
+        data={'sha256': '0' * 64, 'name': 'Unknown', 'filename': 'unknown.pdf'},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 404
+
+
+def test_upload_rejects_digest_mismatch(client, app, make_pdf):
+    """Test that a client-supplied digest must match the uploaded bytes"""
+    token = create_user_and_login(client, app)
+
+    response = client.post('/api/files',
+        data={'file': (io.BytesIO(make_pdf(['x'])), 'x.pdf'), 'name': 'X', 'sha256': 'f' * 64},
+        content_type='multipart/form-data',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == 400
+
+
+def test_download_conditional_get(client, app, make_pdf):
+    """Test strong ETags and 304 responses for unchanged files"""
+    token = create_user_and_login(client, app)
+    data = json.loads(upload(client, token, make_pdf(['Budget']), 'Budget').data)['file']
+
+    response = client.get(f"/api/files/{data['id']}/preview")
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{data["sha256"]}"'
+    assert 'Last-Modified' in response.headers
+
+    response = client.get(f"/api/files/{data['id']}/preview",
+        headers={'If-None-Match': response.headers['ETag']}
+    )
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_download_byte_ranges(client, app, make_pdf):
+    """Test single and multiple byte range requests"""
+    token = create_user_and_login(client, app)
+    content = make_pdf(['Financial statements'])
+    file_id = json.loads(upload(client, token, content, 'Financials').data)['file']['id']
+
+    response = client.get(f'/api/files/{file_id}/preview', headers={'Range': 'bytes=0-7'})
+    assert response.status_code == 206
+    assert response.data == content[:8]
+    assert response.headers['Content-Range'] == f'bytes 0-7/{len(content)}'
+
+    response = client.get(f'/api/files/{file_id}/preview', headers={'Range': 'bytes=0-3,-5'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert content[:4] in response.data
+    assert content[-5:] in response.data
+    assert f'Content-Range: bytes {len(content) - 5}-{len(content) - 1}/{len(content)}'.encode() in response.data
+
+    response = client.get(f'/api/files/{file_id}/preview', headers={'Range': f'bytes={len(content) + 10}-'})
+    assert response.status_code == 416
+
+    response = client.get(f'/api/files/{file_id}/preview', headers={'Range': 'bytes=0-3,4-7'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 0-7/{len(content)}'
+    assert response.data == content[:8]
+
+    response = client.get(f'/api/files/{file_id}/preview', headers={'Range': f'bytes=0-9,-{len(content) * 2}'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 0-{len(content) - 1}/{len(content)}'
+    assert response.data == content
+
+    response = client.get(f'/api/files/{file_id}/preview', headers={'Range': 'bytes=' + ','.join(['0-'] * 8)})
+    assert response.status_code == 200
+    assert response.data == content
+
+    from app.utils.file_response import _coalesce
+    assert _coalesce([(10, 20), (0, 5), (5, 8), (15, 30)]) == ([(0, 8), (10, 30)], 1)
+    assert _coalesce([(0, 100)] * 4) == ([(0, 100)], 3)
+
+    response = client.get(f'/api/files/{file_id}/preview',
+        headers={'Range': 'bytes=0-7', 'If-Range': '"stale"'}
+    )
+    assert response.status_code == 200
+    assert response.data == content
+
+    last_modified = client.get(f'/api/files/{file_id}/preview').headers['Last-Modified']
+    response = client.get(f'/api/files/{file_id}/preview',
+        headers={'Range': 'bytes=0-7', 'If-Range': last_modified}
+    )
+    assert response.status_code == 206
+
+    response = client.get(f'/api/files/{file_id}/preview',
+        headers={'Range': 'bytes=0-7', 'If-Range': http_date(datetime.now(timezone.utc) + timedelta(days=1))}
+    )
+    assert response.status_code == 200
+    assert response.data == content
+
+
+def test_download_sendfile_offload(client, app, make_pdf):
+    """Test that X-Accel-Redirect mode hands the body to the proxy"""
+    token = create_user_and_login(client, app)
+    data = json.loads(upload(client, token, make_pdf(['Offload']), 'Offload').data)['file']
+    app.config['SENDFILE_MODE'] = 'x-accel-redirect'
+
+    response = client.get(f"/api/files/{data['id']}/download")
+
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'].startswith('/protected-storage/blobs/')
+    assert response.headers['Content-Disposition'].startswith('attachment')
+    assert response.data == b''
+
+
+def test_folder_delete_tombstones_and_purges_subtree(client, app, make_pdf):
+    """Test that deleting a folder hides its subtree at once and the purge removes rows, pages and blobs"""
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    parent = json.loads(client.post('/api/folders', json={'name': 'Closing'}, headers=headers).data)['folder']['id']
+    child = json.loads(client.post('/api/folders', json={'name': 'Signed', 'parent_id': parent}, headers=headers).data)['folder']['id']
+    file_id = json.loads(upload(client, token, make_pdf(['Escrow agreement']), 'Escrow', folder_id=child).data)['file']['id']
+    sha256 = db.session.get(File, file_id).sha256
+
+    response = client.delete(f'/api/folders/{parent}', headers=headers)
+
+    assert response.status_code == 200
+    assert db.session.get(Folder, child).deleted_at is not None
+    assert db.session.get(File, file_id).deleted_at is not None
+    assert client.get(f'/api/folders/{child}').status_code == 404
+    assert client.get(f'/api/files/{file_id}').status_code == 404
+    assert json.loads(client.get('/api/search?q=Escrow').data)['files'] == []
+    assert json.loads(client.get('/api/search?q=escrow&scope=content').data)['files'] == []
+
+    # The name is free again as soon as the folder is deleted.
+    response = client.post('/api/folders', json={'name': 'Closing'}, headers=headers)
+    assert response.status_code == 201
+
+    assert purge_service.purge_deleted() == (1, 2)
+    assert db.session.get(File, file_id) is None
+    assert FilePage.query.filter_by(file_id=file_id).count() == 0
+    assert purge_service.collect_blobs() == 1
+    assert db.session.get(Blob, sha256) is None
+
+
+def test_purge_settles_totals_and_quota_of_stray_files(client, app, make_pdf):
+    """Test that a file landing in a folder after its delete is taken off its ancestors' totals and its owner's usage"""
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    deals = json.loads(client.post('/api/folders', json={'name': 'Deals'}, headers=headers).data)['folder']['id']
+    closing = json.loads(client.post('/api/folders', json={'name': 'Closing', 'parent_id': deals}, headers=headers).data)['folder']['id']
+    client.delete(f'/api/folders/{closing}', headers=headers)
+
+    # An upload that checked its target before the delete committed.
+    content = make_pdf(['Late signature page'])
+    file_id = json.loads(upload(client, token, content, 'Late').data)['file']['id']
+    owner_id = db.session.get(File, file_id).owner_id
+    db.session.execute(db.update(File).where(File.id == file_id).values(folder_id=closing))
+    folder_service.adjust_totals([deals, closing], len(content), 1)
+    db.session.commit()
+    assert db.session.get(Folder, deals).file_count == 1
+
+    purge_service.purge_deleted()
+
+    deals_folder = db.session.get(Folder, deals)
+    assert (deals_folder.total_bytes, deals_folder.file_count) == (0, 0)
+    assert db.session.get(User, owner_id).storage_used_bytes == 0
+    assert db.session.get(File, file_id) is None
+
+
+def test_blob_sweep_keeps_reacquired_blobs(client, app, make_pdf):
+    """Test that a blob referenced again before the sweep is kept"""
+    token = create_user_and_login(client, app)
+    content = make_pdf(['Board minutes'])
+    first = json.loads(upload(client, token, content, 'Minutes').data)['file']
+    client.delete(f"/api/files/{first['id']}", headers={'Authorization': f'Bearer {token}'})
+    purge_service.purge_deleted()
+
+    upload(client, token, content, 'Minutes again')
+
+    assert purge_service.collect_blobs() == 0
+    blob = db.session.get(Blob, first['sha256'])
+    assert blob.ref_count == 1
+    assert os.path.exists(get_storage().local_path(blob.storage_path))
+
+
+def test_download_folder_as_zip(client, app, make_pdf):
+    """Test that a folder downloads as a streamed ZIP laid out like the folder tree"""
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    parent = json.loads(client.post('/api/folders', json={'name': 'Deal'}, headers=headers).data)['folder']['id']
+    child = json.loads(client.post('/api/folders', json={'name': 'Legal', 'parent_id': parent}, headers=headers).data)['folder']['id']
+    json.loads(client.post('/api/folders', json={'name': 'Empty', 'parent_id': child}, headers=headers).data)
+    nda = make_pdf(['NDA'])
+    spa = make_pdf(['Share purchase agreement'])
+    upload(client, token, nda, 'NDA', folder_id=parent)
+    upload(client, token, spa, 'SPA', folder_id=child)
+    removed = json.loads(upload(client, token, make_pdf(['Draft']), 'Draft', folder_id=child).data)['file']['id']
+    client.delete(f'/api/files/{removed}', headers=headers)
+
+    response = client.get(f'/api/folders/{parent}/download')
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert sorted(archive.namelist()) == ['Deal/', 'Deal/Legal/', 'Deal/Legal/Empty/', 'Deal/Legal/SPA.pdf', 'Deal/NDA.pdf']
+    assert archive.read('Deal/NDA.pdf') == nda
+    assert archive.read('Deal/Legal/SPA.pdf') == spa
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert archive.testzip() is None
+
+    # The file query selects the subtree by path, not by binding every folder id.
+    from tests.test_folders import count_queries
+    from app.services import folder_service
+    owner_id = db.session.get(Folder, parent).owner_id
+    db.session.add_all([Folder(name=f'Schedule {i}', parent_id=child, owner_id=owner_id) for i in range(40)])
+    db.session.commit()
+    folder_service.rebuild_folder_paths()
+    entries, statements = count_queries(app, lambda: list(folder_service.archive_entries(db.session.get(Folder, parent))))
+    assert len(entries) == 45
+    assert max(statement.count('?') for statement in statements) < 10
+
+    assert client.get('/api/folders/999/download').status_code == 404
+
+
+def test_folder_totals_follow_file_changes(client, app, make_pdf):
+    """Test that recursive folder sizes and counts track uploads, moves and deletes, and match a rebuild"""
+    from tests.test_folders import create_folder
+    from app.services import folder_service
+
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    root_id = create_folder(client, token, 'Root')
+    child_id = create_folder(client, token, 'Child', root_id)
+    other_id = create_folder(client, token, 'Other')
+    small, large = make_pdf(['Small']), make_pdf(['Large'] * 20)
+
+    upload(client, token, small, 'Small', folder_id=root_id)
+    large_id = json.loads(upload(client, token, large, 'Large', folder_id=child_id).data)['file']['id']
+
+    def totals(folder_id):
+        folder = json.loads(client.get(f'/api/folders/{folder_id}').data)['folder']
+        return folder['total_bytes'], folder['file_count']
+
+    assert totals(root_id) == (len(small) + len(large), 2)
+    assert totals(child_id) == (len(large), 1)
+    assert json.loads(client.get(f'/api/folders/{root_id}').data)['folder']['last_modified'].endswith('Z')
+
+    client.put(f'/api/folders/{child_id}/move',
+        data=json.dumps({'parent_id': other_id}), content_type='application/json', headers=headers)
+    assert totals(root_id) == (len(small), 1)
+    assert totals(other_id) == (len(large), 1)
+
+    client.post('/api/batch', data=json.dumps({'operations': [
+        {'op': 'move', 'type': 'file', 'id': large_id, 'folder_id': root_id},
+    ]}), content_type='application/json', headers=headers)
+    assert totals(root_id) == (len(small) + len(large), 2)
+    assert totals(other_id) == (0, 0)
+
+    client.delete(f'/api/files/{large_id}', headers=headers)
+    assert totals(root_id) == (len(small), 1)
+
+    expected = {f.id: (f.total_bytes, f.file_count) for f in Folder.query.all()}
+    Folder.query.update({'total_bytes': 0, 'file_count': 0})
+    db.session.commit()
+    assert folder_service.rebuild_folder_totals() == 3
+    assert {f.id: (f.total_bytes, f.file_count) for f in Folder.query.all()} == expected
+
+
+def test_storage_quota_is_enforced_and_tracked(client, app, make_pdf):
+    """Test that usage follows uploads and deletes and that uploads over quota are refused"""
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    user = User.query.filter_by(email='test@example.com').first()
+    content = make_pdf(['Quota'])
+    user.storage_quota_bytes = len(content) + 10
+    db.session.commit()
+
+    file_id = json.loads(upload(client, token, content, 'First').data)['file']['id']
+    assert db.session.get(User, user.id).storage_used_bytes == len(content)
+
+    response = upload(client, token, make_pdf(['Second']), 'Second')
+    assert response.status_code == 413
+    assert File.query.filter_by(name='Second').count() == 0
+
+    response = client.post('/api/files', data=b'x' * (len(content) + 200 * 1024),
+        content_type='multipart/form-data; boundary=x', headers=headers)
+    assert response.status_code == 413
+
+    response = client.post('/api/uploads', data=json.dumps({'filename': 'big.pdf', 'size': len(content) * 2}),
+        content_type='application/json', headers=headers)
+    assert response.status_code == 413
+
+    client.delete(f'/api/files/{file_id}', headers=headers)
+    db.session.expire_all()
+    assert db.session.get(User, user.id).storage_used_bytes == 0
+    assert upload(client, token, make_pdf(['Second']), 'Second').status_code == 201
+
+    user = db.session.get(User, user.id)
+    expected = user.storage_used_bytes
+    user.storage_used_bytes = 0
+    db.session.commit()
+    from app.services import quota_service
+    quota_service.rebuild_usage()
+    assert db.session.get(User, user.id).storage_used_bytes == expected
+    assert user.to_dict()['storage_quota_bytes'] == len(content) + 10
+
+
+def test_legacy_files_migrate_into_blob_store(client, app, runner, make_pdf, tmp_path):
+    """Test that migrate-storage moves date-path files to blob keys and copies blobs to another backend"""
+    token = create_user_and_login(client, app)
+    user = User.query.filter_by(email='test@example.com').first()
+    content = make_pdf(['Legacy memo'])
+    storage = get_storage()
+    legacy_path = f'2023/05/17/{uuid.uuid4().hex}.pdf'
+    os.makedirs(os.path.dirname(storage.local_path(legacy_path)), exist_ok=True)
+    with open(storage.local_path(legacy_path), 'wb') as f:
+        f.write(content)
+    file_obj = File(name='Legacy', original_filename='memo.pdf', storage_path=legacy_path,
+        size_bytes=len(content), mime_type='application/pdf', owner_id=user.id)
+    db.session.add(file_obj)
+    db.session.add(File(name='Lost', original_filename='lost.pdf', storage_path='2023/05/17/lost.pdf',
+        size_bytes=1, mime_type='application/pdf', owner_id=user.id))
+    db.session.commit()
+
+    result = runner.invoke(args=['migrate-storage', '--batch-size', '1'])
+
+    assert 'Migrated 1 legacy file(s), 1 missing' in result.output
+    file_obj = db.session.get(File, file_obj.id)
+    assert file_obj.sha256 == hashlib.sha256(content).hexdigest()
+    assert file_obj.storage_path == blob_storage_path(file_obj.sha256)
+    assert db.session.get(Blob, file_obj.sha256).ref_count == 1
+    assert not storage.exists(legacy_path)
+    response = client.get(f'/api/files/{file_obj.id}/download', headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 206
+    assert response.data == content[:4]
+
+    target = LocalStorage(str(tmp_path))
+    assert blob_service.copy_blobs(target) == 1
+    assert target.stat(file_obj.storage_path) == len(content)
+    assert blob_service.copy_blobs(target) == 0
+
+
+class FakeS3Client:
+    """In-memory stand-in for a boto3 S3 client, covering the calls S3Storage makes"""
+
+    class exceptions:
+        class ClientError(Exception):
+            def __init__(self, code):
+                super().__init__(code)
+                self.response = {'Error': {'Code': code}}
+
+    class Body(io.BytesIO):
+        def iter_chunks(self, chunk_size):
+            while chunk := self.read(chunk_size):
+                yield chunk
+
+    def __init__(self):
+        self.objects = {}
+
+    def _data(self, bucket, key, code):
+        if (bucket, key) not in self.objects:
+            raise self.exceptions.ClientError(code)
+        return self.objects[(bucket, key)]
+
+    def upload_file(self, filename, bucket, key):
+        with open(filename, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self._data(Bucket, Key, '404'))}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self._data(Bucket, Key, 'NoSuchKey')
+        if Range:
+            start, end = Range.removeprefix('bytes=').split('-')
+            data = data[int(start):int(end) + 1]
+        return {'Body': self.Body(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.objects[(Bucket, Key)] = self._data(CopySource['Bucket'], CopySource['Key'], 'NoSuchKey')
+
+    def download_file(self, bucket, key, filename):
+        data = self._data(bucket, key, '404')
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+
+def check_storage_round_trip(storage, tmp_path):
+    source = tmp_path / 'source'
+    source.write_bytes(b'0123456789')
+
+    storage.save('blobs/aa/bb/key', str(source))
+    assert not source.exists()
+    assert storage.stat('blobs/aa/bb/key') == 10
+    assert b''.join(storage.read_range('blobs/aa/bb/key', 2, 5)) == b'23456'
+    with storage.open('blobs/aa/bb/key') as f:
+        assert f.read() == b'0123456789'
+    storage.move('blobs/aa/bb/key', 'blobs/aa/bb/moved')
+    assert storage.stat('blobs/aa/bb/key') is None
+    with pytest.raises(FileNotFoundError):
+        storage.open('blobs/aa/bb/key')
+    with pytest.raises(FileNotFoundError):
+        storage.move('blobs/aa/bb/key', 'blobs/aa/bb/other')
+    with pytest.raises(FileNotFoundError):
+        with storage.local_copy('blobs/aa/bb/key'):
+            pass
+    with storage.local_copy('blobs/aa/bb/moved') as path:
+        assert open(path, 'rb').read() == b'0123456789'
+    assert not os.path.exists(path)
+    assert storage.delete('blobs/aa/bb/moved')
+    assert not storage.delete('blobs/aa/bb/moved')
+
+
+def test_s3_storage_with_fake_client(tmp_path):
+    """Test the S3 backend's key handling, ranges and missing-object errors against an in-memory client"""
+    client = FakeS3Client()
+    storage = S3Storage('dataroom-test', prefix='/tenant/', temp_dir=str(tmp_path / 'downloads'), client=client)
+
+    check_storage_round_trip(storage, tmp_path)
+
+    source = tmp_path / 'source'
+    source.write_bytes(b'abc')
+    storage.save('blobs/cc/dd/key', str(source))
+    assert list(client.objects) == [('dataroom-test', 'tenant/blobs/cc/dd/key')]
+    assert list(storage.read_range('blobs/cc/dd/key', 0, 0)) == []
+    with pytest.raises(TypeError):
+        StorageBackend()
+
+    def denied(**kwargs):
+        raise client.exceptions.ClientError('AccessDenied')
+    client.head_object = denied
+    with pytest.raises(client.exceptions.ClientError):
+        storage.stat('blobs/cc/dd/key')
+
+
+def test_s3_storage_round_trip(app, tmp_path):
+    """Test the S3 backend against a local S3-compatible server (set S3_TEST_ENDPOINT_URL and S3_TEST_BUCKET)"""
+    pytest.importorskip('boto3')
+    endpoint = os.environ.get('S3_TEST_ENDPOINT_URL')
+    if not endpoint:
+        pytest.skip('S3_TEST_ENDPOINT_URL is not set')
+
+    storage = S3Storage(os.environ.get('S3_TEST_BUCKET', 'dataroom-test'), prefix=uuid.uuid4().hex,
+        endpoint_url=endpoint, temp_dir=str(tmp_path))
+    check_storage_round_trip(storage, tmp_path)
+
+
+def test_streaming_upload_validates_in_one_pass(client, app, make_pdf):
+    """Test that uploads are parsed off the stream in any field order and bad ones leave nothing staged"""
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    tmp_dir = os.path.join(app.config['FILE_STORAGE_PATH'], 'tmp')
+    staged_before = set(os.listdir(tmp_dir)) if os.path.isdir(tmp_dir) else set()
+
+    # Spans several read chunks, with the form fields sent ahead of the file.
+    content = make_pdf(['Data tape']).replace(b'%%EOF', b'%' + b' ' * (3 * 1024 * 1024) + b'\n%%EOF')
+    body = (
+        b'--x\r\nContent-Disposition: form-data; name="name"\r\n\r\nData Tape\r\n'
+        b'--x\r\nContent-Disposition: form-data; name="file"; filename="tape.pdf"\r\n'
+        b'Content-Type: application/pdf\r\n\r\n' + content + b'\r\n--x--\r\n'
+    )
+    response = client.post('/api/files', data=body, content_type='multipart/form-data; boundary=x', headers=headers)
+    assert response.status_code == 201
+    data = json.loads(response.data)['file']
+    assert data['name'] == 'Data Tape'
+    assert data['size_bytes'] == len(content)
+    assert data['sha256'] == hashlib.sha256(content).hexdigest()
+
+    response = upload(client, token, b'<html>' + b' ' * 4096, 'Not a PDF', filename='fake.pdf')
+    assert response.status_code == 400
+    assert 'not a valid PDF' in json.loads(response.data)['error']
+    response = upload(client, token, b'%PDF-1.4\ntruncated', 'Truncated')
+    assert response.status_code == 400
+
+    app.config['MAX_FILE_SIZE_MB'] = 1
+    response = upload(client, token, make_pdf(['Big']) + b' ' * (2 * 1024 * 1024), 'Too Big')
+    assert response.status_code == 413
+
+    assert set(os.listdir(tmp_dir)) == staged_before
+    assert File.query.count() == 1
+
+
+def test_upload_target_is_checked_before_the_file_is_read(client, app, make_pdf, monkeypatch):
+    """Test that a taken name or a foreign folder sent ahead of the file rejects the upload before anything is staged"""
+    from app.utils import ingest
+    owner_token = create_user_and_login(client, app)
+    other_token = create_user_and_login(client, app, email='other@example.com', name='Other')
+    assert upload(client, owner_token, make_pdf(['Term sheet']), 'Term Sheet').status_code == 201
+    folder = Folder(name='Private', owner_id=User.query.filter_by(email='test@example.com').one().id)
+    db.session.add(folder)
+    db.session.commit()
+
+    def fail():
+        raise AssertionError('the file part was staged')
+
+    monkeypatch.setattr(ingest, 'create_temp_file', fail)
+
+    response = upload(client, other_token, make_pdf(['Copy']), 'term sheet')
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'A file with this name already exists'
+
+    response = upload(client, other_token, make_pdf(['Copy']), 'Elsewhere', folder_id=folder.id)
+    assert response.status_code == 403
+
+
+def test_upload_losing_the_name_race_leaves_no_blob(client, app, make_pdf, monkeypatch):
+    """Test that an upload whose row fails to insert never moves its content into the blob store"""
+    from app.services import file_service
+    token = create_user_and_login(client, app)
+    assert upload(client, token, make_pdf(['Side letter']), 'Side Letter').status_code == 201
+    content = make_pdf([f'Competing side letter {uuid.uuid4().hex}'])
+    key = blob_storage_path(hashlib.sha256(content).hexdigest())
+
+    # The name is free when checked and taken by the time the row is flushed.
+    monkeypatch.setattr(file_service, '_name_taken', lambda name, exclude_id=None: False)
+    response = upload(client, token, content, 'side letter')
+
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'A file with this name already exists'
+    assert get_storage().stat(key) is None
+    assert db.session.get(Blob, hashlib.sha256(content).hexdigest()) is None
@@ -1,7 +1,11 @@
 import json
+import pytest
+from sqlalchemy import event
 from app.models.user import User
 from app.models.folder import Folder
-from app import db
+from app.models.file import File
+from app import create_app, db
+from tests.conftest import TestConfig
 
 
 def create_user_and_login(client, app, email='test@example.com', name='Test User', password='password123'):
@@ -161,3 +165,377 @@ def test_cannot_delete_others_folder(client, app):
     )
 
     assert response.status_code == 403
+
+
+def create_folder(client, token, name, parent_id=None):
+    response = client.post('/api/folders',
+        data=json.dumps({'name': name, 'parent_id': parent_id}),
+        content_type='application/json',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    return json.loads(response.data)['folder']['id']
+
+
+def test_folder_ancestors(client, app):
+    """Test breadcrumbs are returned root-first from the materialized path"""
+    token = create_user_and_login(client, app)
+    root_id = create_folder(client, token, 'Root')
+    middle_id = create_folder(client, token, 'Middle', root_id)
+    leaf_id = create_folder(client, token, 'Leaf', middle_id)
+
+    response = client.get(f'/api/folders/{leaf_id}/ancestors')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['folder']['name'] == 'Leaf'
+    assert [f['name'] for f in data['ancestors']] == ['Root', 'Middle']
+
+
+def test_move_folder_rewrites_subtree(client, app):
+    """Test moving a folder carries its subtree along"""
+    token = create_user_and_login(client, app)
+    a_id = create_folder(client, token, 'A')
+    b_id = create_folder(client, token, 'B')
+    child_id = create_folder(client, token, 'Child', a_id)
+    grandchild_id = create_folder(client, token, 'Grandchild', child_id)
+
+    response = client.put(f'/api/folders/{child_id}/move',
+        data=json.dumps({'parent_id': b_id}),
+        content_type='application/json',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['folder']['parent_id'] == b_id
+    data = json.loads(client.get(f'/api/folders/{grandchild_id}/ancestors').data)
+    assert [f['name'] for f in data['ancestors']] == ['B', 'Child']
+    assert Folder.query.get(grandchild_id).path == f'/{b_id}/{child_id}/{grandchild_id}/'
+
+
+def test_move_folder_into_descendant_fails(client, app):
+    """Test that moving a folder under its own subtree is rejected"""
+    token = create_user_and_login(client, app)
+    parent_id = create_folder(client, token, 'Parent')
+    child_id = create_folder(client, token, 'Child', parent_id)
+
+    response = client.put(f'/api/folders/{parent_id}/move',
+        data=json.dumps({'parent_id': child_id}),
+        content_type='application/json',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == 409
+
+
+def test_move_folder_rejects_missing_or_invalid_destination(client, app):
+    """Test that a missing destination is 404 and a parent_id that is not an id is 400"""
+    token = create_user_and_login(client, app)
+    folder_id = create_folder(client, token, 'Folder')
+
+    def move(parent_id):
+        return client.put(f'/api/folders/{folder_id}/move', data=json.dumps({'parent_id': parent_id}),
+            content_type='application/json', headers={'Authorization': f'Bearer {token}'})
+
+    assert move(999).status_code == 404
+    for parent_id in ('1', 1.5, True, [1], {'id': 1}):
+        response = move(parent_id)
+        assert response.status_code == 400
+        assert json.loads(response.data)['error'] == 'parent_id must be a folder id or null'
+    assert move(None).status_code == 200
+
+
+def test_subtree_search(client, app):
+    """Test searching only within a folder's subtree"""
+    token = create_user_and_login(client, app)
+    deal_id = create_folder(client, token, 'Deal')
+    legal_id = create_folder(client, token, 'Legal Docs', deal_id)
+    create_folder(client, token, 'Docs Archive')
+
+    response = client.get(f'/api/folders/{deal_id}/search?q=docs')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [f['id'] for f in data['folders']] == [legal_id]
+
+
+def test_list_folders_cursor_pagination(client, app):
+    """Test walking root listings with cursors yields folders then files exactly once"""
+    token = create_user_and_login(client, app)
+    folder_ids = [create_folder(client, token, f'Folder {i}') for i in range(3)]
+    owner_id = User.query.first().id
+    for i in range(2):
+        db.session.add(File(name=f'File {i}', original_filename=f'f{i}.pdf', storage_path=f'f{i}.pdf',
+                            size_bytes=1, mime_type='application/pdf', owner_id=owner_id))
+    db.session.commit()
+
+    seen_folders, seen_files, cursor, pages = [], [], None, 0
+    while True:
+        response = client.get('/api/folders', query_string={'limit': 2, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        seen_folders += [f['id'] for f in data['folders']]
+        seen_files += [f['name'] for f in data['files']]
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert seen_folders == sorted(folder_ids, reverse=True)
+    assert sorted(seen_files) == ['File 0', 'File 1']
+    assert pages == 3
+
+
+def test_list_folders_invalid_cursor(client, app):
+    """Test that a tampered cursor is rejected"""
+    response = client.get('/api/folders?cursor=not-a-cursor')
+
+    assert response.status_code == 400
+
+
+def count_queries(app, fn):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return result, statements
+
+
+def test_listings_use_constant_queries(client, app):
+    """Listing many folders and files runs one projection query per section"""
+    with app.app_context():
+        owners = [User(email=f'owner{i}@example.com', name=f'Owner {i}') for i in range(5)]
+        for owner in owners:
+            owner.set_password('password123')
+        db.session.add_all(owners)
+        db.session.flush()
+        parent = Folder(name='Parent', owner_id=owners[0].id)
+        db.session.add(parent)
+        db.session.flush()
+        db.session.add_all(Folder(name=f'Folder {i}', owner_id=owners[i % 5].id) for i in range(40))
+        db.session.add_all(Folder(name=f'Child {i}', owner_id=owners[i % 5].id, parent_id=parent.id) for i in range(20))
+        db.session.add_all(
+            File(name=f'File {i}.pdf', original_filename=f'file{i}.pdf', storage_path=f'file{i}.pdf',
+                 size_bytes=1, mime_type='application/pdf', owner_id=owners[i % 5].id,
+                 folder_id=parent.id if i % 2 else None)
+            for i in range(40)
+        )
+        db.session.commit()
+        parent_id = parent.id
+
+    response, statements = count_queries(app, lambda: client.get('/api/folders?limit=1000'))
+    data = json.loads(response.data)
+    assert len(data['folders']) == 41
+    assert len(data['files']) == 20
+    assert {f['owner_name'] for f in data['folders']} == {f'Owner {i}' for i in range(5)}
+    # One data version lookup plus one query per section.
+    assert len(statements) == 3
+
+    response, statements = count_queries(app, lambda: client.get(f'/api/folders/{parent_id}'))
+    data = json.loads(response.data)
+    assert len(data['subfolders']) == 20
+    assert len(data['files']) == 20
+    assert data['files'][0]['owner_name'].startswith('Owner')
+    assert len(statements) == 4
+
+    # Repeats are served from the response cache, or as 304 when the client has the ETag.
+    cached, statements = count_queries(app, lambda: client.get(f'/api/folders/{parent_id}'))
+    assert cached.data == response.data
+    assert len(statements) == 1
+    not_modified, statements = count_queries(app, lambda: client.get(
+        f'/api/folders/{parent_id}', headers={'If-None-Match': response.headers['ETag']}))
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert len(statements) == 1
+
+
+def test_streamed_listing_matches_buffered(client, app):
+    """Streaming and sparse fieldsets return the same document as the buffered listing"""
+    token = create_user_and_login(client, app)
+    for i in range(3):
+        create_folder(client, token, f'Folder {i}')
+    owner_id = User.query.first().id
+    db.session.add(File(name='File', original_filename='f.pdf', storage_path='f.pdf',
+                        size_bytes=1, mime_type='application/pdf', owner_id=owner_id))
+    db.session.commit()
+
+    for cursor in (None, 'walk'):
+        params = {'limit': 2}
+        if cursor:
+            params['cursor'] = json.loads(client.get('/api/folders?limit=2').data)['next_cursor']
+        buffered = json.loads(client.get('/api/folders', query_string=params).data)
+        streamed = client.get('/api/folders', query_string={**params, 'stream': 'true'})
+        assert streamed.is_streamed
+        assert json.loads(streamed.data) == buffered
+
+    data = json.loads(client.get('/api/folders?fields=id,name,created_at').data)
+    assert set(data['folders'][0]) == {'id', 'name', 'created_at'}
+    assert data['folders'][0]['created_at'].endswith('Z')
+
+    streamed = json.loads(client.get('/api/folders?fields=id&stream=true&limit=100').data)
+    assert [f for f in streamed['folders']] == [{'id': f['id']} for f in data['folders']]
+    assert streamed['files'] == [{'id': data['files'][0]['id']}]
+    assert streamed['next_cursor'] is None
+
+
+def test_folder_names_are_unique_after_normalization(client, app, monkeypatch):
+    """Test that names differing only in case, spacing or Unicode form conflict, backed by the unique index"""
+    from app.services import folder_service
+
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    create_folder(client, token, 'Café Reports')
+
+    for name in ('caf\u00e9 reports', 'Cafe\u0301 Reports', '  CAF\u00c9 REPORTS '):
+        response = client.post('/api/folders', data=json.dumps({'name': name}),
+            content_type='application/json', headers=headers)
+        assert response.status_code == 409
+
+    other_id = create_folder(client, token, 'Other')
+    response = client.put(f'/api/folders/{other_id}', data=json.dumps({'name': 'CAFÉ reports'}),
+        content_type='application/json', headers=headers)
+    assert response.status_code == 409
+
+    plan = ' '.join(str(row) for row in db.session.execute(db.text(
+        "EXPLAIN QUERY PLAN SELECT id FROM folders WHERE name_key = 'other' AND deleted_at IS NULL"
+    )))
+    assert 'uq_folders_name_key' in plan
+
+    # A racing insert that slipped past the pre-check still fails on the index.
+    user_id = User.query.filter_by(email='test@example.com').first().id
+    db.session.add(Folder(name='Late', owner_id=user_id))
+    db.session.commit()
+    monkeypatch.setattr(folder_service, '_name_taken', lambda name, exclude_id=None: False)
+    with pytest.raises(ValueError, match='already exists'):
+        folder_service.create_folder('LATE', user_id)
+
+
+def test_writes_invalidate_cached_responses(client, app):
+    """Test that folder writes bump the data versions that cached listings and details are keyed on"""
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    parent_id = create_folder(client, token, 'Parent')
+    child_id = create_folder(client, token, 'Child', parent_id)
+
+    listing = client.get('/api/folders')
+    detail = client.get(f'/api/folders/{parent_id}')
+    child = client.get(f'/api/folders/{child_id}')
+    search = client.get('/api/search?q=Child')
+
+    client.put(f'/api/folders/{child_id}', data=json.dumps({'name': 'Renamed'}),
+        content_type='application/json', headers=headers)
+
+    for before, url in ((listing, '/api/folders'), (detail, f'/api/folders/{parent_id}'),
+                        (child, f'/api/folders/{child_id}'), (search, '/api/search?q=Child')):
+        response = client.get(url, headers={'If-None-Match': before.headers['ETag']})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != before.headers['ETag']
+    assert json.loads(client.get(f'/api/folders/{parent_id}').data)['subfolders'][0]['name'] == 'Renamed'
+
+    client.delete(f'/api/folders/{parent_id}', headers=headers)
+    assert client.get(f'/api/folders/{child_id}').status_code == 404
+
+
+def test_writes_bump_only_the_scopes_they_touch(client, app):
+    """Test that listings and search stay cached across writes they do not show"""
+    from app.services import version_service
+
+    token = create_user_and_login(client, app)
+    folder_id = create_folder(client, token, 'Parent')
+    listing = client.get('/api/folders')
+    search = client.get('/api/search?q=Parent')
+    content = client.get('/api/search?q=Parent&scope=content')
+
+    version_service.bump(folders=[folder_id], content=True)
+    db.session.commit()
+
+    assert client.get('/api/folders', headers={'If-None-Match': listing.headers['ETag']}).status_code == 304
+    assert client.get('/api/search?q=Parent', headers={'If-None-Match': search.headers['ETag']}).status_code == 304
+    response = client.get('/api/search?q=Parent&scope=content', headers={'If-None-Match': content.headers['ETag']})
+    assert response.status_code == 200
+
+
+def test_response_cache_evicts_least_recently_used():
+    """Test that the response cache stays within its byte budget, evicting the oldest entries first"""
+    from app.utils.response_cache import ResponseCache
+
+    cache = ResponseCache(max_bytes=400)
+    for key in 'abcd':
+        cache.put(key, b'x' * 100, 'application/json')
+    cache.get('a')
+    cache.put('e', b'x' * 100, 'application/json')
+    cache.put('huge', b'x' * 200, 'application/json')
+
+    assert cache.size() == 400
+    assert cache.get('b') is None
+    assert cache.get('huge') is None
+    assert all(cache.get(key) for key in 'acde')
+
+
+def test_reads_use_replica_until_client_has_written(tmp_path):
+    """Test that read-only requests go to the replica while a client that just wrote stays on the primary"""
+    class ReplicaConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        SQLALCHEMY_REPLICA_URIS = [f"sqlite:///{tmp_path / 'replica.db'}"]
+        # Cached bodies are shared by primary and replica readers; keep them out of the picture.
+        RESPONSE_CACHE_MB = 0
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.metadata.create_all(db.engines['replica_0'])
+    writer, reader = app.test_client(), app.test_client()
+    token = create_user_and_login(writer, app)
+
+    # Requests run outside a shared app context so each gets its own session, as in production.
+    response = writer.post('/api/folders', json={'name': 'Board Pack'}, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 201
+    folder_id = json.loads(response.data)['folder']['id']
+
+    assert writer.get(f'/api/folders/{folder_id}').status_code == 200
+    assert reader.get(f'/api/folders/{folder_id}').status_code == 404
+
+    with app.app_context():
+        with db.engines['replica_0'].connect() as connection:
+            assert connection.execute(db.select(db.func.count()).select_from(Folder.__table__)).scalar() == 0
+        # Stand-in for replication: copy the primary into the replica.
+        primary, replica = db.engines[None].raw_connection(), db.engines['replica_0'].raw_connection()
+        primary.driver_connection.backup(replica.driver_connection)
+        primary.close()
+        replica.close()
+
+    assert reader.get(f'/api/folders/{folder_id}').status_code == 200
+
+    writer.set_cookie('db_primary_until', '0')
+    assert writer.get('/api/folders/999').status_code == 404
+
+    # The frontend calls the API cross-origin with credentials, so the cookie must be allowed through.
+    origin = app.config['FRONTEND_URL']
+    response = writer.options('/api/folders', headers={
+        'Origin': origin, 'Access-Control-Request-Method': 'POST',
+        'Access-Control-Request-Headers': 'Authorization, Content-Type',
+    })
+    assert response.headers['Access-Control-Allow-Origin'] == origin
+    assert response.headers['Access-Control-Allow-Credentials'] == 'true'
+    response = writer.post('/api/folders', json={'name': 'Minutes'},
+        headers={'Authorization': f'Bearer {token}', 'Origin': origin})
+    assert response.headers['Access-Control-Allow-Origin'] == origin
+    assert response.headers['Access-Control-Allow-Credentials'] == 'true'
+    assert 'db_primary_until' in response.headers['Set-Cookie']
+    assert writer.get_cookie('db_primary_until') is not None
+
+    app.extensions['replica_router'].cookie_samesite = 'None'
+    response = writer.post('/api/folders', json={'name': 'Resolutions'}, headers={'Authorization': f'Bearer {token}'})
+    assert 'SameSite=None' in response.headers['Set-Cookie']
+    assert 'Secure' in response.headers['Set-Cookie']
+
+    with app.app_context():
+        app.extensions['activity_recorder'].flush()
+        for engine in db.engines.values():
+            engine.dispose()
@@ -0,0 +1,216 @@
+import json
+from app.models.user import User
+from app.models.folder import Folder
+from app.models.file import File
+from app import db
+
+
+def create_user(app, email='test@example.com', name='Test User'):
+    with app.app_context():
+        user = User(email=email, name=name)
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def add_folder(name, owner_id, parent_id=None):
+    folder = Folder(name=name, owner_id=owner_id, parent_id=parent_id)
+    db.session.add(folder)
+    db.session.commit()
+    return folder
+
+
+def add_file(name, owner_id, original_filename=None, folder_id=None):
+    file_obj = File(
+        name=name,
+        original_filename=original_filename or f'{name}.pdf',
+        storage_path=f'{name}.pdf',
+        size_bytes=1,
+        mime_type='application/pdf',
+        folder_id=folder_id,
+        owner_id=owner_id
+    )
+    db.session.add(file_obj)
+    db.session.commit()
+    return file_obj
+
+
+def test_search_matches_substrings(client, app):
+    """Test that search finds folders and files by substring of their names"""
+    owner_id = create_user(app)
+    add_folder('Quarterly Reports', owner_id)
+    add_folder('Contracts', owner_id)
+    add_file('annual-report-2024', owner_id)
+    add_file('board minutes', owner_id, original_filename='REPORTING.pdf')
+
+    response = client.get('/api/search?q=report')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [f['name'] for f in data['folders']] == ['Quarterly Reports']
+    assert {f['name'] for f in data['files']} == {'annual-report-2024', 'board minutes'}
+
+
+def test_search_ranks_exact_and_prefix_matches_first(client, app):
+    """Test that exact and prefix matches rank ahead of inner substring matches"""
+    owner_id = create_user(app)
+    add_folder('Old Deals', owner_id)
+    add_folder('Deals 2023', owner_id)
+    add_folder('Deals', owner_id)
+
+    response = client.get('/api/search?q=deals')
+
+    data = json.loads(response.data)
+    assert [f['name'] for f in data['folders']] == ['Deals', 'Deals 2023', 'Old Deals']
+
+
+def test_search_index_follows_renames_and_deletes(client, app):
+    """Test that the search index is updated when items are renamed or deleted"""
+    owner_id = create_user(app)
+    folder = add_folder('Drafts', owner_id)
+    file_obj = add_file('Term Sheet', owner_id)
+
+    folder.name = 'Signed'
+    db.session.delete(file_obj)
+    db.session.commit()
+
+    data = json.loads(client.get('/api/search?q=draft').data)
+    assert data['folders'] == []
+
+    data = json.loads(client.get('/api/search?q=signed').data)
+    assert [f['name'] for f in data['folders']] == ['Signed']
+
+    data = json.loads(client.get('/api/search?q=term').data)
+    assert data['files'] == []
+
+
+def test_search_short_query_and_wildcards(client, app):
+    """Test two-character queries and that LIKE wildcards are matched literally"""
+    owner_id = create_user(app)
+    add_folder('Q1', owner_id)
+    add_folder('100% done', owner_id)
+    add_folder('1000 done', owner_id)
+
+    data = json.loads(client.get('/api/search?q=q1').data)
+    assert [f['name'] for f in data['folders']] == ['Q1']
+
+    data = json.loads(client.get('/api/search', query_string={'q': '0%'}).data)
+    assert [f['name'] for f in data['folders']] == ['100% done']
+
+
+def test_search_cursor_pagination(client, app):
+    """Test paging through relevance-ranked results with cursors"""
+    owner_id = create_user(app)
+    for i in range(3):
+        add_folder(f'Budget {i}', owner_id)
+        add_file(f'budget-file-{i}', owner_id)
+
+    names, cursor = [], None
+    while True:
+        params = {'q': 'budget', 'limit': 4}
+        if cursor:
+            params['cursor'] = cursor
+        data = json.loads(client.get('/api/search', query_string=params).data)
+        names += [f['name'] for f in data['folders']] + [f['name'] for f in data['files']]
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert names == ['Budget 0', 'Budget 1', 'Budget 2', 'budget-file-0', 'budget-file-1', 'budget-file-2']
+
+
+def test_search_cursor_is_stable_across_inserts(client, app):
+    """Test that rows added between two page requests do not make the next page skip or repeat results"""
+    owner_id = create_user(app)
+    originals = ['Old budget', 'Notes on the budget for the annual general meeting', 'Annual budget', 'Capital budget review']
+    for name in originals:
+        add_folder(name, owner_id)
+
+    data = json.loads(client.get('/api/search', query_string={'q': 'budget', 'limit': 2}).data)
+    names = [f['name'] for f in data['folders']]
+    # Unrelated folders change the index statistics that bm25 scores depend on.
+    for i in range(40):
+        add_folder(f'Correspondence {i}', owner_id)
+
+    cursor = data['next_cursor']
+    while cursor:
+        data = json.loads(client.get('/api/search', query_string={'q': 'budget', 'limit': 2, 'cursor': cursor}).data)
+        names += [f['name'] for f in data['folders']]
+        cursor = data['next_cursor']
+
+    assert sorted(names) == sorted(originals)
+
+
+def test_suggest_prefixes_follow_changes_across_processes(client, app):
+    """Test that suggestions match name and word prefixes and stay in step with renames and deletes"""
+    from datetime import datetime
+    from app.utils.suggest import SuggestIndex
+
+    owner_id = create_user(app)
+    reports = add_folder('Q3 Reports', owner_id)
+    add_folder('Reviews', owner_id)
+    add_file('Report Card', owner_id)
+
+    def suggest(q):
+        data = json.loads(client.get(f'/api/search/suggest?q={q}').data)
+        return [(s['type'], s['name']) for s in data['suggestions']]
+
+    assert suggest('rep') == [('file', 'Report Card'), ('folder', 'Q3 Reports')]
+    assert suggest('RE') == [('file', 'Report Card'), ('folder', 'Q3 Reports'), ('folder', 'Reviews')]
+    assert client.get('/api/search/suggest').status_code == 400
+
+    # A second process built now replays the same journal.
+    other = SuggestIndex(interval=0)
+    other.suggest('x')
+
+    reports.name = 'Q3 Summary'
+    db.session.commit()
+    File.query.filter_by(name='Report Card').update({'deleted_at': datetime.utcnow()})
+    db.session.commit()
+    add_file('Repository Notes', owner_id)
+
+    assert suggest('rep') == [('file', 'Repository Notes')]
+    assert suggest('sum') == [('folder', 'Q3 Summary')]
+    assert [(s['type'], s['name']) for s in other.suggest('rep')] == [('file', 'Repository Notes')]
+    assert [s['name'] for s in other.suggest('q3')] == ['Q3 Summary']
+
+
+def test_suggest_answers_while_another_thread_refreshes(client, app, monkeypatch):
+    """Test that suggestions are served from the current index while another thread waits on the database"""
+    import threading
+    from app.services import suggest_service
+    from app.utils.suggest import SuggestIndex
+
+    owner_id = create_user(app)
+    add_folder('Q3 Reports', owner_id)
+    index = SuggestIndex(interval=0)
+    index.suggest('x')
+
+    started, release = threading.Event(), threading.Event()
+    changes_since = suggest_service.changes_since
+
+    def slow_changes_since(*args):
+        started.set()
+        release.wait(10)
+        return changes_since(*args)
+
+    monkeypatch.setattr(suggest_service, 'changes_since', slow_changes_since)
+
+    def refresh():
+        with app.app_context():
+            index.suggest('q3')
+
+    refresher = threading.Thread(target=refresh)
+    refresher.start()
+    try:
+        assert started.wait(5)
+        results = []
+        reader = threading.Thread(target=lambda: results.extend(index.suggest('rep')))
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+        assert [s['name'] for s in results] == ['Q3 Reports']
+    finally:
+        release.set()
+        refresher.join()
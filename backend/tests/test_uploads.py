@@ -0,0 +1,137 @@
+import json
+from app.models.user import User
+from app import db
+
+
+def create_user_and_login(client, app, email='test@example.com', name='Test User', password='password123'):
+    """Helper function to create a user and get auth token"""
+    with app.app_context():
+        user = User(email=email, name=name)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+
+    response = client.post('/api/auth/login',
+        data=json.dumps({'email': email, 'password': password}),
+        content_type='application/json'
+    )
+    return json.loads(response.data)['token']
+
+
+def create_upload(client, token, size, name='Big Deck'):
+    response = client.post('/api/uploads',
+        data=json.dumps({'name': name, 'filename': 'deck.pdf', 'size': size}),
+        content_type='application/json',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    return response
+
+
+def put_chunk(client, token, upload_id, offset, data):
+    return client.put(f'/api/uploads/{upload_id}?offset={offset}',
+        data=data,
+        content_type='application/octet-stream',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+
+def test_chunked_upload_out_of_order(client, app, make_pdf):
+    """Test uploading chunks in any order, checking progress, then committing"""
+    token = create_user_and_login(client, app)
+    content = make_pdf(['Management presentation'])
+    middle = len(content) // 2
+
+    response = create_upload(client, token, len(content))
+    assert response.status_code == 201
+    upload_id = json.loads(response.data)['upload']['id']
+
+    response = put_chunk(client, token, upload_id, middle, content[middle:])
+    assert response.status_code == 200
+    assert json.loads(response.data)['upload']['received'] == [[middle, len(content)]]
+
+    response = client.post(f'/api/uploads/{upload_id}/commit',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 400
+
+    put_chunk(client, token, upload_id, 0, content[:middle])
+    response = client.get(f'/api/uploads/{upload_id}',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert json.loads(response.data)['upload']['received'] == [[0, len(content)]]
+
+    response = client.post(f'/api/uploads/{upload_id}/commit',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 201
+    file_data = json.loads(response.data)['file']
+    assert file_data['name'] == 'Big Deck'
+    assert file_data['size_bytes'] == len(content)
+
+    response = client.get(f"/api/files/{file_data['id']}/download")
+    assert response.data == content
+
+
+def test_chunk_outside_declared_size(client, app):
+    """Test that chunks past the declared size are rejected"""
+    token = create_user_and_login(client, app)
+    upload_id = json.loads(create_upload(client, token, 10).data)['upload']['id']
+
+    response = put_chunk(client, token, upload_id, 8, b'12345')
+
+    assert response.status_code == 400
+
+
+def test_upload_session_is_private(client, app):
+    """Test that only the session owner can write to an upload session"""
+    token1 = create_user_and_login(client, app, email='user1@example.com')
+    token2 = create_user_and_login(client, app, email='user2@example.com', name='User 2')
+    upload_id = json.loads(create_upload(client, token1, 10).data)['upload']['id']
+
+    response = put_chunk(client, token2, upload_id, 0, b'0123456789')
+
+    assert response.status_code == 403
+
+
+def test_failed_commit_keeps_the_session_for_a_retry(client, app, make_pdf, monkeypatch):
+    """Test that a name conflict at commit keeps the staged upload, and a commit failing after it was consumed ends the session"""
+    from app.models.file import File
+    from app.services import file_service
+    token = create_user_and_login(client, app)
+    headers = {'Authorization': f'Bearer {token}'}
+    content = make_pdf(['Management presentation'])
+    upload_id = json.loads(create_upload(client, token, len(content)).data)['upload']['id']
+    put_chunk(client, token, upload_id, 0, content)
+
+    # Another upload takes the name after the pre-commit checks have passed.
+    check_upload_target = file_service.check_upload_target
+    monkeypatch.setattr(file_service, 'check_upload_target', lambda name, owner_id, folder_id=None: None)
+    other = File(name='Big Deck', original_filename='other.pdf', storage_path='other.pdf',
+                 size_bytes=1, mime_type='application/pdf', owner_id=User.query.first().id)
+    db.session.add(other)
+    db.session.commit()
+
+    response = client.post(f'/api/uploads/{upload_id}/commit', headers=headers)
+    assert response.status_code == 400
+
+    db.session.delete(other)
+    db.session.commit()
+    monkeypatch.setattr(file_service, 'check_upload_target', check_upload_target)
+    response = client.post(f'/api/uploads/{upload_id}/commit', headers=headers)
+    assert response.status_code == 201
+    assert json.loads(response.data)['file']['name'] == 'Big Deck'
+    assert client.post(f'/api/uploads/{upload_id}/commit', headers=headers).status_code == 404
+
+    content = make_pdf(['Lender presentation'])
+    upload_id = json.loads(create_upload(client, token, len(content), name='Lender Deck').data)['upload']['id']
+    put_chunk(client, token, upload_id, 0, content)
+    commit_blob = file_service.commit_blob
+
+    def commit_then_fail(temp_path, sha256):
+        commit_blob(temp_path, sha256)
+        raise ValueError('Storage is unavailable')
+
+    monkeypatch.setattr(file_service, 'commit_blob', commit_then_fail)
+    response = client.post(f'/api/uploads/{upload_id}/commit', headers=headers)
+    assert response.status_code == 400
+    assert client.post(f'/api/uploads/{upload_id}/commit', headers=headers).status_code == 404
@@ -0,0 +1,19 @@
+"""Production entry point, loaded once by the gunicorn master: gunicorn -c gunicorn.conf.py"""
+import time
+
+_started = time.perf_counter()
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app
+
+_imported = time.perf_counter()
+app = create_app()
+_created = time.perf_counter()
+
+app.config['STARTUP_SECONDS'] = {
+    'imports': round(_imported - _started, 3),
+    'create_app': round(_created - _imported, 3),
+    'total': round(_created - _started, 3),
+}
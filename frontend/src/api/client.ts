@@ -4,6 +4,9 @@ const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:5001/api'
 
 const client = axios.create({
   baseURL: API_URL,
+  // Sends the API's cookies cross-origin, such as the one that keeps reads on
+  // the primary database right after a write.
+  withCredentials: true,
   headers: {
     'Content-Type': 'application/json',
   },
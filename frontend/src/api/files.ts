@@ -3,12 +3,13 @@ import type { File } from '@/types'
 
 export const filesApi = {
   upload: async (file: globalThis.File, name: string, folder_id?: number): Promise<File> => {
+    // Fields go before the file so the server can reject the upload before the body is sent.
     const formData = new FormData()
-    formData.append('file', file)
     formData.append('name', name)
     if (folder_id) {
       formData.append('folder_id', folder_id.toString())
     }
+    formData.append('file', file)
 
     const response = await client.post('/files', formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
@@ -46,5 +46,5 @@ export interface SearchResults {
   folders: Folder[]
   files: File[]
   limit: number
-  offset: number
+  next_cursor: string | null
 }